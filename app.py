@@ -1,9 +1,20 @@
+import asyncio
 import os
+import typing as tp
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
+from modules.archive import ARCHIVE_INTERVAL_HOURS, schedule_archival
+from modules.health import close_connections, warmup, warmup_until_ready
+from modules.ingestion import StageIngestionBuffer
+from modules.ipfs import IpfsClient
+from modules.jobs import JobScheduler
+from modules.metrics import metrics_middleware, monitor_event_loop_lag
+from modules.profiler import profiling_middleware
+from modules.spool import WRITE_SPOOL_PATH, replay_spool
+from modules.tokens import is_asymmetric
 from modules.routers import (
     employees_router,
     passports_router,
@@ -12,6 +23,8 @@ from modules.routers import (
     service_router,
     schemas_router,
     stages_router,
+    validation_router,
+    jobs_router,
 )
 
 api = FastAPI()
@@ -23,6 +36,10 @@ api.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS", "PATCH", "DELETE", "PUT"],
     allow_headers=["*"],
 )
+api.middleware("http")(profiling_middleware)
+api.middleware("http")(metrics_middleware)
+
+background_tasks: tp.List["asyncio.Task[None]"] = []
 
 
 @api.on_event("startup")
@@ -32,7 +49,12 @@ def check_environment_variables() -> None:
     if os.environ.get("MONGO_CONNECTION_URL", None) is None:
         failed = True
         logger.error("variable $MONGO_CONNECTION_URL is not set")
-    if os.environ.get("SECRET_KEY", None) is None:
+    if is_asymmetric():
+        for variable in ("JWT_PRIVATE_KEY_PATH", "JWT_PUBLIC_KEY_PATH"):
+            if os.environ.get(variable, None) is None:
+                failed = True
+                logger.error(f"variable ${variable} is not set")
+    elif os.environ.get("SECRET_KEY", None) is None:
         failed = True
         logger.error("variable $SECRET_KEY is not set")
     if failed:
@@ -43,8 +65,41 @@ def check_environment_variables() -> None:
         logger.info("All checks passed, running analytics server")
 
 
+@api.on_event("startup")
+async def warmup_worker() -> None:
+    """connect to database and cache and fill caches before accepting requests (see /api/v1/status/ready)"""
+    try:
+        await warmup()
+    except Exception as exception_message:
+        logger.warning(f"Failed to warm up, will retry in background: {exception_message}")
+        background_tasks.append(asyncio.ensure_future(warmup_until_ready()))
+
+
+@api.on_event("startup")
+async def start_event_loop_monitor() -> None:
+    background_tasks.append(asyncio.ensure_future(monitor_event_loop_lag()))
+
+
+@api.on_event("startup")
+async def start_archival_scheduler() -> None:
+    if ARCHIVE_INTERVAL_HOURS:
+        background_tasks.append(asyncio.ensure_future(schedule_archival()))
+
+
+@api.on_event("startup")
+async def start_spool_replay() -> None:
+    if WRITE_SPOOL_PATH:
+        background_tasks.append(asyncio.ensure_future(replay_spool()))
+
+
 @api.on_event("shutdown")
-def shutdown_event() -> None:
+async def shutdown_event() -> None:
+    for task in background_tasks:
+        task.cancel()
+    await StageIngestionBuffer().close()
+    await JobScheduler().shutdown()
+    await IpfsClient().close()
+    close_connections()
     logger.success("Shutting down feecc analytics backend server...")
 
 
@@ -54,4 +109,6 @@ api.include_router(employees_router, prefix="/api/v1/employees", tags=["Employee
 api.include_router(schemas_router, prefix="/api/v1/schemas", tags=["Production Schemas Management"])
 api.include_router(stages_router, prefix="/api/v1/stages", tags=["Production Stages Management"])
 api.include_router(users_router, prefix="/api/v1/users", tags=["Analytics Users Management"])
+api.include_router(validation_router, prefix="/api/v1/validate", tags=["IPFS Passports Validation"])
+api.include_router(jobs_router, prefix="/api/v1/jobs", tags=["Background Jobs"])
 api.include_router(service_router, tags=["Service Endpoints"])
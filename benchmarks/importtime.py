@@ -0,0 +1,92 @@
+"""
+Import time report for analytics backend.
+
+Usage:
+    python -m benchmarks.importtime --top 20 --output importtime.json
+
+Imports `app` in a fresh interpreter with `-X importtime` and prints JSON report:
+total import time, time of every module in `modules/` (self and cumulative, i.e. with imports it triggered)
+and self time of third-party packages summed per top-level package.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import typing as tp
+from collections import defaultdict
+
+# import time:       self [us] |  cumulative | imported package
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)\s*$")
+PROJECT_PACKAGES = ("app", "modules")
+
+
+class ImportRecord(tp.NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure(target: str = "app") -> tp.List[ImportRecord]:
+    """import `target` in a fresh interpreter, returns every import it made"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    records = []
+    for line in process.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append(ImportRecord(module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+
+def build_report(records: tp.List[ImportRecord], top: int) -> tp.Dict[str, tp.Any]:
+    project: tp.List[tp.Dict[str, tp.Any]] = []
+    packages: tp.DefaultDict[str, int] = defaultdict(int)
+    for record in records:
+        package = record.module.split(".")[0]
+        if package in PROJECT_PACKAGES:
+            project.append(
+                {
+                    "module": record.module,
+                    "self_ms": round(record.self_us / 1000, 2),
+                    "cumulative_ms": round(record.cumulative_us / 1000, 2),
+                }
+            )
+        else:
+            packages[package] += record.self_us
+
+    project.sort(key=lambda item: float(item["cumulative_ms"]), reverse=True)
+    third_party = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_ms": round(sum(record.cumulative_us for record in records if record.depth == 0) / 1000, 2),
+        "modules": project[:top],
+        "packages": [{"package": package, "self_ms": round(self_us / 1000, 2)} for package, self_us in third_party],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="app", help="module to import")
+    parser.add_argument("--top", type=int, default=25, help="number of slowest modules/packages to show")
+    parser.add_argument("--output", help="also save report to this file")
+    args = parser.parse_args()
+
+    report = build_report(measure(args.target), args.top)
+    rendered = json.dumps(report, indent=2)
+    print(rendered)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(rendered)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Load benchmark for analytics backend against a local MongoDB/Redis stand-in.
+
+Usage:
+    python -m benchmarks.run --units 10000 --concurrency 16 --requests 500 --output bench.json
+    python -m benchmarks.run --mongo-url mongodb://localhost:27017 --redis-host localhost --units 1000000
+
+By default in-memory mongomock-motor and fakeredis are used, so no external services are required.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import secrets
+import sys
+import time
+import typing as tp
+
+os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+os.environ.setdefault("MONGO_CONNECTION_URL", "mongodb://benchmark")
+os.environ.setdefault("MONGO_DATABASE_NAME", "analytics-benchmark")
+
+import httpx  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from modules.cacher import RedisCacher  # noqa: E402
+from modules.database import MongoDbWrapper  # noqa: E402
+
+from .seed import PlantSize, SeededPlant, create_indexes, seed_plant  # noqa: E402
+
+BENCHMARK_USER = {"username": "benchmark", "password": "benchmark-password"}
+
+Scenario = tp.Callable[[SeededPlant, random.Random], str]
+
+SCENARIOS: tp.Dict[str, Scenario] = {
+    "passports_first_page": lambda plant, rng: "/api/v1/passports/?page=1&items=20",
+    "passports_deep_page": lambda plant, rng: f"/api/v1/passports/?page={len(plant.internal_ids) // 40 + 1}&items=20",
+    "passports_by_status": lambda plant, rng: "/api/v1/passports/?status=production&page=1&items=20",
+    "passport_details": lambda plant, rng: f"/api/v1/passports/{rng.choice(plant.internal_ids)}",
+    "employees_list": lambda plant, rng: "/api/v1/employees/?page=1&items=20",
+    "schemas_list": lambda plant, rng: "/api/v1/schemas/?page=1&items=20",
+    "schema_details": lambda plant, rng: f"/api/v1/schemas/{rng.choice(plant.schema_ids)}",
+    "stages_list": lambda plant, rng: "/api/v1/stages/?page=1&items=20",
+    "protocols_list": lambda plant, rng: "/api/v1/tcd/protocols",
+    "protocol_details": lambda plant, rng: f"/api/v1/tcd/protocols/{rng.choice(plant.protocol_unit_ids)}",
+}
+
+
+def percentile(sorted_values: tp.List[float], rank: float) -> float:
+    """nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(max(math.ceil(rank / 100 * len(sorted_values)) - 1, 0), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _setup_backends(mongo_url: tp.Optional[str], redis_host: tp.Optional[str]) -> None:
+    """create MongoDbWrapper and RedisCacher singletons bound to local stand-ins"""
+    if redis_host:
+        import redis
+
+        RedisCacher(client=redis.Redis(host=redis_host, socket_connect_timeout=3))
+    else:
+        import fakeredis
+
+        RedisCacher(client=fakeredis.FakeRedis())
+
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        MongoDbWrapper(client=AsyncIOMotorClient(mongo_url))
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+
+        MongoDbWrapper(client=AsyncMongoMockClient())
+
+
+async def _login(client: httpx.AsyncClient) -> str:
+    from modules.dependencies.security import get_password_hash
+    from modules.routers.users.models import UserWithPassword
+
+    await MongoDbWrapper().add_user(
+        UserWithPassword(
+            username=BENCHMARK_USER["username"],
+            rule_set=["read", "write", "approve"],
+            hashed_password=get_password_hash(BENCHMARK_USER["password"]),
+        )
+    )
+    response = await client.post("/token", data=BENCHMARK_USER)
+    response.raise_for_status()
+    return str(response.json()["access_token"])
+
+
+async def _run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    plant: SeededPlant,
+    headers: tp.Dict[str, str],
+    requests: int,
+    concurrency: int,
+    random_seed: int,
+) -> tp.Dict[str, tp.Any]:
+    """run scenario `requests` times with fixed concurrency and collect latency stats"""
+    rng = random.Random(random_seed)
+    paths = [scenario(plant, rng) for _ in range(requests)]
+    latencies: tp.List[float] = []
+    errors = 0
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    async def worker() -> None:
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> tp.Dict[str, tp.Any]:
+    _setup_backends(args.mongo_url, args.redis_host)
+
+    size = PlantSize(
+        schemas=args.schemas,
+        stages_per_schema=args.stages_per_unit,
+        employees=args.employees,
+        units=args.units,
+        protocols_ratio=args.protocols_ratio,
+    )
+    logger.info(f"Seeding synthetic plant: {size.dict()}")
+    seed_started = time.perf_counter()
+    plant = await seed_plant(size, random_seed=args.seed)
+    if args.create_indexes:
+        await create_indexes()
+    seed_elapsed = time.perf_counter() - seed_started
+
+    from app import api
+
+    selected = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    results: tp.Dict[str, tp.Any] = {}
+    async with httpx.AsyncClient(app=api, base_url="http://benchmark", timeout=None) as client:
+        headers = {"Authorization": f"Bearer {await _login(client)}"}
+        for name in selected:
+            logger.info(f"Running scenario {name}")
+            results[name] = await _run_scenario(
+                client, SCENARIOS[name], plant, headers, args.requests, args.concurrency, args.seed
+            )
+
+    return {
+        "backend": {
+            "mongo": args.mongo_url or "mongomock-motor",
+            "redis": args.redis_host or "fakeredis",
+        },
+        "plant": size.dict(),
+        "seed_seconds": round(seed_elapsed, 3),
+        "concurrency": args.concurrency,
+        "scenarios": results,
+    }
+
+
+def parse_args(argv: tp.Optional[tp.List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analytics backend load benchmark")
+    parser.add_argument("--mongo-url", default=None, help="local mongod url (mongomock-motor is used if omitted)")
+    parser.add_argument("--redis-host", default=None, help="redis host (fakeredis is used if omitted)")
+    parser.add_argument("--schemas", type=int, default=50)
+    parser.add_argument("--stages-per-unit", type=int, default=10)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--units", type=int, default=10_000)
+    parser.add_argument("--protocols-ratio", type=float, default=0.3)
+    parser.add_argument("--create-indexes", action="store_true", help="create indexes on lookup keys after seeding")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--scenarios", default=None, help=f"comma separated subset of: {','.join(SCENARIOS)}")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write JSON report to file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: tp.Optional[tp.List[str]] = None) -> None:
+    args = parse_args(argv)
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+    report = asyncio.run(run_benchmark(args))
+    serialized = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(serialized)
+    else:
+        print(serialized)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import hashlib
+import random
+import typing as tp
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from loguru import logger
+from pydantic import BaseModel
+
+from modules.cacher import RedisCacher
+from modules.database import MongoDbWrapper
+from modules.routers.employees.models import Employee
+from modules.routers.passports.models import UnitStatus
+from modules.routers.tcd.models import ProtocolStatus
+
+SCHEMA_TYPES = ["Assembly", "Component", "Kit", "Testing"]
+TIME_FORMAT = "%d-%m-%Y %H:%M:%S"
+BATCH_SIZE = 10_000
+
+
+class PlantSize(BaseModel):
+    """Synthetic plant dimensions"""
+
+    schemas: int = 50
+    stages_per_schema: int = 10
+    employees: int = 200
+    units: int = 10_000
+    protocols_ratio: float = 0.3
+    components_ratio: float = 0.2
+
+
+class SeededPlant(BaseModel):
+    """Identifiers of seeded documents, used to build benchmark requests"""
+
+    schema_ids: tp.List[str]
+    internal_ids: tp.List[str]
+    protocol_unit_ids: tp.List[str]
+    rfid_card_ids: tp.List[str]
+
+
+def _hex(rng: random.Random) -> str:
+    return UUID(int=rng.getrandbits(128)).hex
+
+
+async def _insert_batched(collection: tp.Any, documents: tp.Iterable[tp.Dict[str, tp.Any]]) -> int:
+    """insert documents with insert_many in batches of BATCH_SIZE"""
+    batch: tp.List[tp.Dict[str, tp.Any]] = []
+    inserted = 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= BATCH_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+async def seed_plant(size: PlantSize, random_seed: int = 42) -> SeededPlant:
+    """Fill MongoDbWrapper collections with synthetic schemas, employees, units, stages and protocols"""
+    rng = random.Random(random_seed)
+    db = MongoDbWrapper()
+    start_date = datetime(2021, 1, 1)
+
+    schemas: tp.List[tp.Dict[str, tp.Any]] = []
+    for number in range(size.schemas):
+        schemas.append(
+            {
+                "schema_id": _hex(rng),
+                "unit_name": f"Synthetic unit {number}",
+                "production_stages": [
+                    {
+                        "name": f"Stage {stage}",
+                        "type": "assembly",
+                        "description": None,
+                        "equipment": None,
+                        "workplace": f"Workbench {stage % 5}",
+                        "duration_seconds": rng.randint(60, 3600),
+                        "stage_id": _hex(rng),
+                    }
+                    for stage in range(size.stages_per_schema)
+                ],
+                "required_components_schema_ids": None,
+                "parent_schema_id": None,
+                "schema_type": rng.choice(SCHEMA_TYPES),
+            }
+        )
+    for schema in schemas[1:]:
+        if rng.random() < size.components_ratio:
+            schema["parent_schema_id"] = schemas[0]["schema_id"]
+    await _insert_batched(db._schemas_collection, (dict(schema) for schema in schemas))
+
+    employees = [
+        Employee(rfid_card_id=str(1_000_000_000 + number), name=f"Employee {number}", position="Engineer")
+        for number in range(size.employees)
+    ]
+    await _insert_batched(db._employee_collection, (employee.dict() for employee in employees))
+    employee_hashes = [await employee.encode_sha256() for employee in employees]
+    await RedisCacher().cache_employees(employees)
+
+    await _insert_batched(
+        db._protocols_collection,
+        (
+            {
+                "protocol_name": f"Protocol for {schema['unit_name']}",
+                "protocol_schema_id": _hex(rng),
+                "associated_with_schema_id": schema["schema_id"],
+                "default_serial_number": None,
+                "rows": [
+                    {"name": f"Check {row}", "value": "ok", "test1": None, "test2": None, "checked": False}
+                    for row in range(20)
+                ],
+            }
+            for schema in schemas
+        ),
+    )
+
+    internal_ids: tp.List[str] = []
+    protocol_unit_ids: tp.List[str] = []
+    units: tp.List[tp.Dict[str, tp.Any]] = []
+    stages: tp.List[tp.Dict[str, tp.Any]] = []
+    protocols: tp.List[tp.Dict[str, tp.Any]] = []
+
+    async def flush() -> None:
+        await _insert_batched(db._unit_collection, units)
+        await _insert_batched(db._prod_stage_collection, await db._stage_codec.encode_many(stages))
+        await _insert_batched(db._protocols_data_collection, protocols)
+        units.clear()
+        stages.clear()
+        protocols.clear()
+
+    for number in range(size.units):
+        schema = rng.choice(schemas)
+        creation_time = start_date + timedelta(minutes=number * 5)
+        internal_id = str(2_000_000_000_000 + number)
+        uuid = _hex(rng)
+        internal_ids.append(internal_id)
+        units.append(
+            {
+                "schema_id": schema["schema_id"],
+                "uuid": uuid,
+                "internal_id": internal_id,
+                "passport_short_url": f"https://url.today/{number}",
+                "passport_ipfs_cid": None,
+                "is_in_db": True,
+                "featured_in_int_id": None,
+                "biography": None,
+                "components_internal_ids": [],
+                "model": schema["unit_name"],
+                "creation_time": creation_time,
+                "type": None,
+                "parential_unit": None,
+                "serial_number": None,
+                "status": rng.choice(list(UnitStatus)).value,
+                "txn_hash": None,
+            }
+        )
+        for stage_number, schema_stage in enumerate(schema["production_stages"]):
+            session_start = creation_time + timedelta(minutes=stage_number * 30)
+            session_end = session_start + timedelta(seconds=rng.randint(30, 2 * schema_stage["duration_seconds"]))
+            stages.append(
+                {
+                    "name": schema_stage["name"],
+                    "employee_name": rng.choice(employee_hashes),
+                    "parent_unit_uuid": uuid,
+                    "session_start_time": session_start.strftime(TIME_FORMAT),
+                    "session_end_time": session_end.strftime(TIME_FORMAT),
+                    "ended_prematurely": False,
+                    "video_hashes": [hashlib.sha256(f"{uuid}{stage_number}".encode()).hexdigest()],
+                    "additional_info": {},
+                    "id": _hex(rng),
+                    "is_in_db": True,
+                    "creation_time": session_start,
+                    "schema_stage_id": schema_stage["stage_id"],
+                    "completed": True,
+                    "number": stage_number,
+                }
+            )
+        if rng.random() < size.protocols_ratio:
+            protocol_unit_ids.append(internal_id)
+            protocols.append(
+                {
+                    "protocol_name": f"Protocol for {schema['unit_name']}",
+                    "protocol_schema_id": _hex(rng),
+                    "associated_with_schema_id": schema["schema_id"],
+                    "default_serial_number": None,
+                    "rows": [
+                        {"name": f"Check {row}", "value": "ok", "test1": "ok", "test2": None, "checked": True}
+                        for row in range(20)
+                    ],
+                    "protocol_id": _hex(rng),
+                    "associated_unit_id": internal_id,
+                    "status": rng.choice(list(ProtocolStatus)).value,
+                    "creation_time": creation_time,
+                }
+            )
+        if len(stages) >= BATCH_SIZE:
+            await flush()
+            logger.info(f"Seeded {number + 1}/{size.units} units")
+    await flush()
+
+    return SeededPlant(
+        schema_ids=[schema["schema_id"] for schema in schemas],
+        internal_ids=internal_ids,
+        protocol_unit_ids=protocol_unit_ids,
+        rfid_card_ids=[employee.rfid_card_id for employee in employees],
+    )
+
+
+async def create_indexes() -> None:
+    """create indexes on the lookup keys used by MongoDbWrapper"""
+    db = MongoDbWrapper()
+    await db.ensure_indexes()
+    await db._unit_collection.create_index("internal_id")
+    await db._unit_collection.create_index([("status", 1), ("creation_time", 1)])
+    await db._unit_tree_collection.create_index([("ancestor", 1), ("descendant", 1)], unique=True)
+    await db._unit_tree_collection.create_index([("descendant", 1), ("depth", 1)])
+    await db._unit_tree_collection.create_index("parent")
+    await db._unit_archive_collection.create_index("internal_id")
+    await db._unit_archive_collection.create_index("uuid")
+    await db._prod_stage_archive_collection.create_index("parent_unit_uuid")
+    await db._prod_stage_archive_collection.create_index("u")
+    await db._protocols_data_archive_collection.create_index("associated_unit_id")
+    # stages are stored in compact format (see modules/codec.py), legacy field names are indexed until migrated
+    await db._prod_stage_collection.create_index("u")
+    await db._prod_stage_collection.create_index("parent_unit_uuid", partialFilterExpression={"f": {"$exists": False}})
+    await db._schemas_collection.create_index("schema_id")
+    await db._schemas_collection.create_index("production_stages.stage_id")
+    await db._stage_durations_collection.create_index([("ss", 1), ("day", 1), ("n", 1)])
+    await db._employee_collection.create_index("rfid_card_id")
+    await db._credentials_collection.create_index("username")
+    await db._protocols_collection.create_index("associated_with_schema_id")
+    await db._protocols_data_collection.create_index("associated_unit_id")
+    await db._protocols_data_collection.create_index("associated_with_schema_id")
+    await db._protocols_data_collection.create_index("status")
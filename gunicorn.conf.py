@@ -0,0 +1,32 @@
+"""
+Gunicorn config for multi-worker deployment: `gunicorn -c gunicorn.conf.py app:api`.
+Every worker is a separate process with its own database/cache clients and in-memory caches,
+warmed up on startup (see modules/health.py)
+"""
+import multiprocessing
+import os
+import shutil
+import typing as tp
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 0)) or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("WORKER_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# metrics of all workers are aggregated through files in this directory, see modules/metrics.py
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+
+def on_starting(server: tp.Any) -> None:
+    """remove metrics left by previous run"""
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server: tp.Any, worker: tp.Any) -> None:
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)  # type: ignore[no-untyped-call]
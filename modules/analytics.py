@@ -0,0 +1,88 @@
+import datetime
+import os
+import typing as tp
+
+from .database import MongoDbWrapper
+from .durations import duration_stats, find_anomalies
+from .jobs import JobContext, JobScheduler
+from .routers.jobs.models import Job
+from .routers.schemas.models import DurationAnomaly, ProductionSchema, StageDurationStats
+
+DURATIONS_BACKFILL_BATCH_SIZE = int(os.environ.get("DURATIONS_BACKFILL_BATCH_SIZE", 1000))
+
+
+async def get_schema_durations(
+    schema: ProductionSchema,
+    since: datetime.datetime,
+    employee_name: tp.Optional[str] = None,
+    workplace: tp.Optional[str] = None,
+) -> tp.List[StageDurationStats]:
+    """duration statistics of every stage of production schema, for stages finished since given time"""
+    stages = schema.production_stages or []
+    durations = await MongoDbWrapper().get_stage_durations(
+        [stage.stage_id for stage in stages], since, employee_name=employee_name, workplace=workplace
+    )
+    return [
+        StageDurationStats(
+            schema_stage_id=stage.stage_id,
+            name=stage.name,
+            expected_seconds=stage.duration_seconds,
+            **duration_stats([sample["d"] for sample in durations[stage.stage_id]], stage.duration_seconds),
+        )
+        for stage in stages
+    ]
+
+
+async def get_schema_anomalies(
+    schema: ProductionSchema, since: datetime.datetime, factor: float, limit: int
+) -> tp.List[DurationAnomaly]:
+    """
+    stages of production schema finished since given time which took `factor` times longer than expected
+    (`duration_seconds` of schema stage, or median duration if not set), slowest first
+    """
+    stages = schema.production_stages or []
+    durations = await MongoDbWrapper().get_stage_durations([stage.stage_id for stage in stages], since)
+    anomalies = [
+        DurationAnomaly(
+            stage_id=sample["i"],
+            schema_stage_id=stage.stage_id,
+            name=stage.name,
+            employee_name=sample.get("e"),
+            workplace=sample.get("w"),
+            session_end_time=sample["t"],
+            duration_seconds=sample["d"],
+            expected_seconds=baseline,
+            ratio=sample["d"] / baseline,
+        )
+        for stage in stages
+        for sample, baseline in find_anomalies(durations[stage.stage_id], stage.duration_seconds, factor)
+    ]
+    anomalies.sort(key=lambda anomaly: anomaly.ratio, reverse=True)
+    return anomalies[:limit]
+
+
+async def _backfill_durations_job(
+    context: JobContext, batch_size: int = DURATIONS_BACKFILL_BATCH_SIZE
+) -> tp.Dict[str, tp.Any]:
+    database = MongoDbWrapper()
+    # recording is idempotent on stage id: stages completed meanwhile and recorded on write aren't counted twice,
+    # recorded durations stay readable while backfill runs
+    await database.remove_duplicate_stage_durations()
+    await database.ensure_indexes()
+    await context.report(0, force=True)
+
+    recorded = {"stages": 0, "archived_stages": 0}
+    for archived in (False, True):
+        key = "archived_stages" if archived else "stages"
+        async for stages in database.iterate_completed_stages(archived=archived, batch_size=batch_size):
+            recorded[key] += await database.add_stage_durations(stages)
+            await context.report(recorded["stages"] + recorded["archived_stages"])
+    return {f"recorded_{key}": value for key, value in recorded.items()}
+
+
+JobScheduler().register("backfill_stage_durations", _backfill_durations_job, concurrency=1)
+
+
+async def start_durations_backfill(batch_size: int = DURATIONS_BACKFILL_BATCH_SIZE) -> Job:
+    """schedule rebuild of stage durations store from production stages (and archived stages)"""
+    return await JobScheduler().submit("backfill_stage_durations", batch_size=batch_size)
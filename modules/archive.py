@@ -0,0 +1,50 @@
+import asyncio
+import datetime
+import os
+import typing as tp
+
+from loguru import logger
+
+from .database import MongoDbWrapper
+from .jobs import JobContext, JobScheduler
+from .routers.jobs.models import Job
+from .routers.passports.models import UnitStatus
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 180))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get("ARCHIVE_INTERVAL_HOURS", 0))
+
+
+async def _archive_job(context: JobContext, older_than_days: int = ARCHIVE_AFTER_DAYS) -> tp.Dict[str, tp.Any]:
+    created_before = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+    total = await MongoDbWrapper().count_passports(
+        {"status": UnitStatus.finalized.value, "creation_time": {"$lt": created_before}}
+    )
+    await context.report(0, total.value, force=True)
+
+    archived = 0
+    while True:
+        moved = await MongoDbWrapper().archive_units(created_before=created_before, limit=ARCHIVE_BATCH_SIZE)
+        if not moved:
+            break
+        archived += moved
+        await context.report(archived)
+    return {"archived_units": archived, "created_before": created_before.isoformat()}
+
+
+JobScheduler().register("archive_finalized_units", _archive_job, concurrency=1)
+
+
+async def start_archival(older_than_days: int = ARCHIVE_AFTER_DAYS) -> Job:
+    """schedule archival of finalized units older than given number of days"""
+    return await JobScheduler().submit("archive_finalized_units", older_than_days=older_than_days)
+
+
+async def schedule_archival() -> None:
+    """start archival every $ARCHIVE_INTERVAL_HOURS hours"""
+    while True:
+        try:
+            await start_archival()
+        except Exception as exception_message:
+            logger.error(f"Failed to schedule archival: {exception_message}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import os
 import time
 import typing as tp
@@ -6,20 +8,38 @@ import redis
 from loguru import logger
 from pydantic import BaseModel, parse_obj_as
 
-from modules.routers.employees.models import Employee
+from modules.metrics import record_cache_lookup
+from modules.profiler import record_call
 
 from .singleton import SingletonMeta
 
+if tp.TYPE_CHECKING:
+    # imported lazily: routers package imports database, which depends on this module
+    from modules.routers.employees.models import Employee
+
 
 class RedisCacher(metaclass=SingletonMeta):
     @logger.catch(reraise=True)
-    def __init__(self) -> None:
+    def __init__(self, client: tp.Optional[redis.Redis] = None) -> None:
+        """Preconfigured `client` (e.g. fakeredis) may be passed instead of $REDIS_HOST"""
+        if client is not None:
+            self._client = client
+            return
+
         REDIS_HOST = os.environ.get("REDIS_HOST")
         if not REDIS_HOST:
             raise ConnectionError("REDIS_HOST not specified")
 
         self._client = redis.Redis(host=REDIS_HOST, socket_connect_timeout=3)
 
+    async def ping(self) -> None:
+        """Check that redis is reachable, raises otherwise"""
+        self._client.ping()
+
+    def close(self) -> None:
+        """Close connection pool"""
+        self._client.close()
+
     async def _is_in_cache(self, query: tp.Tuple[str, str]) -> bool:
         """Check if query is available in cache"""
         return bool(self._client.exists(str(query)))
@@ -27,10 +47,11 @@ class RedisCacher(metaclass=SingletonMeta):
     async def _cache_to_redis(self, query: tp.Tuple[str, str], data: BaseModel) -> None:
         """Save employee data to redis"""
         ttl = 1000 ** 2
+        # relative expiry, same as absolute `exat=now + ttl` (fakeredis used by benchmarks doesn't support `exat`)
         self._client.set(
             name=str(query),
             value=repr(data.dict()),
-            exat=int(time.time()) + ttl,
+            ex=ttl,
         )
         logger.debug(f"Cached to redis. Set to expire after {ttl // 60}m.")
 
@@ -43,6 +64,34 @@ class RedisCacher(metaclass=SingletonMeta):
         logger.debug(f"Unpacked employee {data} from cache")
         return parse_obj_as(model, data)
 
+    async def get_raw(self, query: tp.Tuple[str, str]) -> tp.Optional[bytes]:
+        """Get raw value from redis"""
+        cached_data: tp.Optional[bytes] = self._client.get(name=str(query))
+        return cached_data
+
+    async def set_raw(
+        self, query: tp.Tuple[str, str], value: tp.Union[str, bytes], ttl: tp.Optional[int] = None
+    ) -> None:
+        """Save raw value to redis. Value never expires if `ttl` not specified"""
+        self._client.set(name=str(query), value=value, ex=ttl)
+
+    async def increment(self, query: tp.Tuple[str, str]) -> int:
+        """Atomically increment integer value in redis, returns new value"""
+        return int(self._client.incr(str(query)))
+
+    async def push_to_list(self, query: tp.Tuple[str, str], value: str, max_length: int) -> None:
+        """Prepend value to redis list, keeping only `max_length` latest values"""
+        self._client.lpush(str(query), value)
+        self._client.ltrim(str(query), 0, max_length - 1)
+
+    def register_script(self, script: str) -> tp.Callable[..., tp.Any]:
+        """Register Lua script, returned callable runs it atomically with `keys` and `args`"""
+        return self._client.register_script(script)
+
+    async def get_list(self, query: tp.Tuple[str, str]) -> tp.List[bytes]:
+        """Get all values of redis list"""
+        return list(self._client.lrange(str(query), 0, -1))
+
     async def cache_employees(self, employees: tp.Iterable[Employee]) -> None:
         for employee in employees:
             employee_sha = await employee.encode_sha256()
@@ -50,9 +99,16 @@ class RedisCacher(metaclass=SingletonMeta):
                 await self._cache_to_redis(query=("employees", employee_sha), data=employee)
 
     async def get_employee(self, hashed_employee: str) -> tp.Optional[Employee]:
+        from modules.routers.employees.models import Employee
+
         query = ("employees", hashed_employee)
+        start = time.perf_counter()
 
         if await self._is_in_cache(query=query):
+            record_cache_lookup("employees", hit=True)
             employee = await self._unpack_from_redis(query=query, model=Employee)
+            record_call("redis", "employees", "get", time.perf_counter() - start, documents=1)
             return employee  # type:ignore
+        record_cache_lookup("employees", hit=False)
+        record_call("redis", "employees", "get", time.perf_counter() - start)
         return None
@@ -0,0 +1,199 @@
+import datetime
+import os
+import typing as tp
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .metrics import instrument_query, record_cache_lookup
+from .permissions import Projection
+from .routers.stages.models import STAGE_TIME_FORMAT
+from .types import Filter
+
+# until stages migration is finished, queries also match documents stored in legacy format
+STAGES_LEGACY_READS = os.environ.get("STAGES_LEGACY_READS", "true").lower() in ("1", "true", "yes")
+
+# legacy stage documents (API field names, string session times) have no format field
+FORMAT_FIELD = "f"
+COMPACT_FORMAT = 2
+
+# ProductionStage field -> field name on disk
+STAGE_FIELDS: tp.Dict[str, str] = {
+    "id": "i",
+    "parent_unit_uuid": "u",
+    "schema_stage_id": "ss",
+    "name": "n",
+    "employee_name": "e",
+    "session_start_time": "st",
+    "session_end_time": "et",
+    "ended_prematurely": "ep",
+    "video_hashes": "vh",
+    "additional_info": "ai",
+    "is_in_db": "db",
+    "creation_time": "ct",
+    "completed": "c",
+    "number": "no",
+}
+STORED_FIELDS: tp.Dict[str, str] = {stored: field for field, stored in STAGE_FIELDS.items()}
+SESSION_TIME_FIELDS = ("session_start_time", "session_end_time")
+
+
+def is_compact(document: tp.Dict[str, tp.Any]) -> bool:
+    return document.get(FORMAT_FIELD) == COMPACT_FORMAT
+
+
+def _encode_session_time(value: tp.Any) -> tp.Any:
+    """session time as native datetime, if it converts back to the same string (otherwise stored as is)"""
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.datetime.strptime(value, STAGE_TIME_FORMAT)
+    except ValueError:
+        return value
+    return parsed if parsed.strftime(STAGE_TIME_FORMAT) == value else value
+
+
+def _decode_session_time(value: tp.Any) -> tp.Any:
+    return value.strftime(STAGE_TIME_FORMAT) if isinstance(value, datetime.datetime) else value
+
+
+def encode_filter(filter: Filter) -> Filter:
+    """stages query filter in ProductionStage field names (top-level only) translated to storage format"""
+    compact = {STAGE_FIELDS.get(field, field): value for field, value in filter.items()}
+    if not STAGES_LEGACY_READS:
+        return compact
+    return {"$or": [compact, {**filter, FORMAT_FIELD: {"$exists": False}}]}
+
+
+def encode_projection(projection: tp.Optional[Projection]) -> tp.Optional[Projection]:
+    """exclusion projection in ProductionStage field names translated to both formats"""
+    if not projection:
+        return projection
+    encoded = {STAGE_FIELDS.get(field, field): value for field, value in projection.items()}
+    if STAGES_LEGACY_READS:
+        encoded.update(projection)
+    return encoded
+
+
+def field_expression(path: str) -> tp.Any:
+    """aggregation expression for stage field (dotted path) stored in either format"""
+    field, _, rest = path.partition(".")
+    compact = f"${STAGE_FIELDS.get(field, field)}{'.' + rest if rest else ''}"
+    if not STAGES_LEGACY_READS:
+        return compact
+    return {"$ifNull": [compact, f"${path}"]}
+
+
+def get_field(document: tp.Dict[str, tp.Any], field: str) -> tp.Any:
+    """value of single ProductionStage field of stored document in either format"""
+    if is_compact(document):
+        value = document.get(STAGE_FIELDS.get(field, field))
+        return _decode_session_time(value) if field in SESSION_TIME_FIELDS else value
+    return document.get(field)
+
+
+class StageCodec:
+    """
+    Translates production stages between ProductionStage fields and compact storage format:
+    short field names, no null fields, native datetimes for session times and stage names interned
+    by schema stage id (`ProductionSchemaStage.stage_id`).
+    Interned names are kept in their own append-only collection: the first name seen for a schema stage id
+    is kept forever, so renaming stages in schemas doesn't change stored stages, and cached names never go stale.
+    Stages whose name differs from the interned one store it explicitly. Legacy documents are decoded as is
+    """
+
+    def __init__(self, names_collection: AsyncIOMotorCollection) -> None:
+        self._names_collection = names_collection
+        self._names: tp.Dict[str, str] = {}
+
+    @staticmethod
+    @instrument_query("find_in")
+    async def _fetch_names(collection_: AsyncIOMotorCollection, schema_stage_ids: tp.List[str]) -> tp.Dict[str, str]:
+        cursor = collection_.find({"_id": {"$in": schema_stage_ids}})
+        return {document["_id"]: document["name"] for document in await cursor.to_list(length=None)}
+
+    @staticmethod
+    @instrument_query("bulk_write")
+    async def _insert_names(collection_: AsyncIOMotorCollection, names: tp.Dict[str, str]) -> None:
+        operations = [
+            UpdateOne({"_id": schema_stage_id}, {"$setOnInsert": {"name": name}}, upsert=True)
+            for schema_stage_id, name in names.items()
+        ]
+        try:
+            await collection_.bulk_write(operations, ordered=False)
+        except BulkWriteError as exception_message:
+            # concurrent upserts of the same id, one of them wins
+            logger.debug(f"Stage names were interned concurrently: {exception_message}")
+
+    async def _load_names(self, schema_stage_ids: tp.Iterable[tp.Optional[str]]) -> None:
+        requested = {schema_stage_id for schema_stage_id in schema_stage_ids if schema_stage_id}
+        if not requested:
+            return
+        missing = list(requested - self._names.keys())
+        record_cache_lookup("stage_names", hit=not missing)
+        if missing:
+            self._names.update(await self._fetch_names(self._names_collection, missing))
+
+    async def _intern(self, stages: tp.List[tp.Dict[str, tp.Any]]) -> None:
+        """make sure every schema stage id of `stages` has interned name, first stage's name is used"""
+        await self._load_names(stage.get("schema_stage_id") for stage in stages)
+        new_names: tp.Dict[str, str] = {}
+        for stage in stages:
+            schema_stage_id, name = stage.get("schema_stage_id"), stage.get("name")
+            if schema_stage_id and name and schema_stage_id not in self._names:
+                new_names.setdefault(schema_stage_id, name)
+        if new_names:
+            await self._insert_names(self._names_collection, new_names)
+            # another name may have been interned concurrently
+            self._names.update(await self._fetch_names(self._names_collection, list(new_names)))
+
+    def _encode(self, stage: tp.Dict[str, tp.Any], keep_nulls: bool) -> tp.Dict[str, tp.Any]:
+        document: tp.Dict[str, tp.Any] = {FORMAT_FIELD: COMPACT_FORMAT}
+        for field, value in stage.items():
+            if field == "name" and value and self._names.get(stage.get("schema_stage_id") or "") == value:
+                value = None
+            elif field in SESSION_TIME_FIELDS:
+                value = _encode_session_time(value)
+            if value is not None or keep_nulls:
+                document[STAGE_FIELDS.get(field, field)] = value
+        return document
+
+    async def encode_many(
+        self, stages: tp.List[tp.Dict[str, tp.Any]], keep_nulls: bool = False
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """
+        stages (ProductionStage dicts or legacy documents) in compact format. `_id` and version are kept.
+        With `keep_nulls`, null fields are stored too, so the result may be used to patch stored document
+        """
+        legacy = [stage for stage in stages if not is_compact(stage)]
+        await self._intern(legacy)
+        return [stage if is_compact(stage) else self._encode(stage, keep_nulls) for stage in stages]
+
+    async def encode(self, stage: tp.Dict[str, tp.Any], keep_nulls: bool = False) -> tp.Dict[str, tp.Any]:
+        return (await self.encode_many([stage], keep_nulls=keep_nulls))[0]
+
+    def _decode(self, document: tp.Dict[str, tp.Any]) -> tp.Dict[str, tp.Any]:
+        stage = {STORED_FIELDS.get(field, field): value for field, value in document.items() if field != FORMAT_FIELD}
+        for field in STAGE_FIELDS:
+            stage.setdefault(field, None)
+        for field in SESSION_TIME_FIELDS:
+            stage[field] = _decode_session_time(stage[field])
+        if stage["name"] is None:
+            stage["name"] = self._names.get(stage["schema_stage_id"] or "")
+            if stage["name"] is None:
+                logger.warning(f"No interned name for schema stage {stage['schema_stage_id']} of stage {stage['id']}")
+                stage["name"] = stage["schema_stage_id"] or ""
+        return stage
+
+    async def decode_many(self, documents: tp.List[tp.Dict[str, tp.Any]]) -> tp.List[tp.Dict[str, tp.Any]]:
+        """stored stage documents in ProductionStage fields, both formats are accepted. `_id` and version are kept"""
+        compact = [document for document in documents if is_compact(document)]
+        await self._load_names(document.get(STAGE_FIELDS["schema_stage_id"]) for document in compact)
+        return [self._decode(document) if is_compact(document) else document for document in documents]
+
+    async def decode(self, document: tp.Optional[tp.Dict[str, tp.Any]]) -> tp.Optional[tp.Dict[str, tp.Any]]:
+        if not document:
+            return None
+        return (await self.decode_many([document]))[0]
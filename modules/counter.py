@@ -0,0 +1,111 @@
+import json
+import os
+import time
+import typing as tp
+from collections import OrderedDict
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from .cacher import RedisCacher
+from .metrics import instrument_query, record_cache_lookup
+from .singleton import SingletonMeta
+from .types import Filter
+
+COUNT_CACHE_TTL = float(os.environ.get("COUNT_CACHE_TTL", 30))
+COUNT_CACHE_SIZE = int(os.environ.get("COUNT_CACHE_SIZE", 1024))
+
+
+class Count(tp.NamedTuple):
+    value: int
+    is_lower_bound: bool = False
+
+
+def normalize_filter(filter: tp.Any) -> tp.Any:
+    """bring filter to canonical form, so equal queries share a cache entry (keys and $in/$nin values order)"""
+    if isinstance(filter, dict):
+        return {
+            key: sorted(map(normalize_filter, value), key=repr)
+            if key in ("$in", "$nin") and isinstance(value, list)
+            else normalize_filter(value)
+            for key, value in sorted(filter.items())
+        }
+    if isinstance(filter, list):
+        return [normalize_filter(value) for value in filter]
+    return filter
+
+
+class DocumentsCounter(metaclass=SingletonMeta):
+    """
+    Listing totals service.
+    Unfiltered totals come from collection metadata (estimated_document_count),
+    filtered totals are cached by normalized filter for $COUNT_CACHE_TTL seconds and invalidated on writes.
+    Every write bumps collection's generation in Redis, so writes made by other workers invalidate cached counts too
+    (if Redis is unavailable, counts of other workers may stay stale for up to $COUNT_CACHE_TTL seconds)
+    """
+
+    def __init__(self) -> None:
+        # (collection, filter) -> (expires at, collection generation, count)
+        self._cache: tp.OrderedDict[tp.Tuple[str, str], tp.Tuple[float, tp.Optional[int], Count]] = OrderedDict()
+
+    @staticmethod
+    async def _generation(collection_name: str) -> tp.Optional[int]:
+        """number of writes to collection made by all workers, None if Redis is unavailable"""
+        try:
+            generation = await RedisCacher().get_raw(("counts_generation", collection_name))
+        except Exception as exception_message:
+            logger.warning(f"Counts generation of {collection_name} is unavailable: {exception_message}")
+            return None
+        return int(generation) if generation is not None else 0
+
+    @staticmethod
+    @instrument_query("estimated_document_count")
+    async def _estimate(collection_: AsyncIOMotorCollection) -> int:
+        count: int = await collection_.estimated_document_count()
+        return count
+
+    @staticmethod
+    @instrument_query("count_documents")
+    async def _count(collection_: AsyncIOMotorCollection, filter: Filter, limit: tp.Optional[int] = None) -> int:
+        count: int = await collection_.count_documents(filter, **({"limit": limit} if limit else {}))
+        return count
+
+    async def count(
+        self, collection_: AsyncIOMotorCollection, filter: Filter = {}, limit: tp.Optional[int] = None
+    ) -> Count:
+        """
+        count documents matching filter.
+        If `limit` specified, counting stops after `limit` documents and result is marked as lower bound ("at least N")
+        """
+        if not filter:
+            return Count(await self._estimate(collection_))
+
+        key = (collection_.name, json.dumps([normalize_filter(filter), limit], default=str))
+        generation = await self._generation(collection_.name)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic() and cached[1] == generation:
+            record_cache_lookup("counts", hit=True)
+            self._cache.move_to_end(key)
+            return cached[2]
+        record_cache_lookup("counts", hit=False)
+
+        value = await self._count(collection_, filter, limit)
+        count = Count(value, is_lower_bound=bool(limit) and value >= tp.cast(int, limit))
+
+        self._cache[key] = (time.monotonic() + COUNT_CACHE_TTL, generation, count)
+        self._cache.move_to_end(key)
+        while len(self._cache) > COUNT_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return count
+
+    async def invalidate(self, collection_name: str) -> None:
+        """drop cached counts for collection in every worker (called on every write)"""
+        try:
+            await RedisCacher().increment(("counts_generation", collection_name))
+        except Exception as exception_message:
+            logger.warning(f"Failed to invalidate counts of {collection_name} in other workers: {exception_message}")
+        stale = [key for key in self._cache if key[0] == collection_name]
+        for key in stale:
+            del self._cache[key]
+        if stale:
+            logger.debug(f"Invalidated {len(stale)} cached counts for {collection_name}")
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import os
 import typing as tp
@@ -5,51 +6,144 @@ import typing as tp
 from loguru import logger
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorCursor
 from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateMany, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
 
 from modules.cacher import RedisCacher
+from modules.codec import (
+    FORMAT_FIELD,
+    STAGE_FIELDS,
+    STAGES_LEGACY_READS,
+    StageCodec,
+    encode_filter,
+    encode_projection,
+    field_expression,
+    get_field,
+    is_compact,
+)
+from modules.counter import Count, DocumentsCounter
+from modules.durations import Sample, bucket_operations, duration_sample
+from modules.metrics import instrument_query
+from modules.models import User
+from modules.pagination import Page, Pagination, encode_cursor
+from modules.patches import PATCH_RETRIES, VERSION_FIELD, VersionConflictError, diff_documents
+from modules.permissions import Permission, Projection, compile_projection
+from modules.singleflight import single_flight
+from modules.spool import WriteSpool, spool_write, spooled
 
 from modules.routers.users.models import UserWithPassword
 from modules.routers.employees.models import Employee
 from modules.routers.passports.models import Passport, UnitStatus
-from modules.routers.schemas.models import ProductionSchema
-from modules.routers.stages.models import ProductionStage, ProductionStageData
-from modules.routers.tcd.models import Protocol, ProtocolData, ProtocolStatus
+from modules.routers.schemas.models import ProductionSchema, ProductionSchemaStage
+from modules.routers.stages.models import STAGE_TIME_FORMAT, ProductionStage, ProductionStageData, StageSummary
+from modules.routers.tcd.models import Protocol, ProtocolData, ProtocolStatus, ProtocolSummary
+from modules.routers.validation.models import ValidationJob, ValidationResult
 
 from .singleton import SingletonMeta
 from .types import Filter
 
+# write concern of stage ingestion: stages are acknowledged to workbenches only when they can't be lost
+STAGES_WRITE_CONCERN = os.environ.get("STAGES_WRITE_CONCERN", "majority")
+STAGES_WRITE_JOURNAL = os.environ.get("STAGES_WRITE_JOURNAL", "true").lower() in ("1", "true", "yes")
+DUPLICATE_KEY_ERROR = 11000
+
 
 class MongoDbWrapper(metaclass=SingletonMeta):
     """A database wrapper implementation for MongoDB"""
 
-    def __init__(self) -> None:
-        """connect to database using credentials"""
+    def __init__(self, client: tp.Optional[AsyncIOMotorClient] = None) -> None:
+        """
+        connect to database using credentials.
+        Preconfigured `client` (e.g. local mongod or mongomock-motor) may be passed instead of $MONGO_CONNECTION_URL
+        """
         logger.info("Connecting to MongoDB")
-        mongo_client_url: tp.Optional[str] = os.getenv("MONGO_CONNECTION_URL")
+        if client is not None:
+            mongo_client: AsyncIOMotorClient = client
+        else:
+            mongo_client_url: tp.Optional[str] = os.getenv("MONGO_CONNECTION_URL")
 
-        if mongo_client_url is None:
-            message = "Cannot establish database connection: $MONGO_CONNECTION_URL environment variable is not set."
-            logger.critical(message)
-            raise IOError(message)
+            if mongo_client_url is None:
+                message = "Cannot establish database connection: $MONGO_CONNECTION_URL environment variable is not set."
+                logger.critical(message)
+                raise IOError(message)
 
-        mongo_client_url = str(mongo_client_url) + "&ssl=true&tlsAllowInvalidCertificates=true"
-        mongo_client: AsyncIOMotorClient = AsyncIOMotorClient(mongo_client_url)
+            mongo_client_url = str(mongo_client_url) + "&ssl=true&tlsAllowInvalidCertificates=true"
+            mongo_client = AsyncIOMotorClient(mongo_client_url)
 
-        logger.debug(f"Connected to MongoDB at {mongo_client_url}")
+            logger.debug(f"Connected to MongoDB at {mongo_client_url}")
 
+        self._client: AsyncIOMotorClient = mongo_client
         self._database = mongo_client[os.environ.get("MONGO_DATABASE_NAME")]
 
         self._employee_collection: AsyncIOMotorCollection = self._database["employeeData"]
         self._unit_collection: AsyncIOMotorCollection = self._database["unitData"]
         self._prod_stage_collection: AsyncIOMotorCollection = self._database["productionStagesData"]
+        self._prod_stage_ingestion_collection: AsyncIOMotorCollection = self._prod_stage_collection.with_options(
+            write_concern=WriteConcern(
+                w=int(STAGES_WRITE_CONCERN) if STAGES_WRITE_CONCERN.isdigit() else STAGES_WRITE_CONCERN,
+                j=STAGES_WRITE_JOURNAL,
+            )
+        )
         self._credentials_collection: AsyncIOMotorCollection = self._database["analyticsCredentials"]
         self._schemas_collection: AsyncIOMotorCollection = self._database["productionSchemas"]
         self._protocols_collection: AsyncIOMotorCollection = self._database["protocols"]
         self._protocols_data_collection: AsyncIOMotorCollection = self._database["protocolsData"]
+        self._validation_jobs_collection: AsyncIOMotorCollection = self._database["validationJobs"]
+        self._validation_results_collection: AsyncIOMotorCollection = self._database["validationResults"]
+
+        # closure table of units composition: {ancestor, descendant, depth, parent (of descendant)}
+        self._unit_tree_collection: AsyncIOMotorCollection = self._database["unitTree"]
+
+        # finalized units with their stages and protocols are moved here by archival job
+        self._unit_archive_collection: AsyncIOMotorCollection = self._database["unitDataArchive"]
+        self._prod_stage_archive_collection: AsyncIOMotorCollection = self._database["productionStagesDataArchive"]
+        self._protocols_data_archive_collection: AsyncIOMotorCollection = self._database["protocolsDataArchive"]
+
+        # stages are stored in compact format, names are interned by schema stage id (see StageCodec)
+        self._stage_names_collection: AsyncIOMotorCollection = self._database["productionStageNames"]
+        self._stage_codec: StageCodec = StageCodec(self._stage_names_collection)
+        # durations of completed stages bucketed by schema stage and day: {ss, day, n, samples: [{i, t, d, e, w}]}
+        self._stage_durations_collection: AsyncIOMotorCollection = self._database["stageDurations"]
 
         logger.info("Connected to MongoDB")
 
         self._cacher: RedisCacher = RedisCacher()
+        self._counter: DocumentsCounter = DocumentsCounter()
+
+    async def ping(self) -> None:
+        """check that database is reachable, raises otherwise"""
+        await self._client.admin.command("ping")
+
+    async def ensure_indexes(self) -> bool:
+        """
+        create unique indexes which make unit and stage writes idempotent: retried stage pushes and replayed
+        spooled writes are rejected as duplicates. Returns False (and logs) if any of them can't be created,
+        retried writes may be stored twice then
+        """
+        legacy_stages = {"id": {"$exists": True}, FORMAT_FIELD: {"$exists": False}}
+        indexes: tp.List[tp.Tuple[AsyncIOMotorCollection, str, tp.Dict[str, tp.Any]]] = [
+            (self._unit_collection, "uuid", {}),
+            (self._prod_stage_collection, STAGE_FIELDS["id"], {"partialFilterExpression": {"i": {"$exists": True}}}),
+            (self._prod_stage_collection, "id", {"partialFilterExpression": legacy_stages}),
+            # stage durations are recorded once per stage (duplicates are removed by durations backfill)
+            (self._stage_durations_collection, "samples.i", {}),
+        ]
+        created = True
+        for collection_, key, options in indexes:
+            try:
+                await collection_.create_index(key, unique=True, **options)
+            except OperationFailure as exception_message:
+                created = False
+                logger.critical(
+                    f"Can't create unique index on {collection_.name}.{key}, retried writes may be stored twice. "
+                    f"Remove duplicates or drop conflicting index: {exception_message}"
+                )
+        return created
+
+    def close(self) -> None:
+        """close connection pool"""
+        self._client.close()
+        logger.info("MongoDB connection closed")
 
     @staticmethod
     async def _remove_ids(cursor: AsyncIOMotorCursor) -> tp.List[tp.Dict[str, tp.Any]]:
@@ -61,41 +155,107 @@ class MongoDbWrapper(metaclass=SingletonMeta):
         return result
 
     @staticmethod
+    @instrument_query("find", returns_documents=True)
     async def _get_all_from_collection(
         collection_: AsyncIOMotorCollection,
         model_: tp.Type[BaseModel],
         filter: Filter = {},
         include_only: tp.Optional[str] = None,
+        projection: tp.Optional[Projection] = None,
     ) -> tp.List[tp.Any]:
-        """retrieves all documents from the specified collection"""
+        """retrieves all documents from the specified collection. `projection` may exclude fields"""
         if include_only:
             return [
                 _[include_only]
                 for _ in await collection_.find(filter, {"_id": 0, include_only: 1}).to_list(length=None)
             ]
-        return tp.cast(
-            tp.List[BaseModel],
-            [model_(**_) for _ in await collection_.find(filter, {"_id": 0}).to_list(length=None)],
-        )
+        documents = await collection_.find(filter, {"_id": 0, **(projection or {})}).to_list(length=None)
+        return tp.cast(tp.List[BaseModel], [model_(**_) for _ in documents])
+
+    @staticmethod
+    @instrument_query("find_page", returns_documents=True)
+    async def _get_page_from_collection(
+        collection_: AsyncIOMotorCollection,
+        model_: tp.Type[BaseModel],
+        pagination: Pagination,
+        filter: Filter = {},
+        projection: tp.Optional[Projection] = None,
+        codec: tp.Optional[StageCodec] = None,
+    ) -> Page:
+        """
+        retrieves single page of documents sorted by `_id`.
+        Keyset pagination is used if pagination has a cursor, so deep pages cost the same as the first one.
+        Documents stored in another format are decoded with `codec`
+        """
+        query = filter
+        if pagination.after is not None:
+            keyset = {"_id": {"$lt" if pagination.descending else "$gt": pagination.after}}
+            query = {"$and": [filter, keyset]} if filter else keyset
+
+        cursor = collection_.find(query, projection).sort("_id", DESCENDING if pagination.descending else ASCENDING)
+        if pagination.after is None and pagination.page > 1:
+            cursor = cursor.skip((pagination.page - 1) * pagination.items)
+        documents = await cursor.limit(pagination.items + 1).to_list(length=pagination.items + 1)
+
+        next_cursor = None
+        if len(documents) > pagination.items:
+            documents = documents[: pagination.items]
+            next_cursor = encode_cursor(documents[-1]["_id"], descending=pagination.descending)
+        for document in documents:
+            del document["_id"]
+        if codec is not None:
+            documents = await codec.decode_many(documents)
+
+        return Page(data=[model_(**document) for document in documents], next_cursor=next_cursor)
 
     @staticmethod
-    async def _get_element_by_key(collection_: AsyncIOMotorCollection, key: str, value: str) -> tp.Dict[str, tp.Any]:
-        """retrieves all documents from given collection by given {key: value}"""
-        result: tp.Dict[str, tp.Any] = await collection_.find_one({key: value}, {"_id": 0})
+    @instrument_query("find_one", returns_documents=True)
+    async def _get_element_by_key(
+        collection_: AsyncIOMotorCollection, key: str, value: str, projection: tp.Optional[Projection] = None
+    ) -> tp.Dict[str, tp.Any]:
+        """retrieves all documents from given collection by given {key: value}. `projection` may exclude fields"""
+        result: tp.Dict[str, tp.Any] = await collection_.find_one({key: value}, {"_id": 0, **(projection or {})})
         return result
 
     @staticmethod
+    @instrument_query("count_documents")
     async def _count_documents_in_collection(collection_: AsyncIOMotorCollection, filter: Filter = {}) -> int:
         """Count documents in given collection"""
         count: int = await collection_.count_documents(filter)
         return count
 
     @staticmethod
+    @instrument_query("insert_one")
     async def _add_document_to_collection(collection_: AsyncIOMotorCollection, item_: BaseModel) -> None:
         """Push document to given MongoDB collection"""
         await collection_.insert_one(item_.dict())
+        await DocumentsCounter().invalidate(collection_.name)
+
+    @staticmethod
+    @instrument_query("insert_many")
+    async def _add_documents_to_collection(collection_: AsyncIOMotorCollection, items_: tp.Sequence[BaseModel]) -> None:
+        """Push multiple documents to given MongoDB collection"""
+        await collection_.insert_many([item_.dict() for item_ in items_], ordered=False)
+        await DocumentsCounter().invalidate(collection_.name)
 
     @staticmethod
+    @instrument_query("insert_one")
+    async def _insert_document(collection_: AsyncIOMotorCollection, document: tp.Dict[str, tp.Any]) -> None:
+        """Push raw document to given MongoDB collection"""
+        await collection_.insert_one(document)
+        await DocumentsCounter().invalidate(collection_.name)
+
+    @staticmethod
+    @instrument_query("insert_many")
+    async def _insert_documents(collection_: AsyncIOMotorCollection, documents: tp.List[tp.Dict[str, tp.Any]]) -> None:
+        """Push raw documents to given MongoDB collection, unordered: one failed document doesn't stop others"""
+        try:
+            await collection_.insert_many(documents, ordered=False)
+        finally:
+            await DocumentsCounter().invalidate(collection_.name)
+
+    @staticmethod
+    @instrument_query("delete")
     async def _remove_document_from_collection(
         collection_: AsyncIOMotorCollection, key: str, value: str, multiple: tp.Optional[bool] = None
     ) -> None:
@@ -109,36 +269,251 @@ class MongoDbWrapper(metaclass=SingletonMeta):
         if multiple:
             result = await collection_.delete_many(query)
         else:
-            result = await collection_.find_one_and_delete(query)
+            result = await collection_.delete_one(query)
 
+        await DocumentsCounter().invalidate(collection_.name)
         logger.debug(f"deleted {result.deleted_count} documents by query {query}")
 
     @staticmethod
+    @instrument_query("delete")
+    async def _remove_documents(collection_: AsyncIOMotorCollection, filter: Filter) -> None:
+        """Remove every document matching query filter"""
+        result = await collection_.delete_many(filter)
+        await DocumentsCounter().invalidate(collection_.name)
+        logger.debug(f"deleted {result.deleted_count} documents by query {filter}")
+
+    @staticmethod
+    @instrument_query("update_one")
+    async def _patch_document(
+        collection_: AsyncIOMotorCollection,
+        filter: Filter,
+        new_data: tp.Dict[str, tp.Any],
+        exclude: tp.Optional[tp.Set[str]] = None,
+        expected_version: tp.Optional[int] = None,
+    ) -> int:
+        """
+        Find single document by query filter and update only changed fields of it.
+        Every write increments document version. If `expected_version` specified and the document
+        has another version, VersionConflictError is raised. Without it, concurrent modifications are retried.
+        Returns new document version
+        """
+        for _ in range(PATCH_RETRIES):
+            stored = await collection_.find_one(filter, {"_id": 0})
+            if stored is None:
+                raise ValueError(f"Document matching {filter} not found")
+            version = stored.get(VERSION_FIELD, 0)
+            if expected_version is not None and expected_version != version:
+                raise VersionConflictError(f"Document version is {version}, expected {expected_version}")
+
+            operators = diff_documents(stored, new_data, exclude=exclude)
+            if not operators:
+                return tp.cast(int, version)
+
+            operators["$inc"] = {VERSION_FIELD: 1}
+            version_filter = {VERSION_FIELD: version if VERSION_FIELD in stored else {"$exists": False}}
+            result = await collection_.update_one({**filter, **version_filter}, operators)
+            if result.matched_count:
+                await DocumentsCounter().invalidate(collection_.name)
+                logger.debug(f"Patched document {filter}: {list(operators)}")
+                return tp.cast(int, version) + 1
+            if expected_version is not None:
+                break
+
+        raise VersionConflictError(f"Document {filter} was concurrently modified")
+
     async def _update_document_in_collection(
+        self,
         collection_: AsyncIOMotorCollection,
         key: str,
         value: str,
         new_data: BaseModel,
         exclude: tp.Optional[tp.Set[str]] = None,
-    ) -> None:
+        expected_version: tp.Optional[int] = None,
+    ) -> int:
         """
         XXX: DEPRECATED AND WILL BE REMOVED SOON, use _update_document() instead
         Find and update single document by query filter.
         If `exclude` specified, those fields won't be updated
         """
-        if exclude:
-            await collection_.find_one_and_update({key: value}, {"$set": new_data.dict(exclude=exclude)})
-        else:
-            await collection_.find_one_and_update({key: value}, {"$set": new_data.dict()})
+        return await self._patch_document(
+            collection_, {key: value}, new_data.dict(), exclude=exclude, expected_version=expected_version
+        )
 
     @staticmethod
+    @instrument_query("update_one")
     async def _update_document(
         collection: AsyncIOMotorCollection, filter: tp.Dict[str, str], new_data: tp.Dict[str, str]
     ) -> None:
         """Find and update single document by query filter"""
         if not filter or not new_data:
             raise ValueError(f"Expected filter and new_data, got {filter}:{new_data}")
-        await collection.find_one_and_update(filter, {"$set": new_data})
+        await collection.find_one_and_update(filter, {"$set": new_data, "$inc": {VERSION_FIELD: 1}})
+        await DocumentsCounter().invalidate(collection.name)
+
+    @staticmethod
+    @instrument_query("find", returns_documents=True)
+    async def _get_raw_documents(
+        collection_: AsyncIOMotorCollection,
+        filter: Filter,
+        limit: tp.Optional[int] = None,
+        projection: tp.Optional[Projection] = None,
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """retrieves documents as stored (with `_id`)"""
+        cursor = collection_.find(filter, projection)
+        if limit:
+            cursor = cursor.limit(limit)
+        return tp.cast(tp.List[tp.Dict[str, tp.Any]], await cursor.to_list(length=None))
+
+    @staticmethod
+    @instrument_query("move")
+    async def _move_documents(
+        collection_: AsyncIOMotorCollection,
+        destination: AsyncIOMotorCollection,
+        documents: tp.List[tp.Dict[str, tp.Any]],
+    ) -> None:
+        """
+        Move documents to another collection. Copies are upserted by `_id` before originals are deleted,
+        so interrupted move is safely repeated
+        """
+        if not documents:
+            return
+        await destination.bulk_write(
+            [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents], ordered=False
+        )
+        await collection_.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+        await DocumentsCounter().invalidate(collection_.name)
+        await DocumentsCounter().invalidate(destination.name)
+
+    @staticmethod
+    @instrument_query("update_one")
+    async def _update_stage_summary(
+        collection_: AsyncIOMotorCollection,
+        uuid: str,
+        increments: tp.Dict[str, int],
+        session_end_time: tp.Optional[datetime.datetime] = None,
+    ) -> None:
+        """
+        Atomically apply stage counters delta to unit's stage summary.
+        Units without summary (created before it was introduced) are skipped until summaries are rebuilt
+        """
+        update: tp.Dict[str, tp.Dict[str, tp.Any]] = {}
+        increments = {f"stage_summary.{key}": value for key, value in increments.items() if value}
+        if increments:
+            update["$inc"] = increments
+        if session_end_time is not None:
+            update["$max"] = {"stage_summary.last_session_end_time": session_end_time}
+        if update:
+            await collection_.update_one({"uuid": uuid, "stage_summary": {"$type": "object"}}, update)
+
+    @staticmethod
+    def _stage_summaries_operations(stages: tp.List[tp.Dict[str, tp.Any]]) -> tp.List[UpdateOne]:
+        """stage summary updates for a batch of new stages, one per unit"""
+        increments: tp.Dict[str, tp.Dict[str, int]] = {}
+        session_end_times: tp.Dict[str, datetime.datetime] = {}
+        for stage in stages:
+            uuid = stage["parent_unit_uuid"]
+            unit_increments = increments.setdefault(uuid, {})
+            for key, value in StageSummary.counters(stage).items():
+                unit_increments[key] = unit_increments.get(key, 0) + value
+            session_end_time = StageSummary.parse_session_time(stage.get("session_end_time"))
+            if session_end_time is not None:
+                session_end_times[uuid] = max(session_end_time, session_end_times.get(uuid, session_end_time))
+
+        operations = []
+        for uuid, unit_increments in increments.items():
+            update: tp.Dict[str, tp.Dict[str, tp.Any]] = {
+                "$inc": {f"stage_summary.{key}": value for key, value in unit_increments.items() if value}
+            }
+            if uuid in session_end_times:
+                update["$max"] = {"stage_summary.last_session_end_time": session_end_times[uuid]}
+            operations.append(UpdateOne({"uuid": uuid, "stage_summary": {"$type": "object"}}, update))
+        return operations
+
+    @staticmethod
+    @instrument_query("find_in", returns_documents=True)
+    async def _get_documents_by_keys(
+        collection_: AsyncIOMotorCollection, key: str, values: tp.List[str], projection: tp.List[str]
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """retrieves documents matching any of `values` by `key` in a single query"""
+        cursor = collection_.find({key: {"$in": values}}, {"_id": 0, key: 1, **{field: 1 for field in projection}})
+        return tp.cast(tp.List[tp.Dict[str, tp.Any]], await cursor.to_list(length=None))
+
+    @staticmethod
+    @instrument_query("bulk_write")
+    async def _bulk_write(
+        collection_: AsyncIOMotorCollection,
+        operations: tp.Sequence[tp.Union[UpdateOne, UpdateMany, ReplaceOne]],
+        session: tp.Optional[tp.Any] = None,
+    ) -> None:
+        """apply write operations in one round trip"""
+        if operations:
+            await collection_.bulk_write(operations, ordered=False, session=session)
+        await DocumentsCounter().invalidate(collection_.name)
+
+    async def _bulk_write_in_transaction(
+        self, operations: tp.List[tp.Tuple[AsyncIOMotorCollection, tp.List[UpdateOne]]]
+    ) -> None:
+        """
+        apply bulk writes to several collections atomically.
+        Standalone MongoDB servers don't support transactions, writes are applied without one there
+        """
+        async with await self._client.start_session() as session:
+            try:
+                async with session.start_transaction():
+                    for collection_, collection_operations in operations:
+                        await self._bulk_write(collection_, collection_operations, session=session)
+                return
+            except OperationFailure as exception_message:
+                if exception_message.code != 20:  # IllegalOperation: transactions require replica set
+                    raise
+                logger.warning(f"Transactions are not supported by MongoDB server: {exception_message}")
+
+        for collection_, collection_operations in operations:
+            await self._bulk_write(collection_, collection_operations)
+
+    async def _get_stage_documents(
+        self,
+        filter: Filter,
+        projection: tp.Optional[Projection] = None,
+        archived: bool = False,
+        limit: tp.Optional[int] = None,
+    ) -> tp.List[tp.Dict[str, tp.Any]]:
+        """production stages matching filter (in ProductionStage fields) decoded from storage format, with `_id`"""
+        collection_ = self._prod_stage_archive_collection if archived else self._prod_stage_collection
+        documents = await self._get_raw_documents(
+            collection_, encode_filter(filter), limit=limit, projection=encode_projection(projection)
+        )
+        return await self._stage_codec.decode_many(documents)
+
+    async def _get_stage_document(
+        self, stage_id: str, projection: tp.Optional[Projection] = None
+    ) -> tp.Optional[tp.Dict[str, tp.Any]]:
+        documents = await self._get_stage_documents({"id": stage_id}, projection=projection, limit=1)
+        return documents[0] if documents else None
+
+    async def _convert_stage_documents(
+        self, collection_: AsyncIOMotorCollection, documents: tp.List[tp.Dict[str, tp.Any]]
+    ) -> None:
+        """
+        rewrite stage documents (as stored, with `_id`) stored in legacy format in compact one.
+        Documents changed since they were read are skipped
+        """
+        legacy = [document for document in documents if not is_compact(document)]
+        encoded = await self._stage_codec.encode_many(legacy)
+        await self._bulk_write(
+            collection_,
+            [
+                ReplaceOne(
+                    {
+                        "_id": document["_id"],
+                        FORMAT_FIELD: {"$exists": False},
+                        VERSION_FIELD: document.get(VERSION_FIELD, {"$exists": False}),
+                    },
+                    compact,
+                )
+                for document, compact in zip(legacy, encoded)
+            ],
+        )
 
     async def decode_employee(self, hashed_employee: str) -> tp.Optional[Employee]:
         """Find an employee by hashed data"""
@@ -175,6 +550,7 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             int_ids.append(passport.internal_id)
         return int_ids
 
+    @single_flight
     async def get_concrete_employee(self, card_id: str) -> tp.Optional[Employee]:
         """retrieves an employee by card_id"""
         employee = await self._get_element_by_key(self._employee_collection, key="rfid_card_id", value=card_id)
@@ -182,27 +558,33 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             return None
         return Employee(**employee)
 
+    @single_flight
     async def get_concrete_passport(
         self, internal_id: tp.Optional[str] = None, uuid: tp.Optional[str] = None
     ) -> tp.Optional[Passport]:
         """retrieves unit by its internal id or uuid"""
         if internal_id and uuid:
             raise ValueError("Unit search only available by uuid or internal_id")
-        if internal_id:
-            passport = await self._get_element_by_key(self._unit_collection, key="internal_id", value=internal_id)
-        if uuid:
-            passport = await self._get_element_by_key(self._unit_collection, key="uuid", value=uuid)
+        if not internal_id and not uuid:
+            return None
+        key, value = ("internal_id", internal_id) if internal_id else ("uuid", uuid)
+        passport = await self._get_element_by_key(self._unit_collection, key=key, value=tp.cast(str, value))
+        if not passport:
+            passport = await self._get_element_by_key(self._unit_archive_collection, key=key, value=tp.cast(str, value))
         if not passport:
             return None
         return Passport(**passport)
 
-    async def get_concrete_stage(self, stage_id: str) -> tp.Optional[ProductionStage]:
+    async def get_concrete_stage(
+        self, stage_id: str, projection: tp.Optional[Projection] = None
+    ) -> tp.Optional[ProductionStage]:
         """retrieves production stage by its id"""
-        production_stage = await self._get_element_by_key(self._prod_stage_collection, key="id", value=stage_id)
+        production_stage = await self._get_stage_document(stage_id, projection=projection)
         if not production_stage:
             return None
         return ProductionStage(**production_stage)
 
+    @single_flight
     async def get_concrete_user(self, username: tp.Optional[str]) -> tp.Optional[UserWithPassword]:
         """retrieves information about analytics user by username"""
         if not username:
@@ -212,6 +594,22 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             return None
         return UserWithPassword(**user)
 
+    @single_flight
+    async def get_concrete_user_info(self, username: tp.Optional[str]) -> tp.Optional[User]:
+        """retrieves information about analytics user by username without password hash"""
+        if not username:
+            raise ValueError("No username provided")
+        user = await self._get_element_by_key(
+            self._credentials_collection,
+            key="username",
+            value=username,
+            projection=compile_projection("users", Permission.none),
+        )
+        if not user:
+            return None
+        return User(**user)
+
+    @single_flight
     async def get_concrete_schema(self, schema_id: str) -> ProductionSchema:
         """retrieves information about production schema"""
         schema = await self._get_element_by_key(self._schemas_collection, key="schema_id", value=schema_id)
@@ -226,23 +624,30 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             return None
         return Protocol(**protocol)
 
+    @single_flight
     async def get_concrete_protocol(self, internal_id: str) -> tp.Optional[ProtocolData]:
         """retrieves information about protocol by int_id"""
         protocol = await self._get_element_by_key(
             self._protocols_data_collection, key="associated_unit_id", value=internal_id
         )
+        if not protocol:
+            protocol = await self._get_element_by_key(
+                self._protocols_data_archive_collection, key="associated_unit_id", value=internal_id
+            )
         if not protocol:
             return None
         return ProtocolData(**protocol)
 
     async def get_passport_creation_date(self, uuid: str) -> tp.Optional[datetime.datetime]:
         try:
-            return (
-                await self._get_element_by_key(self._prod_stage_collection, key="parent_unit_uuid", value=uuid)
-            ).get("creation_time", None)
+            stages = await self._get_raw_documents(
+                self._prod_stage_collection, encode_filter({"parent_unit_uuid": uuid}), limit=1
+            )
+            return tp.cast(tp.Optional[datetime.datetime], get_field(stages[0], "creation_time"))
         except Exception:
             return None
 
+    @single_flight
     async def get_passport_type(self, schema_id: str) -> str:
         """retrieves unit type by given schema id"""
         try:
@@ -279,6 +684,7 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             return None
         return passport.status
 
+    @single_flight
     async def get_all_types(self) -> tp.Set[str]:
         """retrieves all types"""
         schemas: tp.List[ProductionSchema] = await self._get_all_from_collection(
@@ -297,6 +703,39 @@ class MongoDbWrapper(metaclass=SingletonMeta):
         """retrieves all protocols"""
         return await self._get_all_from_collection(self._protocols_data_collection, model_=ProtocolData, filter=filter)
 
+    async def parse_protocols_filter(self, filter: Filter = {}) -> Filter:
+        """resolve `name` filter into `associated_with_schema_id` through schemas catalog. Returns new filter"""
+        filter = dict(filter)
+        if "name" in filter:
+            matching_schemas_uuids = await self._get_all_from_collection(
+                self._schemas_collection,
+                model_=BaseModel,
+                filter={"unit_name": filter["name"]},
+                include_only="schema_id",
+            )
+            del filter["name"]
+            filter["associated_with_schema_id"] = {"$in": matching_schemas_uuids}
+        return filter
+
+    @single_flight
+    async def get_protocols_page(self, pagination: Pagination, filter: Filter = {}, with_rows: bool = False) -> Page:
+        """
+        retrieves single page of protocols. Filter must be parsed with `parse_protocols_filter` first.
+        Protocol rows are heavy and omitted unless `with_rows` specified
+        """
+        return await self._get_page_from_collection(
+            self._protocols_data_collection,
+            ProtocolSummary,
+            pagination,
+            filter=filter,
+            projection=None if with_rows else {"rows": 0},
+        )
+
+    @single_flight
+    async def count_protocols(self, filter: Filter = {}, limit: tp.Optional[int] = None) -> Count:
+        """count issued protocols. Filter must be parsed with `parse_protocols_filter` first"""
+        return await self._counter.count(self._protocols_data_collection, filter=filter, limit=limit)
+
     async def get_all_employees(self) -> tp.List[Employee]:
         """retrieves all employees"""
         return tp.cast(
@@ -326,32 +765,47 @@ class MongoDbWrapper(metaclass=SingletonMeta):
 
         del filter["name"]
         if "schema_id" in filter:
-            filter["schema_id"]["$in"] = list(set(filter["schema_id"]["$in"]).intersection(set(matching_schemas_uuids)))
+            matching = set(filter["schema_id"]["$in"]).intersection(matching_schemas_uuids)
+            filter["schema_id"] = {**filter["schema_id"], "$in": list(matching)}
         else:
             filter["schema_id"] = {"$in": matching_schemas_uuids}
 
         return filter
 
-    async def get_passports(self, filter: Filter = {}) -> tp.List[Passport]:
-        """retrieves all units (by filters)"""
+    async def parse_passports_filter(self, filter: Filter = {}) -> Filter:
+        """resolve `types` and `name` filters into matching schema ids. Returns new filter"""
+        filter = dict(filter)
         if "types" in filter:
             filter = await self._parse_types_filter(filter=filter)
 
         if "name" in filter:
             filter = await self._parse_name_filter(filter=filter)
 
+        return filter
+
+    async def get_passports(self, filter: Filter = {}) -> tp.List[Passport]:
+        """retrieves all units (by filters)"""
+        filter = await self.parse_passports_filter(filter)
+
         return tp.cast(
             tp.List[Passport],
             await self._get_all_from_collection(self._unit_collection, model_=Passport, filter=filter),
         )
 
+    async def _get_unit_stages(
+        self, uuid: str, projection: tp.Optional[Projection] = None
+    ) -> tp.List[ProductionStageData]:
+        """unit's production stages, read through to archive if there are none in hot collection"""
+        stages = await self._get_stage_documents({"parent_unit_uuid": uuid}, projection=projection)
+        if not stages:
+            stages = await self._get_stage_documents({"parent_unit_uuid": uuid}, projection=projection, archived=True)
+        return [ProductionStageData(**stage) for stage in stages]
+
     async def _get_stages_by_uuid(
-        self, uuid: tp.Optional[str] = None, is_subcomponent: bool = False
+        self, uuid: tp.Optional[str] = None, is_subcomponent: bool = False, projection: tp.Optional[Projection] = None
     ) -> tp.List[ProductionStageData]:
         """retrieves unit's production stages by its uuid"""
-        stages = await self._get_all_from_collection(
-            self._prod_stage_collection, model_=ProductionStageData, filter={"parent_unit_uuid": uuid}
-        )
+        stages = await self._get_unit_stages(uuid=tp.cast(str, uuid), projection=projection)
 
         for stage in stages:
             if not stage.parent_unit_uuid:
@@ -365,7 +819,10 @@ class MongoDbWrapper(metaclass=SingletonMeta):
         return stages
 
     async def _get_stages_by_internal_id(
-        self, internal_id: tp.Optional[str] = None, is_subcomponent: bool = False
+        self,
+        internal_id: tp.Optional[str] = None,
+        is_subcomponent: bool = False,
+        projection: tp.Optional[Projection] = None,
     ) -> tp.List[ProductionStageData]:
         """retrieves unit's production stages by its internal id"""
         passport = await self.get_concrete_passport(internal_id=internal_id)
@@ -373,9 +830,7 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             logger.warning(f"Stages for unit {internal_id} not found")
             return []
 
-        stages = await self._get_all_from_collection(
-            self._prod_stage_collection, model_=ProductionStageData, filter={"parent_unit_uuid": passport.uuid}
-        )
+        stages = await self._get_unit_stages(uuid=passport.uuid, projection=projection)
 
         for stage in stages:
             if not stage.parent_unit_uuid:
@@ -388,16 +843,23 @@ class MongoDbWrapper(metaclass=SingletonMeta):
 
         return stages
 
+    @single_flight
     async def get_stages(
-        self, internal_id: tp.Optional[str] = None, uuid: tp.Optional[str] = None, is_subcomponent: bool = False
+        self,
+        internal_id: tp.Optional[str] = None,
+        uuid: tp.Optional[str] = None,
+        is_subcomponent: bool = False,
+        projection: tp.Optional[Projection] = None,
     ) -> tp.List[ProductionStageData]:
-        """retrieves all production stages by given uuid or internal_id"""
+        """retrieves all production stages by given uuid or internal_id. `projection` may exclude fields"""
         if internal_id and uuid:
             raise ValueError("Stages search only available by uuid or internal_id")
         if uuid:
-            return await self._get_stages_by_uuid(uuid=uuid, is_subcomponent=is_subcomponent)
+            return await self._get_stages_by_uuid(uuid=uuid, is_subcomponent=is_subcomponent, projection=projection)
         if internal_id:
-            return await self._get_stages_by_internal_id(internal_id=internal_id, is_subcomponent=is_subcomponent)
+            return await self._get_stages_by_internal_id(
+                internal_id=internal_id, is_subcomponent=is_subcomponent, projection=projection
+            )
 
         return []
 
@@ -407,34 +869,164 @@ class MongoDbWrapper(metaclass=SingletonMeta):
 
     async def count_employees(self) -> int:
         """count documents in employee collection"""
-        return await self._count_documents_in_collection(self._employee_collection)
+        return (await self._counter.count(self._employee_collection)).value
 
-    async def count_passports(self, filter: Filter = {}) -> int:
-        """count documents in unit collection"""
-        return await self._count_documents_in_collection(self._unit_collection, filter=filter)
+    @single_flight
+    async def count_passports(
+        self, filter: Filter = {}, limit: tp.Optional[int] = None, archived: bool = False
+    ) -> Count:
+        """
+        count documents in unit collection (or its archive). Filter must be parsed with `parse_passports_filter` first.
+        If `limit` specified, result is a lower bound for expensive filters
+        """
+        collection_ = self._unit_archive_collection if archived else self._unit_collection
+        return await self._counter.count(collection_, filter=filter, limit=limit)
 
     async def count_stages(self) -> int:
         """count documents in stages collection"""
-        return await self._count_documents_in_collection(self._unit_collection)
+        return (await self._counter.count(self._prod_stage_collection)).value
 
     async def count_schemas(self) -> int:
         """count documents in schemas collection"""
-        return await self._count_documents_in_collection(self._schemas_collection)
+        return (await self._counter.count(self._schemas_collection)).value
+
+    async def get_employees_page(self, pagination: Pagination) -> Page:
+        """retrieves single page of employees"""
+        return await self._get_page_from_collection(self._employee_collection, Employee, pagination)
+
+    async def get_schemas_page(self, pagination: Pagination) -> Page:
+        """retrieves single page of production schemas"""
+        return await self._get_page_from_collection(self._schemas_collection, ProductionSchema, pagination)
+
+    async def get_stages_page(self, pagination: Pagination, projection: tp.Optional[Projection] = None) -> Page:
+        """retrieves single page of production stages"""
+        return await self._get_page_from_collection(
+            self._prod_stage_collection,
+            ProductionStage,
+            pagination,
+            projection=encode_projection(projection),
+            codec=self._stage_codec,
+        )
+
+    @single_flight
+    async def get_passports_page(self, pagination: Pagination, filter: Filter = {}, archived: bool = False) -> Page:
+        """
+        retrieves single page of units (or archived units).
+        Filter must be parsed with `parse_passports_filter` first
+        """
+        collection_ = self._unit_archive_collection if archived else self._unit_collection
+        return await self._get_page_from_collection(collection_, Passport, pagination, filter=filter)
+
+    async def archive_units(self, created_before: datetime.datetime, limit: int) -> int:
+        """
+        move up to `limit` finalized units created before given date to archive with their stages and protocols.
+        Returns number of archived units, 0 when nothing left to archive
+        """
+        units = await self._get_raw_documents(
+            self._unit_collection,
+            filter={"status": UnitStatus.finalized.value, "creation_time": {"$lt": created_before}},
+            limit=limit,
+        )
+        if not units:
+            return 0
+
+        stages = await self._get_raw_documents(
+            self._prod_stage_collection,
+            filter=encode_filter({"parent_unit_uuid": {"$in": [unit["uuid"] for unit in units]}}),
+        )
+        protocols = await self._get_raw_documents(
+            self._protocols_data_collection,
+            filter={"associated_unit_id": {"$in": [unit["internal_id"] for unit in units]}},
+        )
+
+        # units go last: until then they stay in hot collection and read-through finds moved children in archive
+        await self._move_documents(self._prod_stage_collection, self._prod_stage_archive_collection, stages)
+        await self._move_documents(self._protocols_data_collection, self._protocols_data_archive_collection, protocols)
+        await self._move_documents(self._unit_collection, self._unit_archive_collection, units)
+        logger.info(f"Archived {len(units)} units, {len(stages)} stages and {len(protocols)} protocols")
+        return len(units)
 
     async def add_employee(self, employee: Employee) -> None:
         """add employee to database"""
         await self._add_document_to_collection(self._employee_collection, employee)
 
+    @spooled(key=lambda arguments: str(arguments["passport"].uuid))
     async def add_passport(self, passport: Passport) -> None:
         """add unit to database"""
+        if passport.stage_summary is None:
+            passport.stage_summary = StageSummary()
         await self._add_document_to_collection(self._unit_collection, passport)
+        await self._add_to_units_tree(passport)
 
+    @spooled(key=lambda arguments: str(arguments["stage"].id))
     async def add_stage(self, stage: ProductionStage) -> None:
         """add stage to database"""
-        logger.debug(
-            f'Added stage {stage.dict(exclude={"completed", "number", "unit_name", "parent_unit_internal_id", "video_hashes", "additional_info"})}'
+        logger.debug("Added stage {} of unit {}", stage.id, stage.parent_unit_uuid)
+        await self._insert_document(self._prod_stage_collection, await self._stage_codec.encode(stage.dict()))
+        await self._update_stage_summary(
+            self._unit_collection,
+            uuid=stage.parent_unit_uuid,
+            increments=StageSummary.counters(stage.dict()),
+            session_end_time=StageSummary.parse_session_time(stage.session_end_time),
         )
-        await self._add_document_to_collection(self._prod_stage_collection, stage)
+        await self._record_stage_durations([stage.dict()])
+
+    async def add_stages(self, stages: tp.List[tp.Dict[str, tp.Any]]) -> tp.List[tp.Optional[str]]:
+        """
+        insert batch of stages in one round trip with durable write concern and update units' stage summaries.
+        Returns error for every stage: None if inserted, "duplicate" if stage with the same `id` is already stored
+        (unique index on `id`, see `ensure_indexes`, makes ingestion idempotent).
+        Like `add_stage`, stages are spooled while database is unreachable or write spool isn't empty
+        """
+        spool = WriteSpool()
+        if spool.enabled and not spool.is_empty():
+            return self._spool_stages(stages)
+        try:
+            return await self._insert_stages(stages)
+        except ConnectionFailure as exception_message:
+            if not spool.enabled:
+                raise
+            logger.warning(f"Database is unreachable, spooling {len(stages)} stages: {exception_message}")
+            return self._spool_stages(stages)
+
+    @staticmethod
+    def _spool_stages(stages: tp.List[tp.Dict[str, tp.Any]]) -> tp.List[tp.Optional[str]]:
+        """spool every stage as `add_stage` write, so retries of batch and single stage pushes are spooled once"""
+        for stage in stages:
+            spool_write("add_stage", str(stage["id"]), {"stage": ProductionStage(**stage)})
+        return [None] * len(stages)
+
+    async def _insert_stages(self, stages: tp.List[tp.Dict[str, tp.Any]]) -> tp.List[tp.Optional[str]]:
+        errors: tp.List[tp.Optional[str]] = [None] * len(stages)
+        if STAGES_LEGACY_READS:
+            # unique index on compact `id` doesn't cover stages still stored in legacy format
+            legacy = await self._get_raw_documents(
+                self._prod_stage_collection,
+                {"id": {"$in": [stage["id"] for stage in stages]}, FORMAT_FIELD: {"$exists": False}},
+                projection={"_id": 0, "id": 1},
+            )
+            stored = {document["id"] for document in legacy}
+            errors = ["duplicate" if stage["id"] in stored else None for stage in stages]
+
+        new = [index for index, error in enumerate(errors) if error is None]
+        documents = await self._stage_codec.encode_many([stages[index] for index in new])
+        try:
+            if documents:
+                await self._insert_documents(self._prod_stage_ingestion_collection, documents)
+        except BulkWriteError as exception_message:
+            for write_error in exception_message.details.get("writeErrors", []):
+                duplicate = write_error.get("code") == DUPLICATE_KEY_ERROR
+                errors[new[write_error["index"]]] = "duplicate" if duplicate else str(write_error.get("errmsg"))
+
+        inserted = [stage for stage, error in zip(stages, errors) if error is None]
+        try:
+            await self._bulk_write(self._unit_collection, self._stage_summaries_operations(inserted))
+        except Exception as exception_message:
+            # stages are stored already, summaries are fixed by rebuild (/api/v1/service/stage-summaries/rebuild)
+            logger.error(f"Failed to update stage summaries of {len(inserted)} stages: {exception_message}")
+        await self._record_stage_durations(inserted)
+        logger.debug("Inserted {} of {} stages", len(inserted), len(stages))
+        return errors
 
     async def add_user(self, user: UserWithPassword) -> None:
         """add user to database"""
@@ -457,18 +1049,24 @@ class MongoDbWrapper(metaclass=SingletonMeta):
         remove unit from database.
         if `cascade` specified, all production stages for unit will be removed
         """
-        await self._remove_document_from_collection(self._unit_collection, key="internal_id", value=internal_id)
         if cascade:
             passport = await self.get_concrete_passport(internal_id=internal_id)
             if not passport:
                 raise ValueError(f"Can't delete stages for passport {internal_id}, unit not found")
-            await self._remove_document_from_collection(
-                self._prod_stage_collection, key="parent_unit_uuid", value=passport.uuid, multiple=True
+            await self._remove_documents(
+                self._prod_stage_collection, encode_filter({"parent_unit_uuid": passport.uuid})
             )
+        await self._remove_document_from_collection(self._unit_collection, key="internal_id", value=internal_id)
+        await self.remove_from_units_tree(internal_id)
 
     async def remove_stage(self, stage_id: str) -> None:
         """remove production stage from database"""
-        await self._remove_document_from_collection(self._prod_stage_collection, key="id", value=stage_id)
+        stage = await self._get_stage_document(stage_id)
+        if not stage:
+            return
+        await self._remove_document_from_collection(self._prod_stage_collection, key="_id", value=stage["_id"])
+        increments = {key: -value for key, value in StageSummary.counters(stage).items()}
+        await self._update_stage_summary(self._unit_collection, uuid=stage["parent_unit_uuid"], increments=increments)
 
     async def remove_user(self, username: str) -> None:
         """remove user by username from database"""
@@ -484,14 +1082,17 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             self._protocols_data_collection, key="associated_unit_id", value=internal_id
         )
 
-    async def edit_schema(self, schema_id: str, new_schema_data: ProductionSchema) -> None:
-        """edit single production stage schema by its schema_id"""
-        await self._update_document_in_collection(
+    async def edit_schema(
+        self, schema_id: str, new_schema_data: ProductionSchema, expected_version: tp.Optional[int] = None
+    ) -> int:
+        """edit single production stage schema by its schema_id. Returns new schema version"""
+        return await self._update_document_in_collection(
             self._schemas_collection,
             key="schema_id",
             value=schema_id,
             new_data=new_schema_data,
             exclude={"schema_id", "parent_schema_id", "required_components_schema_ids"},
+            expected_version=expected_version,
         )
 
     async def edit_user(self, username: str, new_user_data: UserWithPassword) -> None:
@@ -500,45 +1101,102 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             self._credentials_collection, key="username", value=username, new_data=new_user_data, exclude={"is_admin"}
         )
 
-    async def edit_passport(self, internal_id: str, new_passport_data: Passport) -> None:
-        """edit concrete unit's data"""
-        await self._update_document_in_collection(
+    async def edit_passport(
+        self, internal_id: str, new_passport_data: Passport, expected_version: tp.Optional[int] = None
+    ) -> int:
+        """edit concrete unit's data (and units tree if components changed). Returns new unit version"""
+        stored = await self._get_element_by_key(self._unit_collection, key="internal_id", value=internal_id)
+        version = await self._update_document_in_collection(
             self._unit_collection,
             key="internal_id",
             value=internal_id,
             new_data=new_passport_data,
-            exclude={"uuid", "internal_id", "is_in_db", "featured_in_int_id"},
+            exclude={"uuid", "internal_id", "is_in_db", "featured_in_int_id", "stage_summary"},
+            expected_version=expected_version,
         )
-
-    async def edit_employee(self, rfid_card_id: str, new_employee_data: Employee) -> None:
-        """edit concrete employee's data"""
-        await self._update_document_in_collection(
-            self._employee_collection, key="rfid_card_id", value=rfid_card_id, new_data=new_employee_data, exclude=None
+        old_components = set((stored or {}).get("components_internal_ids") or [])
+        new_components = set(new_passport_data.components_internal_ids or [])
+        for component in old_components - new_components:
+            await self.unlink_unit(component)
+        for component in new_components - old_components:
+            await self.link_units(parent=internal_id, child=component)
+        return version
+
+    async def edit_employee(
+        self, rfid_card_id: str, new_employee_data: Employee, expected_version: tp.Optional[int] = None
+    ) -> int:
+        """edit concrete employee's data. Returns new employee version"""
+        return await self._update_document_in_collection(
+            self._employee_collection,
+            key="rfid_card_id",
+            value=rfid_card_id,
+            new_data=new_employee_data,
+            exclude=None,
+            expected_version=expected_version,
         )
 
-    async def edit_stage(self, stage_id: str, new_stage_data: ProductionStage) -> None:
-        """edit concrete production stage data"""
-        await self._update_document_in_collection(
-            self._prod_stage_collection,
-            key="id",
-            value=stage_id,
-            new_data=new_stage_data,
-            exclude={
+    async def edit_stage(
+        self, stage_id: str, new_stage_data: ProductionStage, expected_version: tp.Optional[int] = None
+    ) -> int:
+        """edit concrete production stage data (and its unit's stage summary). Returns new stage version"""
+        stage_filter = encode_filter({"id": stage_id})
+        exclude = {
+            STAGE_FIELDS[field]
+            for field in (
                 "parent_unit_uuid",
                 "session_start_time",
                 "session_end_time",
                 "id",
                 "is_in_db",
                 "creation_time",
-            },
-        )
+            )
+        }
+        for attempt in range(PATCH_RETRIES):
+            documents = await self._get_raw_documents(self._prod_stage_collection, stage_filter, limit=1)
+            if documents and not is_compact(documents[0]):
+                # legacy document is converted first, so it is patched in compact format
+                await self._convert_stage_documents(self._prod_stage_collection, documents)
+                documents = await self._get_raw_documents(self._prod_stage_collection, stage_filter, limit=1)
+            if not documents:
+                raise ValueError(f"Stage {stage_id} not found")
+            stored = (await self._stage_codec.decode_many(documents))[0]
+            new_data = await self._stage_codec.encode(new_stage_data.dict(), keep_nulls=True)
+            # null fields aren't stored, so nulls are written only to clear existing values
+            new_data = {field: value for field, value in new_data.items() if value is not None or field in documents[0]}
+            try:
+                # stored version is expected, so summary delta is computed against the replaced stage state
+                version = await self._patch_document(
+                    self._prod_stage_collection,
+                    filter={"_id": stored["_id"]},
+                    new_data=new_data,
+                    exclude=exclude,
+                    expected_version=stored.get(VERSION_FIELD, 0) if expected_version is None else expected_version,
+                )
+            except VersionConflictError:
+                if expected_version is not None or attempt == PATCH_RETRIES - 1:
+                    raise
+                continue
+
+            old_counters, new_counters = StageSummary.counters(stored), StageSummary.counters(new_stage_data.dict())
+            await self._update_stage_summary(
+                self._unit_collection,
+                uuid=stored["parent_unit_uuid"],
+                increments={key: new_counters[key] - old_counters[key] for key in new_counters},
+            )
+            if new_stage_data.completed and not stored.get("completed"):
+                readonly = {field: stored[field] for field in STAGE_FIELDS if STAGE_FIELDS[field] in exclude}
+                await self._record_stage_durations([{**new_stage_data.dict(), **readonly}])
+            return version
+        raise VersionConflictError(f"Stage {stage_id} was concurrently modified")
 
+    @spooled(key=lambda arguments: str(arguments["internal_id"]), replace=True)
     async def update_serial_number(self, internal_id: str, serial_number: str) -> None:
         """update concrete passport serial_number by internal_id"""
         await self._update_document(
             self._unit_collection, filter={"internal_id": internal_id}, new_data={"serial_number": serial_number}
         )
 
+    @spooled(key=lambda arguments: str(arguments["internal_id"]), replace=True)
     async def update_passport_status(self, internal_id: str, status: str) -> None:
         """update concrete passport status"""
         current_status = await self.get_passport_status(internal_id=internal_id)
@@ -552,7 +1210,7 @@ class MongoDbWrapper(metaclass=SingletonMeta):
         logger.info(
             f"Updating protocol {protocol_data.protocol_id} for unit {protocol_data.associated_unit_id}. Data: {protocol_data.dict()}"
         )
-        await self._update_document(
+        await self._patch_document(
             self._protocols_data_collection,
             filter={"associated_unit_id": protocol_data.associated_unit_id},
             new_data=protocol_data.dict(),
@@ -622,6 +1280,376 @@ class MongoDbWrapper(metaclass=SingletonMeta):
         await self.update_passport_status(internal_id=internal_id, status=UnitStatus.finalized)
         await self.update_protocol(protocol_data=protocol)
 
+    async def approve_protocols(self, internal_ids: tp.List[str]) -> tp.Dict[str, tp.Optional[str]]:
+        """
+        Approve protocols of several units at once.
+        Returns mapping of internal_id to error message (None if protocol approved)
+        """
+        internal_ids = list(dict.fromkeys(internal_ids))
+        protocols_documents, passports_documents = await asyncio.gather(
+            self._get_documents_by_keys(
+                self._protocols_data_collection, key="associated_unit_id", values=internal_ids, projection=["status"]
+            ),
+            self._get_documents_by_keys(
+                self._unit_collection, key="internal_id", values=internal_ids, projection=["status"]
+            ),
+        )
+        protocols = {protocol["associated_unit_id"]: protocol for protocol in protocols_documents}
+        passports = {passport["internal_id"]: passport for passport in passports_documents}
+
+        results: tp.Dict[str, tp.Optional[str]] = {}
+        to_approve: tp.List[str] = []
+        to_finalize: tp.List[str] = []
+        for internal_id in internal_ids:
+            if internal_id not in protocols or internal_id not in passports:
+                results[internal_id] = f"Protocol {internal_id} not found"
+                continue
+            results[internal_id] = None
+            if protocols[internal_id].get("status") != ProtocolStatus.third:
+                to_approve.append(internal_id)
+            # without transactions, earlier approval may have updated protocol but failed before its unit
+            if passports[internal_id].get("status") != UnitStatus.finalized:
+                to_finalize.append(internal_id)
+
+        await self._bulk_write_in_transaction(
+            [
+                (
+                    self._protocols_data_collection,
+                    [
+                        UpdateOne(
+                            {"associated_unit_id": internal_id},
+                            {"$set": {"status": ProtocolStatus.third.value}, "$inc": {VERSION_FIELD: 1}},
+                        )
+                        for internal_id in to_approve
+                    ],
+                ),
+                (
+                    self._unit_collection,
+                    [
+                        UpdateOne(
+                            {"internal_id": internal_id},
+                            {"$set": {"status": UnitStatus.finalized.value}, "$inc": {VERSION_FIELD: 1}},
+                        )
+                        for internal_id in to_finalize
+                    ],
+                ),
+            ]
+        )
+        logger.info(f"Approved {len(to_approve)} protocols, {sum(map(bool, results.values()))} failed")
+        return results
+
+    async def _add_to_units_tree(self, passport: Passport) -> None:
+        await self._bulk_write(
+            self._unit_tree_collection,
+            [
+                UpdateOne(
+                    {"ancestor": passport.internal_id, "descendant": passport.internal_id},
+                    {"$setOnInsert": {"depth": 0, "parent": None}},
+                    upsert=True,
+                )
+            ],
+        )
+        if passport.featured_in_int_id:
+            await self.link_units(parent=passport.featured_in_int_id, child=passport.internal_id)
+        for component in passport.components_internal_ids or []:
+            await self.link_units(parent=passport.internal_id, child=component)
+
+    async def link_units(self, parent: str, child: str) -> None:
+        """
+        Attach unit (with its own components) to assembly in units tree:
+        every ancestor of `parent` becomes ancestor of every unit in `child` subtree
+        """
+        ancestors = await self._get_raw_documents(self._unit_tree_collection, filter={"descendant": parent})
+        subtree = await self._get_raw_documents(self._unit_tree_collection, filter={"ancestor": child})
+
+        ancestors_depths = {edge["ancestor"]: edge["depth"] for edge in ancestors}
+        ancestors_depths[parent] = 0
+        if child in ancestors_depths:
+            raise ValueError(f"Can't make unit {child} a component of {parent}: it is already its assembly")
+        subtree_edges = {edge["descendant"]: (edge["depth"], edge.get("parent")) for edge in subtree}
+        subtree_edges[child] = (0, parent)
+
+        operations = [
+            UpdateOne(
+                {"ancestor": ancestor, "descendant": descendant},
+                {"$set": {"depth": ancestor_depth + descendant_depth + 1, "parent": descendant_parent}},
+                upsert=True,
+            )
+            for ancestor, ancestor_depth in ancestors_depths.items()
+            for descendant, (descendant_depth, descendant_parent) in subtree_edges.items()
+        ]
+        operations.append(
+            UpdateOne({"ancestor": child, "descendant": child}, {"$set": {"depth": 0, "parent": parent}}, upsert=True)
+        )
+        await self._bulk_write(self._unit_tree_collection, operations)
+
+    async def unlink_unit(self, internal_id: str) -> None:
+        """detach unit (with its components) from its assembly in units tree"""
+        ancestors = await self._get_raw_documents(
+            self._unit_tree_collection, filter={"descendant": internal_id, "depth": {"$gt": 0}}
+        )
+        if not ancestors:
+            return
+        subtree = await self._get_raw_documents(self._unit_tree_collection, filter={"ancestor": internal_id})
+        await self._remove_documents(
+            self._unit_tree_collection,
+            {
+                "ancestor": {"$in": [edge["ancestor"] for edge in ancestors]},
+                "descendant": {"$in": [edge["descendant"] for edge in subtree] + [internal_id]},
+            },
+        )
+        await self._bulk_write(
+            self._unit_tree_collection, [UpdateMany({"descendant": internal_id}, {"$set": {"parent": None}})]
+        )
+
+    async def remove_from_units_tree(self, internal_id: str) -> None:
+        """remove unit from units tree, its components become roots of their own subtrees"""
+        await self.unlink_unit(internal_id)
+        await self._remove_documents(
+            self._unit_tree_collection, {"$or": [{"ancestor": internal_id}, {"descendant": internal_id}]}
+        )
+        await self._bulk_write(
+            self._unit_tree_collection, [UpdateMany({"parent": internal_id}, {"$set": {"parent": None}})]
+        )
+
+    @single_flight
+    async def get_unit_ancestors(self, internal_id: str) -> tp.List[str]:
+        """all assemblies the unit is part of, from the top-level one down to its direct parent"""
+        ancestors = await self._get_raw_documents(
+            self._unit_tree_collection, filter={"descendant": internal_id, "depth": {"$gt": 0}}
+        )
+        return [edge["ancestor"] for edge in sorted(ancestors, key=lambda edge: -int(edge["depth"]))]
+
+    @single_flight
+    async def get_unit_descendants(self, internal_id: str) -> tp.List[tp.Dict[str, tp.Any]]:
+        """unit with all its components at any depth: units tree edges with `descendant`, `depth` and `parent`"""
+        return await self._get_raw_documents(self._unit_tree_collection, filter={"ancestor": internal_id})
+
+    @single_flight
+    async def get_units_brief(self, internal_ids: tp.List[str]) -> tp.Dict[str, tp.Dict[str, tp.Any]]:
+        """basic fields of several units (including archived ones) in one query per collection"""
+        projection = ["uuid", "model", "schema_id", "status", "serial_number"]
+        units = await self._get_documents_by_keys(
+            self._unit_collection, key="internal_id", values=internal_ids, projection=projection
+        )
+        found = {unit["internal_id"]: unit for unit in units}
+        missing = [internal_id for internal_id in internal_ids if internal_id not in found]
+        if missing:
+            archived = await self._get_documents_by_keys(
+                self._unit_archive_collection, key="internal_id", values=missing, projection=projection
+            )
+            found.update({unit["internal_id"]: unit for unit in archived})
+        return found
+
+    async def iterate_units_composition(self, batch_size: int = 1000) -> tp.AsyncIterator[tp.Dict[str, tp.Any]]:
+        """stream units composition fields (internal_id, components_internal_ids, featured_in_int_id)"""
+        projection = {"_id": 0, "internal_id": 1, "components_internal_ids": 1, "featured_in_int_id": 1}
+        async for unit in self._unit_collection.find({}, projection, batch_size=batch_size):
+            yield unit
+
+    async def replace_units_tree(self, edges: tp.List[tp.Dict[str, tp.Any]], drop: bool = False) -> None:
+        """write units tree edges as is. If `drop` specified, existing tree is removed first"""
+        if drop:
+            await self._remove_documents(self._unit_tree_collection, {})
+        await self._bulk_write(
+            self._unit_tree_collection,
+            [
+                UpdateOne(
+                    {"ancestor": edge["ancestor"], "descendant": edge["descendant"]},
+                    {"$set": {"depth": edge["depth"], "parent": edge["parent"]}},
+                    upsert=True,
+                )
+                for edge in edges
+            ],
+        )
+
+    async def iterate_units_uuids(self, batch_size: int = 1000) -> tp.AsyncIterator[tp.List[str]]:
+        """yields uuids of all units in batches"""
+        batch: tp.List[str] = []
+        async for unit in self._unit_collection.find({}, {"_id": 0, "uuid": 1}, batch_size=batch_size):
+            batch.append(unit["uuid"])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def rebuild_stage_summaries(self, uuids: tp.List[str]) -> None:
+        """recompute stage summaries of given units from their production stages"""
+
+        def is_set(field: tp.Any) -> tp.Dict[str, tp.Any]:
+            return {"$cond": [{"$eq": [field, True]}, 1, 0]}
+
+        # stored as date in compact format, as string in legacy one
+        session_end_time = field_expression("session_end_time")
+        pipeline = [
+            {"$match": encode_filter({"parent_unit_uuid": {"$in": uuids}})},
+            {
+                "$group": {
+                    "_id": field_expression("parent_unit_uuid"),
+                    "total": {"$sum": 1},
+                    "completed": {"$sum": is_set(field_expression("completed"))},
+                    "reworked": {"$sum": is_set(field_expression("additional_info.reworked"))},
+                    "canceled": {"$sum": is_set(field_expression("additional_info.canceled"))},
+                    "last_session_end_time": {
+                        "$max": {
+                            "$cond": [
+                                {"$eq": [{"$type": session_end_time}, "date"]},
+                                session_end_time,
+                                {
+                                    "$dateFromString": {
+                                        "dateString": session_end_time,
+                                        "format": STAGE_TIME_FORMAT,
+                                        "onError": None,
+                                        "onNull": None,
+                                    }
+                                },
+                            ]
+                        }
+                    },
+                }
+            },
+        ]
+        summaries = {
+            summary.pop("_id"): StageSummary(**summary)
+            for summary in await self._prod_stage_collection.aggregate(pipeline).to_list(length=None)
+        }
+        await self._bulk_write(
+            self._unit_collection,
+            [
+                UpdateOne({"uuid": uuid}, {"$set": {"stage_summary": summaries.get(uuid, StageSummary()).dict()}})
+                for uuid in uuids
+            ],
+        )
+
+    async def _get_schema_stages(self, schema_stage_ids: tp.Iterable[str]) -> tp.Dict[str, ProductionSchemaStage]:
+        """production schema stages by their stage_id"""
+        ids = list(set(schema_stage_ids))
+        if not ids:
+            return {}
+        schemas = await self._get_raw_documents(
+            self._schemas_collection,
+            {"production_stages.stage_id": {"$in": ids}},
+            projection={"_id": 0, "production_stages": 1},
+        )
+        return {
+            stage["stage_id"]: ProductionSchemaStage(**stage)
+            for schema in schemas
+            for stage in schema.get("production_stages") or []
+            if stage.get("stage_id") in ids
+        }
+
+    async def add_stage_durations(self, stages: tp.List[tp.Dict[str, tp.Any]]) -> int:
+        """
+        record durations of completed stages (ProductionStage dicts), stages recorded already are skipped.
+        Returns number of recorded durations
+        """
+        schema_stages = await self._get_schema_stages(
+            stage["schema_stage_id"] for stage in stages if stage.get("completed") and stage.get("schema_stage_id")
+        )
+        samples: tp.List[Sample] = [
+            sample
+            for sample in (
+                duration_sample(stage, schema_stages.get(stage.get("schema_stage_id") or "")) for stage in stages
+            )
+            if sample is not None
+        ]
+        try:
+            await self._bulk_write(self._stage_durations_collection, bucket_operations(samples))
+        except BulkWriteError as exception_message:
+            # durations of these stages are recorded already
+            write_errors = exception_message.details.get("writeErrors", [])
+            if any(write_error.get("code") != DUPLICATE_KEY_ERROR for write_error in write_errors):
+                raise
+            return len(samples) - len(write_errors)
+        return len(samples)
+
+    async def _record_stage_durations(self, stages: tp.List[tp.Dict[str, tp.Any]]) -> None:
+        try:
+            await self.add_stage_durations(stages)
+        except Exception as exception_message:
+            # stage is stored already, durations are fixed by backfill (/api/v1/service/stage-durations/backfill)
+            logger.error(f"Failed to record durations of {len(stages)} stages: {exception_message}")
+
+    async def get_stage_durations(
+        self,
+        schema_stage_ids: tp.List[str],
+        since: datetime.datetime,
+        employee_name: tp.Optional[str] = None,
+        workplace: tp.Optional[str] = None,
+    ) -> tp.Dict[str, tp.List[Sample]]:
+        """duration samples of given schema stages finished since given time, by schema stage id"""
+        sample_filter: Filter = {"samples.t": {"$gte": since}}
+        if employee_name is not None:
+            sample_filter["samples.e"] = employee_name
+        if workplace is not None:
+            sample_filter["samples.w"] = workplace
+        pipeline = [
+            {
+                "$match": {
+                    "ss": {"$in": schema_stage_ids},
+                    "day": {"$gte": since.replace(hour=0, minute=0, second=0, microsecond=0)},
+                }
+            },
+            {"$unwind": "$samples"},
+            {"$match": sample_filter},
+            {"$project": {"_id": 0, "ss": 1, "sample": "$samples"}},
+        ]
+        durations: tp.Dict[str, tp.List[Sample]] = {schema_stage_id: [] for schema_stage_id in schema_stage_ids}
+        async for document in self._stage_durations_collection.aggregate(pipeline):
+            durations[document["ss"]].append(document["sample"])
+        return durations
+
+    async def iterate_completed_stages(
+        self, archived: bool = False, batch_size: int = 1000
+    ) -> tp.AsyncIterator[tp.List[tp.Dict[str, tp.Any]]]:
+        """yields stages (or archived stages) completed by now in batches"""
+        collection_ = self._prod_stage_archive_collection if archived else self._prod_stage_collection
+        query = encode_filter({"completed": True})
+        batch: tp.List[tp.Dict[str, tp.Any]] = []
+        async for stage in collection_.find(query, batch_size=batch_size):
+            batch.append(stage)
+            if len(batch) >= batch_size:
+                yield await self._stage_codec.decode_many(batch)
+                batch = []
+        if batch:
+            yield await self._stage_codec.decode_many(batch)
+
+    async def remove_duplicate_stage_durations(self) -> int:
+        """
+        remove durations of stages recorded more than once (before unique index on stage id was created),
+        they are recorded again by backfill. Returns number of such stages
+        """
+        pipeline = [
+            {"$unwind": "$samples"},
+            {"$group": {"_id": "$samples.i", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        stage_ids = [document["_id"] async for document in self._stage_durations_collection.aggregate(pipeline)]
+        if stage_ids:
+            # `n` counts appended samples only to limit bucket size, so it isn't decremented
+            await self._bulk_write(
+                self._stage_durations_collection,
+                [UpdateMany({"samples.i": {"$in": stage_ids}}, {"$pull": {"samples": {"i": {"$in": stage_ids}}}})],
+            )
+        return len(stage_ids)
+
+    async def count_legacy_stages(self, archived: bool = False) -> int:
+        """count stages stored in legacy format"""
+        collection_ = self._prod_stage_archive_collection if archived else self._prod_stage_collection
+        return (await self._counter.count(collection_, filter={FORMAT_FIELD: {"$exists": False}})).value
+
+    async def migrate_stages(self, limit: int, archived: bool = False) -> int:
+        """
+        convert up to `limit` stages (or archived stages) stored in legacy format to compact one.
+        Returns number of processed stages, 0 when nothing left to convert
+        """
+        collection_ = self._prod_stage_archive_collection if archived else self._prod_stage_collection
+        documents = await self._get_raw_documents(collection_, {FORMAT_FIELD: {"$exists": False}}, limit=limit)
+        if documents:
+            await self._convert_stage_documents(collection_, documents)
+        return len(documents)
+
     async def cancel_revision(self, stage_id: str, employee: tp.Optional[Employee] = None) -> None:
         """Method to cancel revision for concrete production stage. It'll be marked as 'canceled'"""
         stage = await self.get_concrete_stage(stage_id=stage_id)
@@ -643,3 +1671,61 @@ class MongoDbWrapper(metaclass=SingletonMeta):
             )
 
         await self.edit_stage(stage_id=stage_id, new_stage_data=stage)
+
+    async def add_validation_job(self, job: ValidationJob) -> None:
+        """add IPFS validation job to database"""
+        await self._add_document_to_collection(self._validation_jobs_collection, job)
+
+    async def update_validation_job(self, job: ValidationJob) -> None:
+        """save IPFS validation job progress"""
+        await self._update_document(
+            self._validation_jobs_collection, filter={"job_id": job.job_id}, new_data=job.dict(exclude={"job_id"})
+        )
+
+    async def get_validation_job(self, job_id: str) -> tp.Optional[ValidationJob]:
+        """retrieves IPFS validation job by its id"""
+        job = await self._get_element_by_key(self._validation_jobs_collection, key="job_id", value=job_id)
+        if not job:
+            return None
+        return ValidationJob(**job)
+
+    async def get_validation_jobs(self, pagination: Pagination) -> Page:
+        """retrieves IPFS validation jobs, newest first"""
+        return await self._get_page_from_collection(
+            self._validation_jobs_collection, ValidationJob, pagination._replace(descending=True)
+        )
+
+    async def add_validation_results(self, results: tp.List[ValidationResult]) -> None:
+        """add batch of IPFS validation results to database"""
+        if results:
+            await self._add_documents_to_collection(self._validation_results_collection, results)
+
+    async def get_validation_results_page(self, job_id: str, pagination: Pagination, only_failed: bool = False) -> Page:
+        """retrieves single page of IPFS validation results for job"""
+        filter: Filter = {"job_id": job_id}
+        if only_failed:
+            filter["status"] = {"$ne": "valid"}
+        return await self._get_page_from_collection(
+            self._validation_results_collection, ValidationResult, pagination, filter=filter
+        )
+
+    async def iterate_units_with_ipfs_cid(self, filter: Filter = {}) -> tp.AsyncIterator[tp.Dict[str, tp.Any]]:
+        """stream units which have passport published to IPFS (only internal_id, uuid and cid fields)"""
+        query = {**filter, "passport_ipfs_cid": {"$nin": [None, ""]}}
+        projection = {"_id": 0, "internal_id": 1, "uuid": 1, "passport_ipfs_cid": 1}
+        async for unit in self._unit_collection.find(query, projection, batch_size=1000):
+            yield unit
+
+    async def count_units_with_ipfs_cid(self, filter: Filter = {}) -> int:
+        """count units which have passport published to IPFS"""
+        query = {**filter, "passport_ipfs_cid": {"$nin": [None, ""]}}
+        return (await self._counter.count(self._unit_collection, filter=query)).value
+
+    async def get_stages_video_hashes(self, uuid: str) -> tp.List[str]:
+        """retrieves video hashes of all unit's production stages"""
+        stages = await self._get_raw_documents(
+            self._prod_stage_collection,
+            encode_filter({"parent_unit_uuid": uuid, "video_hashes": {"$ne": None}}),
+            projection={"_id": 0, FORMAT_FIELD: 1, "video_hashes": 1, STAGE_FIELDS["video_hashes"]: 1},
+        )
+        return [video_hash for stage in stages for video_hash in get_field(stage, "video_hashes")]
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+import typing as tp
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from fastapi import Depends
+from loguru import logger
+
+from modules.cacher import RedisCacher
+from modules.exceptions import TooManyRequestsException
+from modules.metrics import record_admission_rejection, record_admission_wait
+from modules.models import User
+from modules.singleton import SingletonMeta
+
+from .security import get_current_user
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# refills bucket by elapsed time and takes a token, returns 0 or seconds until the next token (as string,
+# Lua numbers are truncated to integers on return)
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated_at, 0) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class EndpointLimits(tp.NamedTuple):
+    rate: float  # requests per second per user (bucket refill rate)
+    burst: int  # bucket capacity: requests per user allowed at once
+    concurrency: int  # requests processed simultaneously by a single worker
+    queue_size: int  # requests allowed to wait for a free slot, others are rejected at once
+    queue_timeout: float  # seconds to wait for a free slot
+
+
+def _limits(endpoint_class: str, default: EndpointLimits) -> EndpointLimits:
+    """defaults may be overridden with $ADMISSION_<CLASS>_<FIELD> envvars"""
+    return EndpointLimits(
+        *(
+            type(value)(os.environ.get(f"ADMISSION_{endpoint_class.upper()}_{field.upper()}", value))
+            for field, value in default._asdict().items()
+        )
+    )
+
+
+ENDPOINT_CLASSES: tp.Dict[str, EndpointLimits] = {
+    # paginated listings with filters and counts
+    "listing": _limits("listing", EndpointLimits(rate=5.0, burst=20, concurrency=16, queue_size=64, queue_timeout=5.0)),
+    # single unit with its biography or assembly tree
+    "unit": _limits("unit", EndpointLimits(rate=10.0, burst=40, concurrency=32, queue_size=128, queue_timeout=5.0)),
+}
+
+
+class AdmissionController(metaclass=SingletonMeta):
+    """
+    Admission control for expensive endpoints.
+    Per-user token buckets live in Redis, so rate limits are shared by all workers.
+    Concurrency caps with bounded waiting queues are per worker, like MongoDB connection pools they protect.
+    If Redis is unavailable, rate limiting is skipped (concurrency caps still apply)
+    """
+
+    def __init__(self) -> None:
+        self._token_bucket: tp.Optional[tp.Callable[..., tp.Any]] = None
+        self._semaphores: tp.Dict[str, asyncio.Semaphore] = {}
+        self._waiting: tp.DefaultDict[str, int] = defaultdict(int)
+
+    async def take_token(self, endpoint_class: str, username: str) -> float:
+        """take a token from user's bucket. Returns 0 if request is admitted, otherwise seconds to retry after"""
+        limits = ENDPOINT_CLASSES[endpoint_class]
+        try:
+            if self._token_bucket is None:
+                self._token_bucket = RedisCacher().register_script(TOKEN_BUCKET_SCRIPT)
+            retry_after = self._token_bucket(
+                keys=[str(("admission", f"{endpoint_class}:{username}"))], args=[limits.rate, limits.burst, time.time()]
+            )
+        except Exception as exception_message:
+            logger.warning(f"Rate limiter is unavailable, admitting request: {exception_message}")
+            return 0.0
+        return float(retry_after)
+
+    def _semaphore(self, endpoint_class: str) -> asyncio.Semaphore:
+        # created lazily, so it is bound to the running event loop
+        if endpoint_class not in self._semaphores:
+            self._semaphores[endpoint_class] = asyncio.Semaphore(ENDPOINT_CLASSES[endpoint_class].concurrency)
+        return self._semaphores[endpoint_class]
+
+    @asynccontextmanager
+    async def slot(self, endpoint_class: str) -> tp.AsyncIterator[None]:
+        """hold one of endpoint class concurrency slots, waiting in queue for at most `queue_timeout`"""
+        limits = ENDPOINT_CLASSES[endpoint_class]
+        semaphore = self._semaphore(endpoint_class)
+        start = time.perf_counter()
+        if not semaphore.locked():
+            # free slot is taken without suspending, so no other request can get ahead of this one
+            await semaphore.acquire()
+        else:
+            if self._waiting[endpoint_class] >= limits.queue_size:
+                record_admission_rejection(endpoint_class, "concurrency")
+                raise TooManyRequestsException(retry_after=limits.queue_timeout, endpoint_class=endpoint_class)
+
+            self._waiting[endpoint_class] += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=limits.queue_timeout)
+            except asyncio.TimeoutError:
+                record_admission_rejection(endpoint_class, "concurrency")
+                raise TooManyRequestsException(retry_after=limits.queue_timeout, endpoint_class=endpoint_class)
+            finally:
+                self._waiting[endpoint_class] -= 1
+        record_admission_wait(endpoint_class, time.perf_counter() - start)
+
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+def admission(endpoint_class: str) -> tp.Callable[..., tp.AsyncIterator[None]]:
+    """route dependency applying rate limit and concurrency cap of `endpoint_class`, see ENDPOINT_CLASSES"""
+    if endpoint_class not in ENDPOINT_CLASSES:
+        raise ValueError(f"Unknown endpoint class {endpoint_class}")
+
+    async def admit(user: User = Depends(get_current_user)) -> tp.AsyncIterator[None]:
+        if not ADMISSION_ENABLED:
+            yield
+            return
+
+        retry_after = await AdmissionController().take_token(endpoint_class, user.username)
+        if retry_after > 0:
+            record_admission_rejection(endpoint_class, "rate")
+            raise TooManyRequestsException(
+                retry_after=retry_after,
+                details="Rate limit exceeded",
+                user=user.username,
+                endpoint_class=endpoint_class,
+            )
+
+        async with AdmissionController().slot(endpoint_class):
+            yield
+
+    return admit
@@ -1,10 +1,13 @@
 import datetime
+import re
 import typing as tp
 
 from pydantic import Field
 
 from modules.routers.tcd.models import ProtocolStatus
 from modules.routers.passports.models import UnitStatus
+from ..exceptions import PaginationException
+from ..pagination import MAX_ITEMS_PER_PAGE, Pagination, decode_cursor
 from ..types import Filter
 
 
@@ -51,10 +54,32 @@ async def parse_tcd_filters(
         clear_filter["status"] = status
 
     if name:
-        clear_filter["name"] = name
+        if len(name) == 13 and name.isnumeric():
+            clear_filter["associated_unit_id"] = name
+        else:
+            clear_filter["name"] = {"$regex": re.escape(name), "$options": "i"}
 
     if date is not None:
         start, end = date.replace(hour=0, minute=0, second=0), date.replace(hour=23, minute=59, second=59)
         clear_filter["creation_time"] = {"$lt": end, "$gte": start}
 
     return clear_filter
+
+
+async def parse_pagination(page: int = 1, items: int = 20, cursor: tp.Optional[str] = None) -> Pagination:
+    """
+    Pagination parameters for listings. `items` is capped by $MAX_ITEMS_PER_PAGE.
+    If `cursor` (`next_cursor` from previous page) is given, `page` is ignored
+    """
+    if page < 1 or items < 1:
+        raise PaginationException(details="Both page and items must be positive")
+    items = min(items, MAX_ITEMS_PER_PAGE)
+
+    if cursor is None:
+        return Pagination(page=page, items=items)
+
+    try:
+        after, descending = decode_cursor(cursor)
+    except ValueError:
+        raise PaginationException(details=f"Malformed cursor {cursor}")
+    return Pagination(items=items, after=after, descending=descending)
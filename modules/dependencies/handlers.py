@@ -7,11 +7,12 @@ from ..database import MongoDbWrapper
 from ..exceptions import DatabaseException, ForbiddenActionException
 from modules.routers.tcd.models import Protocol, ProtocolData
 from ..models import User
+from ..permissions import Permission, user_permissions
 from .security import get_current_user
 
 
 async def handle_protocol(internal_id: str, protocol: Protocol, user: User = Depends(get_current_user)) -> ProtocolData:
-    if "approve" not in user.rule_set:
+    if Permission.approve not in user_permissions(user):
         raise ForbiddenActionException(
             details=f"You don't have access to process protocols. Your ruleset: {user.rule_set}"
         )
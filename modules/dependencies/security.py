@@ -1,12 +1,10 @@
-import os
 import typing as tp
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from loguru import logger
-from passlib.context import CryptContext
 
 from modules.database import MongoDbWrapper
 from modules.exceptions import CredentialsValidationException, ForbiddenActionException
@@ -16,32 +14,59 @@ from modules.routers.users.models import NewUser, UserWithPassword
 from modules.routers.service.models import TokenData
 
 from modules.models import User
-
-SECRET_KEY = os.environ.get("SECRET_KEY")
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
-ALGORITHM = "HS256"
+from modules.permissions import Permission, Projection, compile_projection, user_permissions
+from modules.tokens import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    InvalidTokenError,
+    TokenService,
+    TokenType,
+)
+
+if tp.TYPE_CHECKING:
+    from passlib.context import CryptContext
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+@lru_cache(maxsize=None)
+def get_password_context() -> "CryptContext":
+    """passlib with bcrypt backend is imported on first login, it is slow to import and only used for logins"""
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bool(pwd_context.verify(plain_password, hashed_password))
+    return bool(get_password_context().verify(plain_password, hashed_password))
 
 
 def get_password_hash(password: str) -> str:
-    return str(pwd_context.hash(password))
+    return str(get_password_context().hash(password))
 
 
 def create_access_token(
     data: tp.Dict[str, tp.Union[datetime, str]],
     expires_delta: timedelta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
 ) -> str:
-    to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
-    encoded_jwt: str = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return TokenService().encode(data, TokenType.access, expires_delta)
+
+
+def create_refresh_token(username: str) -> str:
+    """long living token to get new access tokens without password (and bcrypt) check"""
+    return TokenService().encode({"sub": username}, TokenType.refresh, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+
+async def refresh_access_token(refresh_token: str) -> str:
+    """issue new access token by refresh token, user must still exist"""
+    try:
+        username = TokenService().decode(refresh_token, TokenType.refresh).get("sub")
+    except InvalidTokenError as exception_message:
+        raise CredentialsValidationException(details="Invalid refresh token", error=exception_message)
+    user = await MongoDbWrapper().get_concrete_user_info(username=username) if username else None
+    if user is None:
+        raise CredentialsValidationException(details="Invalid refresh token")
+    return create_access_token(data={"sub": user.username})
 
 
 async def authenticate_user(username: str, password: str) -> tp.Optional[UserWithPassword]:
@@ -55,29 +80,42 @@ async def authenticate_user(username: str, password: str) -> tp.Optional[UserWit
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise CredentialsValidationException
-        token_data = TokenData(username=username)
-    except JWTError:
+        payload = TokenService().decode(token)
+    except InvalidTokenError:
+        raise CredentialsValidationException
+    username: tp.Optional[str] = payload.get("sub")
+    if username is None:
         raise CredentialsValidationException
-    user: tp.Optional[UserWithPassword] = await MongoDbWrapper().get_concrete_user(username=token_data.username)
+    token_data = TokenData(username=username)
+    user: tp.Optional[User] = await MongoDbWrapper().get_concrete_user_info(username=token_data.username)
     if user is None:
         raise CredentialsValidationException
-    return User(**dict(user))
+    return user
+
+
+async def get_permissions(user: User = Depends(get_current_user)) -> Permission:
+    return user_permissions(user)
 
 
-async def check_user_permissions(user: User = Depends(get_current_user)) -> None:
-    if "write" not in user.rule_set:
+async def check_user_permissions(permissions: Permission = Depends(get_permissions)) -> None:
+    if Permission.write not in permissions:
         raise ForbiddenActionException
 
 
-async def check_tcd_permissions(user: User = Depends(get_current_user)) -> None:
-    if "approve" not in user.rule_set:
+async def check_tcd_permissions(permissions: Permission = Depends(get_permissions)) -> None:
+    if Permission.approve not in permissions:
         raise ForbiddenActionException
 
 
+def field_projection(resource: str) -> tp.Callable[..., tp.Awaitable[tp.Optional[Projection]]]:
+    """route dependency: projection of `resource` fields current user may see (see modules/permissions.py)"""
+
+    async def projection(permissions: Permission = Depends(get_permissions)) -> tp.Optional[Projection]:
+        return compile_projection(resource, permissions)
+
+    return projection
+
+
 async def create_new_user(user: NewUser) -> UserWithPassword:
     """New user's creation and validation of credentials fields"""
     if len(user.password) < 8:
@@ -0,0 +1,97 @@
+import os
+import typing as tp
+
+from pymongo import UpdateOne
+
+from .routers.schemas.models import ProductionSchemaStage
+from .routers.stages.models import StageSummary
+
+# samples per bucket document: durations of a schema stage are bucketed by day, full buckets are continued in new ones
+DURATIONS_BUCKET_SIZE = int(os.environ.get("DURATIONS_BUCKET_SIZE", 500))
+
+Sample = tp.Dict[str, tp.Any]
+
+
+def duration_sample(
+    stage: tp.Dict[str, tp.Any], schema_stage: tp.Optional[ProductionSchemaStage]
+) -> tp.Optional[Sample]:
+    """
+    duration sample of completed stage (ProductionStage dict): stage id, session end time, duration in seconds,
+    employee and workplace of its schema stage. None if stage isn't completed or has no id or valid session times
+    """
+    if not stage.get("completed") or not stage.get("schema_stage_id") or not stage.get("id"):
+        return None
+    start = StageSummary.parse_session_time(stage.get("session_start_time"))
+    end = StageSummary.parse_session_time(stage.get("session_end_time"))
+    if start is None or end is None or end < start:
+        return None
+    return {
+        "ss": stage["schema_stage_id"],
+        "i": stage["id"],
+        "t": end,
+        "d": (end - start).total_seconds(),
+        "e": stage.get("employee_name"),
+        "w": schema_stage.workplace if schema_stage is not None else None,
+    }
+
+
+def bucket_operations(samples: tp.List[Sample]) -> tp.List[UpdateOne]:
+    """
+    upserts appending samples to daily buckets of their schema stages, one per sample. A sample is skipped by buckets
+    which have its stage id already, unique index on `samples.i` rejects it if other bucket has it (DuplicateKeyError),
+    so recording durations of a stage again (e.g. by backfill) doesn't count it twice
+    """
+    return [
+        UpdateOne(
+            {
+                "ss": sample["ss"],
+                "day": sample["t"].replace(hour=0, minute=0, second=0, microsecond=0),
+                "n": {"$lt": DURATIONS_BUCKET_SIZE},
+                "samples.i": {"$ne": sample["i"]},
+            },
+            {"$push": {"samples": {key: value for key, value in sample.items() if key != "ss"}}, "$inc": {"n": 1}},
+            upsert=True,
+        )
+        for sample in samples
+    ]
+
+
+def percentile(values: tp.List[float], q: float) -> tp.Optional[float]:
+    """q-th percentile (0..100) of sorted values with linear interpolation"""
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def duration_stats(durations: tp.List[float], expected: tp.Optional[float] = None) -> tp.Dict[str, tp.Any]:
+    """count, mean, min, max, percentiles of durations and number of them exceeding `expected` seconds"""
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "mean": sum(durations) / len(durations) if durations else None,
+        "min": durations[0] if durations else None,
+        "max": durations[-1] if durations else None,
+        **{f"p{q}": percentile(durations, q) for q in (50, 90, 95, 99)},
+        "slower_than_expected": sum(duration > expected for duration in durations) if expected else None,
+    }
+
+
+def find_anomalies(
+    samples: tp.List[Sample], expected: tp.Optional[float], factor: float
+) -> tp.List[tp.Tuple[Sample, float]]:
+    """
+    samples slower than `factor` times expected duration (or median of samples if no expectation is set),
+    each with the duration it is compared to, slowest first
+    """
+    baseline = expected or percentile(sorted(sample["d"] for sample in samples), 50)
+    if not baseline:
+        return []
+    threshold = baseline * factor
+    return sorted(
+        ((sample, baseline) for sample in samples if sample["d"] > threshold),
+        key=lambda anomaly: float(anomaly[0]["d"]),
+        reverse=True,
+    )
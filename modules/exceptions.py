@@ -1,3 +1,4 @@
+import math
 import typing as tp
 
 from fastapi import HTTPException, status
@@ -48,6 +49,39 @@ class IncorrectAddressException(HTTPException):
         logger.warning(f"{self.detail} : {kwargs}")
 
 
+class PaginationException(HTTPException):
+    """Exception caused by incorrect pagination parameters or malformed cursor"""
+
+    def __init__(self, **kwargs: tp.Any) -> None:
+        self.status_code = status.HTTP_400_BAD_REQUEST
+        self.detail = kwargs.get("details", None) or "Incorrect pagination parameters"
+        self.headers = {"WWW-Authenticate": "Bearer"}
+
+        logger.warning(f"{self.detail} : {kwargs}")
+
+
+class ConflictException(HTTPException):
+    """Exception caused by editing a document that was changed since it was read"""
+
+    def __init__(self, **kwargs: tp.Any) -> None:
+        self.status_code = status.HTTP_409_CONFLICT
+        self.detail = kwargs.get("details", None) or "Document was modified by another request"
+        self.headers = {"WWW-Authenticate": "Bearer"}
+
+        logger.warning(f"{self.detail} : {kwargs}")
+
+
+class TooManyRequestsException(HTTPException):
+    """Exception caused by exceeding request rate or concurrency limits"""
+
+    def __init__(self, retry_after: float = 1, **kwargs: tp.Any) -> None:
+        self.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        self.detail = kwargs.get("details", None) or "Too many requests, retry later"
+        self.headers = {"Retry-After": str(max(math.ceil(retry_after), 1))}
+
+        logger.warning(f"{self.detail} : {kwargs}")
+
+
 class ParserException(HTTPException):
     """Exception caused by parsing on non yaml-like file"""
 
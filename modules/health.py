@@ -0,0 +1,91 @@
+import asyncio
+import os
+import typing as tp
+
+from loguru import logger
+
+from .cacher import RedisCacher
+from .database import MongoDbWrapper
+from .prototypes import ProtocolPrototypes
+from .singleton import SingletonMeta
+from .spool import WriteSpool
+
+WARMUP_RETRY_INTERVAL = float(os.environ.get("WARMUP_RETRY_INTERVAL", 5))
+READINESS_TIMEOUT = float(os.environ.get("READINESS_TIMEOUT", 2))
+# rarely used dependencies (bcrypt, httpx, yaml) are imported on first use unless preloaded on warmup
+PRELOAD_DEPENDENCIES = os.environ.get("PRELOAD_DEPENDENCIES", "").lower() in ("1", "true", "yes")
+
+_warmed_up: bool = False
+
+
+def is_warmed_up() -> bool:
+    return _warmed_up
+
+
+def preload_dependencies() -> None:
+    """import deferred dependencies, so first login and first IPFS request don't wait for it"""
+    import httpx  # noqa: F401
+    import yaml  # noqa: F401
+
+    from .dependencies.security import get_password_context
+
+    get_password_context()
+
+
+async def warmup() -> None:
+    """
+    Create database and cache clients, check both respond, create unique indexes writes rely on and fill caches
+    (employees in redis, protocol prototypes in memory), so first requests of a fresh worker don't pay for it
+    """
+    global _warmed_up
+    database = MongoDbWrapper()
+    await database.ping()
+    await RedisCacher().ping()
+    await database.ensure_indexes()
+
+    employees = await database.get_all_employees()
+    await RedisCacher().cache_employees(employees)
+    prototypes = await ProtocolPrototypes().reload()
+    if PRELOAD_DEPENDENCIES:
+        preload_dependencies()
+    _warmed_up = True
+    logger.info(f"Worker {os.getpid()} warmed up: {len(employees)} employees, {prototypes} protocol prototypes cached")
+
+
+async def warmup_until_ready() -> None:
+    """retry warmup in background until database and cache become available"""
+    while not is_warmed_up():
+        try:
+            await warmup()
+        except Exception as exception_message:
+            logger.warning(f"Warmup failed, retrying in {WARMUP_RETRY_INTERVAL}s: {exception_message}")
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+
+
+async def _check(ping: tp.Callable[[], tp.Awaitable[None]]) -> bool:
+    try:
+        await asyncio.wait_for(ping(), timeout=READINESS_TIMEOUT)
+    except Exception as exception_message:
+        logger.warning(f"Readiness check failed: {exception_message}")
+        return False
+    return True
+
+
+async def check_readiness() -> tp.Dict[str, bool]:
+    """state of every readiness check: warmup is finished, database and cache respond"""
+    if not is_warmed_up():
+        # clients are created by warmup, don't try to connect before it
+        return {"warmup": False, "mongodb": False, "redis": False}
+    return {
+        "warmup": True,
+        "mongodb": await _check(MongoDbWrapper().ping),
+        "redis": await _check(RedisCacher().ping),
+    }
+
+
+def close_connections() -> None:
+    """close connection pools of clients created by this worker and write spool file"""
+    for client_class in (MongoDbWrapper, RedisCacher, WriteSpool):
+        client = SingletonMeta._instances.get(client_class)
+        if client is not None:
+            client.close()
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import typing as tp
+
+from loguru import logger
+
+from .database import MongoDbWrapper
+from .metrics import record_stages_flush
+from .singleton import SingletonMeta
+
+STAGES_BATCH_SIZE = int(os.environ.get("STAGES_BATCH_SIZE", 500))
+STAGES_FLUSH_INTERVAL = float(os.environ.get("STAGES_FLUSH_INTERVAL", 0.05))
+STAGES_FLUSH_CONCURRENCY = int(os.environ.get("STAGES_FLUSH_CONCURRENCY", 4))
+
+Pending = tp.Tuple[tp.Dict[str, tp.Any], "asyncio.Future[tp.Optional[str]]"]
+
+
+class StageIngestionBuffer(metaclass=SingletonMeta):
+    """
+    Write buffer for production stages pushed by workbenches.
+    Stages of concurrent requests are written together with a single insert_many: when $STAGES_BATCH_SIZE
+    stages are collected or $STAGES_FLUSH_INTERVAL seconds after the first of them.
+    Submitters are answered only after their stages are written with durable write concern
+    """
+
+    def __init__(self) -> None:
+        self._pending: tp.List[Pending] = []
+        self._timer: tp.Optional[asyncio.TimerHandle] = None
+        self._writes: tp.Set["asyncio.Future[None]"] = set()
+        self._semaphore: tp.Optional[asyncio.Semaphore] = None
+
+    async def submit(self, stages: tp.List[tp.Dict[str, tp.Any]]) -> tp.List[tp.Optional[str]]:
+        """
+        write stages, returns error for every stage: None if it was written, "duplicate" if stage with
+        the same id is already stored (so retries are safe) or error message
+        """
+        loop = asyncio.get_event_loop()
+        futures = []
+        for stage in stages:
+            future: "asyncio.Future[tp.Optional[str]]" = loop.create_future()
+            self._pending.append((stage, future))
+            futures.append(future)
+            if len(self._pending) >= STAGES_BATCH_SIZE:
+                self.flush()
+
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(STAGES_FLUSH_INTERVAL, self.flush)
+        return list(await asyncio.gather(*futures))
+
+    def flush(self) -> None:
+        """start writing all pending stages"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        write = asyncio.ensure_future(self._write(batch))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: tp.List[Pending]) -> None:
+        # created lazily, so it is bound to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(STAGES_FLUSH_CONCURRENCY)
+
+        async with self._semaphore:
+            try:
+                errors = await MongoDbWrapper().add_stages([stage for stage, _ in batch])
+            except Exception as exception_message:
+                logger.error(f"Failed to write {len(batch)} production stages: {exception_message}")
+                errors = [str(exception_message)] * len(batch)
+        record_stages_flush(errors)
+
+        for (_, future), error in zip(batch, errors):
+            # submitter may be gone (e.g. client disconnected), stage is written anyway
+            if not future.done():
+                future.set_result(error)
+
+    async def close(self) -> None:
+        """write pending stages and wait until all writes are finished"""
+        self.flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
@@ -0,0 +1,144 @@
+import copy
+import os
+import re
+import time
+import typing as tp
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from loguru import logger
+
+from .cacher import RedisCacher
+from .metrics import record_cache_lookup
+from .profiler import record_call
+from .singleton import SingletonMeta
+from .utils import load_yaml
+
+if tp.TYPE_CHECKING:
+    import httpx
+
+IPFS_TIMEOUT = float(os.environ.get("IPFS_TIMEOUT", 10))
+IPFS_CONNECT_TIMEOUT = float(os.environ.get("IPFS_CONNECT_TIMEOUT", 3))
+IPFS_MAX_CONNECTIONS = int(os.environ.get("IPFS_MAX_CONNECTIONS", 20))
+IPFS_CACHE_SIZE = int(os.environ.get("IPFS_CACHE_SIZE", 512))
+IPFS_CACHE_TTL = int(os.environ.get("IPFS_CACHE_TTL", 7 * 24 * 60 * 60))
+IPFS_GATEWAY = os.environ.get("IPFS_GATEWAY", "https://gateway.pinata.cloud/ipfs/")
+# only documents of these gateways (and their subdomains) are cached: any other host may serve anything under a CID
+IPFS_TRUSTED_GATEWAYS = {
+    host.strip().lower()
+    for host in os.environ.get("IPFS_TRUSTED_GATEWAYS", urlparse(IPFS_GATEWAY).hostname or "").split(",")
+    if host.strip()
+}
+
+# CIDv0 (base58btc, "Qm...") or CIDv1 (base32, "b...")
+CID_PATTERN = re.compile(r"\b(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{58,})\b")
+
+
+def is_trusted_gateway(link: str) -> bool:
+    """link is served over https by one of $IPFS_TRUSTED_GATEWAYS"""
+    parsed = urlparse(link)
+    host = (parsed.hostname or "").lower()
+    return parsed.scheme == "https" and any(
+        host == gateway or host.endswith(f".{gateway}") for gateway in IPFS_TRUSTED_GATEWAYS
+    )
+
+
+def extract_cid_path(link: str) -> tp.Optional[str]:
+    """
+    content address of the link: CID (either from path or subdomain gateway) with path inside of it.
+    Returns None for non-IPFS links and links of untrusted gateways, those are never cached
+    """
+    if not is_trusted_gateway(link):
+        return None
+    parsed = urlparse(link)
+    host_match = CID_PATTERN.search(parsed.netloc)
+    if host_match:
+        return host_match.group(1) + parsed.path.rstrip("/")
+    path_match = CID_PATTERN.search(parsed.path)
+    if path_match:
+        return parsed.path[path_match.start() :].rstrip("/")
+    return None
+
+
+class IpfsClient(metaclass=SingletonMeta):
+    """
+    Shared pooled HTTP client for IPFS gateways.
+    Documents are content addressed and immutable, so documents of trusted gateways are cached by CID:
+    in memory (LRU of $IPFS_CACHE_SIZE entries) and in Redis as a second tier (for $IPFS_CACHE_TTL seconds)
+    """
+
+    def __init__(self, client: tp.Optional["httpx.AsyncClient"] = None) -> None:
+        self._client: tp.Optional["httpx.AsyncClient"] = client
+        self._memory_cache: tp.OrderedDict[str, tp.Any] = OrderedDict()
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        """httpx is imported and connection pool is created on first request to IPFS"""
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(IPFS_TIMEOUT, connect=IPFS_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=IPFS_MAX_CONNECTIONS, max_keepalive_connections=IPFS_MAX_CONNECTIONS
+                ),
+            )
+        return self._client
+
+    def _remember(self, cid_path: str, document: tp.Any) -> None:
+        self._memory_cache[cid_path] = document
+        self._memory_cache.move_to_end(cid_path)
+        while len(self._memory_cache) > IPFS_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+
+    async def fetch(self, link: str) -> bytes:
+        """download raw document by link"""
+        start = time.perf_counter()
+        response = await self.client.get(link)
+        response.raise_for_status()
+        record_call("ipfs", urlparse(link).netloc, "get", time.perf_counter() - start, documents=1)
+        return response.content
+
+    async def get_document(self, link: str) -> tp.Any:
+        """download and parse YAML document stored in IPFS. Every call returns its own copy of cached document"""
+        cid_path = extract_cid_path(link)
+        if cid_path is None:
+            return await load_yaml(await self.fetch(link))
+
+        if cid_path in self._memory_cache:
+            record_cache_lookup("ipfs_memory", hit=True)
+            self._memory_cache.move_to_end(cid_path)
+            return copy.deepcopy(self._memory_cache[cid_path])
+        record_cache_lookup("ipfs_memory", hit=False)
+
+        raw_document = await self._get_from_redis(cid_path)
+        if raw_document is None:
+            raw_document = await self.fetch(link)
+            document = await load_yaml(raw_document)
+            await self._save_to_redis(cid_path, raw_document)
+        else:
+            document = await load_yaml(raw_document)
+
+        self._remember(cid_path, document)
+        return copy.deepcopy(document)
+
+    @staticmethod
+    async def _get_from_redis(cid_path: str) -> tp.Optional[bytes]:
+        try:
+            raw_document = await RedisCacher().get_raw(("ipfs", cid_path))
+        except Exception as exception_message:
+            logger.warning(f"IPFS redis cache is unavailable: {exception_message}")
+            return None
+        record_cache_lookup("ipfs_redis", hit=raw_document is not None)
+        return raw_document
+
+    @staticmethod
+    async def _save_to_redis(cid_path: str, raw_document: bytes) -> None:
+        try:
+            await RedisCacher().set_raw(("ipfs", cid_path), raw_document, ttl=IPFS_CACHE_TTL)
+        except Exception as exception_message:
+            logger.warning(f"Failed to cache IPFS document {cid_path} to redis: {exception_message}")
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
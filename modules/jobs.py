@@ -0,0 +1,166 @@
+import asyncio
+import os
+import socket
+import time
+import typing as tp
+from collections import OrderedDict
+from datetime import datetime
+
+from loguru import logger
+
+from .cacher import RedisCacher
+from .routers.jobs.models import Job, JobStatus
+from .singleton import SingletonMeta
+
+JOBS_REDIS_BACKEND = os.environ.get("JOBS_REDIS_BACKEND", "").lower() in ("1", "true", "yes")
+JOBS_HISTORY_SIZE = int(os.environ.get("JOBS_HISTORY_SIZE", 200))
+JOBS_REDIS_TTL = int(os.environ.get("JOBS_REDIS_TTL", 7 * 24 * 3600))
+JOBS_PROGRESS_INTERVAL = 1.0
+
+WORKER_NAME = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobContext:
+    """Handle passed to running job: progress reporting and cooperative cancellation checks"""
+
+    def __init__(self, scheduler: "JobScheduler", job: Job) -> None:
+        self.job = job
+        self._scheduler = scheduler
+        self._last_report = 0.0
+
+    async def report(self, processed: int, total: tp.Optional[int] = None, force: bool = False) -> None:
+        """update job progress. Persisted not more often than once in JOBS_PROGRESS_INTERVAL seconds"""
+        self.job.processed = processed
+        if total is not None:
+            self.job.total = total
+        if not force and time.monotonic() - self._last_report < JOBS_PROGRESS_INTERVAL:
+            return
+        self._last_report = time.monotonic()
+        await self._scheduler.save(self.job)
+        if await self._scheduler.is_cancel_requested(self.job.job_id):
+            raise asyncio.CancelledError()
+
+
+JobHandler = tp.Callable[..., tp.Awaitable[tp.Optional[tp.Dict[str, tp.Any]]]]
+
+
+class JobScheduler(metaclass=SingletonMeta):
+    """
+    In-process asyncio scheduler for heavy operations.
+    Every job type has its own concurrency limit. With $JOBS_REDIS_BACKEND enabled job states are mirrored to Redis,
+    so any worker process can report status of a job and request its cancellation
+    """
+
+    def __init__(self) -> None:
+        self._handlers: tp.Dict[str, JobHandler] = {}
+        self._semaphores: tp.Dict[str, asyncio.Semaphore] = {}
+        self._concurrency: tp.Dict[str, int] = {}
+        self._jobs: tp.OrderedDict[str, Job] = OrderedDict()
+        self._tasks: tp.Dict[str, "asyncio.Future[None]"] = {}
+
+    def register(self, job_type: str, handler: JobHandler, concurrency: int = 1) -> None:
+        """
+        register handler for job type. Handler is called as `handler(context, **params)`
+        and may return JSON-serializable result dict
+        """
+        self._handlers[job_type] = handler
+        self._concurrency[job_type] = int(os.environ.get(f"JOBS_CONCURRENCY_{job_type.upper()}", concurrency))
+
+    def _semaphore(self, job_type: str) -> asyncio.Semaphore:
+        # created lazily, so it is bound to the running event loop
+        if job_type not in self._semaphores:
+            self._semaphores[job_type] = asyncio.Semaphore(self._concurrency[job_type])
+        return self._semaphores[job_type]
+
+    async def submit(self, job_type: str, job_id: tp.Optional[str] = None, **params: tp.Any) -> Job:
+        """schedule job of registered type and return its initial state"""
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type {job_type}")
+        job = Job(job_type=job_type, params=params, **({"job_id": job_id} if job_id else {}))
+        await self.save(job)
+        if JOBS_REDIS_BACKEND:
+            await RedisCacher().push_to_list(("jobs", "recent"), job.job_id, JOBS_HISTORY_SIZE)
+
+        task = asyncio.ensure_future(self._run(job))
+        self._tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.job_id, None))
+        logger.info(f"Scheduled {job_type} job {job.job_id} with params {params}")
+        return job
+
+    async def _run(self, job: Job) -> None:
+        try:
+            async with self._semaphore(job.job_type):
+                job.status = JobStatus.running
+                job.start_time = datetime.now()
+                job.worker = WORKER_NAME
+                await self.save(job)
+                job.result = await self._handlers[job.job_type](JobContext(self, job), **job.params)
+                job.status = JobStatus.finished
+        except asyncio.CancelledError:
+            job.status = JobStatus.canceled
+            logger.warning(f"{job.job_type} job {job.job_id} canceled")
+        except Exception as exception_message:
+            job.status = JobStatus.failed
+            job.error = str(exception_message)
+            logger.error(f"{job.job_type} job {job.job_id} failed: {exception_message}")
+        finally:
+            job.finish_time = datetime.now()
+            await self.save(job)
+            logger.info(f"{job.job_type} job {job.job_id} {job.status.value}")
+
+    async def save(self, job: Job) -> None:
+        """save job state locally (and to redis, if enabled)"""
+        self._jobs[job.job_id] = job
+        self._jobs.move_to_end(job.job_id)
+        while len(self._jobs) > JOBS_HISTORY_SIZE:
+            self._jobs.popitem(last=False)
+        if JOBS_REDIS_BACKEND:
+            await RedisCacher().set_raw(("jobs", job.job_id), job.json(), ttl=JOBS_REDIS_TTL)
+
+    async def get(self, job_id: str) -> tp.Optional[Job]:
+        """get job state by id"""
+        if JOBS_REDIS_BACKEND:
+            raw_job = await RedisCacher().get_raw(("jobs", job_id))
+            return Job.parse_raw(raw_job) if raw_job else None
+        return self._jobs.get(job_id)
+
+    async def list(self, job_type: tp.Optional[str] = None, status: tp.Optional[JobStatus] = None) -> tp.List[Job]:
+        """list recent jobs, newest first"""
+        if JOBS_REDIS_BACKEND:
+            job_ids = [job_id.decode() for job_id in await RedisCacher().get_list(("jobs", "recent"))]
+            jobs = [job for job in [await self.get(job_id) for job_id in job_ids] if job is not None]
+        else:
+            jobs = list(reversed(self._jobs.values()))
+        return [
+            job
+            for job in jobs
+            if (job_type is None or job.job_type == job_type) and (status is None or job.status == status)
+        ]
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        cancel job. Local jobs are canceled immediately,
+        jobs of other workers are canceled on their next progress report (requires redis backend)
+        """
+        job = await self.get(job_id)
+        if job is None or job.status.is_final:
+            return False
+        if job_id in self._tasks:
+            self._tasks[job_id].cancel()
+        elif JOBS_REDIS_BACKEND:
+            await RedisCacher().set_raw(("jobs_cancel", job_id), "1", ttl=JOBS_REDIS_TTL)
+        else:
+            return False
+        return True
+
+    async def is_cancel_requested(self, job_id: str) -> bool:
+        if not JOBS_REDIS_BACKEND:
+            return False
+        return await RedisCacher().get_raw(("jobs_cancel", job_id)) is not None
+
+    async def shutdown(self) -> None:
+        """cancel all local jobs (on server shutdown)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
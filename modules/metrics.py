@@ -0,0 +1,248 @@
+import asyncio
+import inspect
+import os
+import time
+import typing as tp
+from contextvars import ContextVar
+from functools import wraps
+
+from fastapi import Request, Response
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+from modules.profiler import is_profiling, record_call
+
+REQUEST_LATENCY = Histogram(
+    "analytics_request_latency_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status_code"],
+)
+DB_OPERATIONS = Counter(
+    "analytics_db_operations_total",
+    "MongoDB operations by collection and method",
+    ["collection", "method"],
+)
+DB_ERRORS = Counter(
+    "analytics_db_errors_total",
+    "Failed MongoDB operations by collection and method",
+    ["collection", "method"],
+)
+DB_LATENCY = Histogram(
+    "analytics_db_operation_latency_seconds",
+    "MongoDB operation latency by collection and method",
+    ["collection", "method"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+CACHE_REQUESTS = Counter(
+    "analytics_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    ["cache", "result"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "analytics_single_flight_calls_total",
+    "Database read calls by method and whether they joined an identical in-flight query (coalesced) or ran it",
+    ["method", "result"],
+)
+ADMISSION_REJECTIONS = Counter(
+    "analytics_admission_rejections_total",
+    "Requests rejected with 429 by endpoint class and reason (rate/concurrency)",
+    ["endpoint_class", "reason"],
+)
+ADMISSION_QUEUE_TIME = Histogram(
+    "analytics_admission_queue_seconds",
+    "Time admitted requests waited for a free concurrency slot by endpoint class",
+    ["endpoint_class"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+STAGES_INGESTED = Counter(
+    "analytics_stages_ingested_total",
+    "Production stages submitted by workbenches by result (created/duplicate/failed)",
+    ["result"],
+)
+STAGES_FLUSH_SIZE = Histogram(
+    "analytics_stages_flush_size",
+    "Number of production stages written by a single insert_many of ingestion buffer",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+SPOOLED_WRITES = Counter(
+    "analytics_spooled_writes_total",
+    "Writes passed through local write spool by operation and result (spooled/ignored/replayed/duplicate/failed)",
+    ["operation", "result"],
+)
+# spool file is shared by workers, so all of them report the same values
+SPOOL_DEPTH = Gauge("analytics_write_spool_depth", "Writes waiting in spool for replay", multiprocess_mode="max")
+SPOOL_LAG = Gauge(
+    "analytics_write_spool_lag_seconds", "Age of the oldest write waiting in spool for replay", multiprocess_mode="max"
+)
+DOCUMENTS_PER_REQUEST = Histogram(
+    "analytics_documents_returned_per_request",
+    "Number of MongoDB documents fetched while serving a single request",
+    ["route"],
+    buckets=(0, 1, 5, 10, 20, 50, 100, 250, 500, 1000, 5000, 10000, 50000),
+)
+EVENT_LOOP_LAG = Gauge("analytics_event_loop_lag_seconds", "Latest measured event loop lag", multiprocess_mode="max")
+EVENT_LOOP_LAG_HISTOGRAM = Histogram(
+    "analytics_event_loop_lag_distribution_seconds",
+    "Distribution of measured event loop lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+_documents_fetched: ContextVar[tp.Optional[tp.List[int]]] = ContextVar("documents_fetched", default=None)
+
+F = tp.TypeVar("F", bound=tp.Callable[..., tp.Awaitable[tp.Any]])
+
+
+def _collection_name(args: tp.Tuple[tp.Any, ...], kwargs: tp.Dict[str, tp.Any]) -> str:
+    """extract collection name from wrapped database helper arguments"""
+    collection = args[0] if args else kwargs.get("collection_", kwargs.get("collection"))
+    return str(getattr(collection, "name", "unknown"))
+
+
+def _query_filter(arguments: tp.Dict[str, tp.Any]) -> tp.Dict[str, tp.Any]:
+    """extract query filter from wrapped database helper arguments"""
+    if isinstance(arguments.get("filter"), dict):
+        return tp.cast(tp.Dict[str, tp.Any], arguments["filter"])
+    if "key" in arguments:
+        return {arguments["key"]: arguments.get("value")}
+    return {}
+
+
+def _count_documents(result: tp.Any) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(getattr(result, "data", None), list):
+        return len(result.data)
+    return 1
+
+
+def track_documents(count: int) -> None:
+    """add fetched documents count to the current request counter (if any)"""
+    counter = _documents_fetched.get()
+    if counter is not None:
+        counter[0] += count
+
+
+def instrument_query(method: str, returns_documents: bool = False) -> tp.Callable[[F], F]:
+    """
+    Decorator for MongoDbWrapper low-level helpers.
+    Measures operation latency per collection and method, counts errors and fetched documents
+    """
+
+    def decorator(func: F) -> F:
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        async def wrapper(*args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+            collection = _collection_name(args, kwargs)
+            DB_OPERATIONS.labels(collection, method).inc()
+            start = time.perf_counter()
+            documents = 0
+            try:
+                result = await func(*args, **kwargs)
+                if returns_documents:
+                    documents = _count_documents(result)
+                    track_documents(documents)
+                return result
+            except Exception as exception_message:
+                DB_ERRORS.labels(collection, method).inc()
+                logger.error(
+                    f"MongoDB {method} on '{collection}' failed after {time.perf_counter() - start:.3f}s: "
+                    f"{exception_message}"
+                )
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                DB_LATENCY.labels(collection, method).observe(elapsed)
+                if is_profiling():
+                    arguments = signature.bind_partial(*args, **kwargs).arguments
+                    record_call("mongodb", collection, method, elapsed, _query_filter(arguments), documents)
+
+        return tp.cast(F, wrapper)
+
+    return decorator
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_coalesced_call(method: str, coalesced: bool) -> None:
+    SINGLE_FLIGHT_CALLS.labels(method, "coalesced" if coalesced else "executed").inc()
+
+
+def record_admission_rejection(endpoint_class: str, reason: str) -> None:
+    ADMISSION_REJECTIONS.labels(endpoint_class, reason).inc()
+
+
+def record_admission_wait(endpoint_class: str, seconds: float) -> None:
+    ADMISSION_QUEUE_TIME.labels(endpoint_class).observe(seconds)
+
+
+def record_stages_flush(errors: tp.List[tp.Optional[str]]) -> None:
+    STAGES_FLUSH_SIZE.observe(len(errors))
+    for error in errors:
+        STAGES_INGESTED.labels("created" if error is None else "duplicate" if error == "duplicate" else "failed").inc()
+
+
+def record_spooled_write(operation: str, result: str) -> None:
+    SPOOLED_WRITES.labels(operation, result).inc()
+
+
+def set_spool_state(depth: int, lag: float) -> None:
+    SPOOL_DEPTH.set(depth)
+    SPOOL_LAG.set(lag)
+
+
+def _route_template(request: Request) -> str:
+    """resolve route path template (e.g. /api/v1/passports/{internal_id}) to keep labels cardinality low"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return str(getattr(route, "path", "unknown"))
+    return "unmatched"
+
+
+async def metrics_middleware(request: Request, call_next: tp.Callable[[Request], tp.Awaitable[Response]]) -> Response:
+    """Middleware to collect per-route latency and fetched documents count"""
+    route = _route_template(request)
+    token = _documents_fetched.set([0])
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUEST_LATENCY.labels(request.method, route, str(status_code)).observe(time.perf_counter() - start)
+        counter = _documents_fetched.get()
+        if counter is not None:
+            DOCUMENTS_PER_REQUEST.labels(route).observe(counter[0])
+        _documents_fetched.reset(token)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Periodically measure how late the event loop wakes up a sleeping coroutine"""
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+def render_metrics() -> Response:
+    """
+    Render metrics of this process or, when running several workers with $PROMETHEUS_MULTIPROC_DIR set,
+    aggregated metrics of all of them
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,35 @@
+import os
+import typing as tp
+
+from .database import MongoDbWrapper
+from .jobs import JobContext, JobScheduler
+from .routers.jobs.models import Job
+
+STAGES_MIGRATION_BATCH_SIZE = int(os.environ.get("STAGES_MIGRATION_BATCH_SIZE", 1000))
+
+
+async def _migrate_stages_job(
+    context: JobContext, batch_size: int = STAGES_MIGRATION_BATCH_SIZE
+) -> tp.Dict[str, tp.Any]:
+    database = MongoDbWrapper()
+    total = await database.count_legacy_stages() + await database.count_legacy_stages(archived=True)
+    await context.report(0, total, force=True)
+
+    migrated = {"stages": 0, "archived_stages": 0}
+    for archived in (False, True):
+        key = "archived_stages" if archived else "stages"
+        while True:
+            processed = await database.migrate_stages(limit=batch_size, archived=archived)
+            if not processed:
+                break
+            migrated[key] += processed
+            await context.report(migrated["stages"] + migrated["archived_stages"])
+    return {f"migrated_{key}": value for key, value in migrated.items()}
+
+
+JobScheduler().register("migrate_stages", _migrate_stages_job, concurrency=1)
+
+
+async def start_stages_migration(batch_size: int = STAGES_MIGRATION_BATCH_SIZE) -> Job:
+    """schedule conversion of production stages stored in legacy format to compact one"""
+    return await JobScheduler().submit("migrate_stages", batch_size=batch_size)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import typing as tp
+from datetime import datetime
 
 from pydantic import BaseModel
 
@@ -9,3 +10,33 @@ class User(BaseModel):
     username: str
     rule_set: tp.List[str] = ["read"]
     associated_employee: tp.Optional[str]
+
+
+class TracedCall(BaseModel):
+    kind: str
+    collection: str
+    method: str
+    filter_shape: tp.Dict[str, tp.Any] = {}
+    duration_ms: float
+    documents: int = 0
+
+
+class TracedCallGroup(BaseModel):
+    kind: str
+    collection: str
+    method: str
+    filter_shape: tp.Dict[str, tp.Any] = {}
+    calls: int
+    total_duration_ms: float
+
+
+class SlowRequest(BaseModel):
+    method: str
+    path: str
+    query: str
+    status_code: int
+    started_at: datetime
+    duration_ms: float
+    calls: tp.List[TracedCall]
+    call_groups: tp.List[TracedCallGroup]
+    profile: tp.Optional[str] = None
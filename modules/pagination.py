@@ -0,0 +1,43 @@
+import base64
+import binascii
+import json
+import os
+import typing as tp
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+MAX_ITEMS_PER_PAGE = int(os.environ.get("MAX_ITEMS_PER_PAGE", 100))
+
+
+class Pagination(tp.NamedTuple):
+    """
+    Parsed listing pagination options.
+    If `after` is set, keyset pagination is used (documents after given `_id`), otherwise `page` is skipped
+    """
+
+    page: int = 1
+    items: int = 20
+    after: tp.Optional[ObjectId] = None
+    descending: bool = False
+
+
+class Page(tp.NamedTuple):
+    data: tp.List[tp.Any]
+    next_cursor: tp.Optional[str]
+
+
+def encode_cursor(last_id: ObjectId, descending: bool = False) -> str:
+    """opaque cursor token pointing right after the document with given `_id`"""
+    payload = json.dumps({"id": str(last_id), "desc": descending}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tp.Tuple[ObjectId, bool]:
+    """decode cursor token into keyset `_id` and sorting direction"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return ObjectId(payload["id"]), bool(payload.get("desc", False))
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError(f"Invalid cursor {cursor}")
@@ -0,0 +1,60 @@
+import typing as tp
+
+VERSION_FIELD = "_version"
+PATCH_RETRIES = 3
+
+UpdateOperators = tp.Dict[str, tp.Dict[str, tp.Any]]
+
+
+class VersionConflictError(Exception):
+    """document was changed by someone else since its version was read"""
+
+
+def _is_path_safe(document: tp.Dict[str, tp.Any]) -> bool:
+    """keys of free-form dicts (e.g. additional_info) can't always be used in dotted update paths"""
+    return all(isinstance(key, str) and key and "." not in key and not key.startswith("$") for key in document)
+
+
+def _diff_value(path: str, stored: tp.Any, new: tp.Any, operators: UpdateOperators) -> None:
+    if stored == new:
+        return
+
+    if isinstance(stored, dict) and isinstance(new, dict) and _is_path_safe(stored) and _is_path_safe(new):
+        for key in stored.keys() - new.keys():
+            operators.setdefault("$unset", {})[f"{path}.{key}"] = ""
+        for key, value in new.items():
+            if key in stored:
+                _diff_value(f"{path}.{key}", stored[key], value, operators)
+            else:
+                operators.setdefault("$set", {})[f"{path}.{key}"] = value
+        return
+
+    if isinstance(stored, list) and isinstance(new, list):
+        if len(new) > len(stored) and new[: len(stored)] == stored:
+            operators.setdefault("$push", {})[path] = {"$each": new[len(stored) :]}
+            return
+        if len(new) == len(stored):
+            for index, (stored_item, new_item) in enumerate(zip(stored, new)):
+                _diff_value(f"{path}.{index}", stored_item, new_item, operators)
+            return
+
+    operators.setdefault("$set", {})[path] = new
+
+
+def diff_documents(
+    stored: tp.Dict[str, tp.Any], new: tp.Dict[str, tp.Any], exclude: tp.Optional[tp.Set[str]] = None
+) -> UpdateOperators:
+    """
+    Minimal update operators turning `stored` document into `new` one.
+    Only top-level fields present in `new` are compared, nested dicts and same-length lists are diffed
+    recursively, appends to lists become $push. Returns empty dict if nothing changed
+    """
+    operators: UpdateOperators = {}
+    for key, value in new.items():
+        if (exclude and key in exclude) or key in ("_id", VERSION_FIELD):
+            continue
+        if key not in stored:
+            operators.setdefault("$set", {})[key] = value
+        else:
+            _diff_value(key, stored[key], value, operators)
+    return operators
@@ -0,0 +1,62 @@
+import enum
+import typing as tp
+from functools import lru_cache
+
+from loguru import logger
+
+from .models import User
+
+Projection = tp.Dict[str, int]
+
+
+class Permission(enum.IntFlag):
+    """user's rule set compiled into bitmask, so permission check is a single bit test"""
+
+    none = 0
+    read = 1
+    write = 2
+    approve = 4
+
+
+# resource -> fields returned only to users having given permission. Large or sensitive fields go here
+FIELD_PERMISSIONS: tp.Dict[str, tp.Dict[str, Permission]] = {
+    "stages": {"additional_info": Permission.write, "video_hashes": Permission.write},
+}
+# resource -> fields never returned by regular reads
+HIDDEN_FIELDS: tp.Dict[str, tp.Tuple[str, ...]] = {
+    "users": ("hashed_password",),
+}
+
+
+@lru_cache(maxsize=1024)
+def compile_rule_set(rule_set: tp.Tuple[str, ...]) -> Permission:
+    """bitmask of rule set, unknown rules are ignored"""
+    permissions = Permission.none
+    for rule in rule_set:
+        if rule not in Permission.__members__:
+            logger.warning(f"Unknown rule {rule} in rule set {rule_set}")
+            continue
+        permissions |= Permission[rule]
+    return permissions
+
+
+def user_permissions(user: User) -> Permission:
+    return compile_rule_set(tuple(user.rule_set))
+
+
+@lru_cache(maxsize=None)
+def _compile_projection(resource: str, permissions: Permission) -> tp.Tuple[str, ...]:
+    excluded = list(HIDDEN_FIELDS.get(resource, ()))
+    for field, required in FIELD_PERMISSIONS.get(resource, {}).items():
+        if required not in permissions:
+            excluded.append(field)
+    return tuple(excluded)
+
+
+def compile_projection(resource: str, permissions: Permission) -> tp.Optional[Projection]:
+    """
+    MongoDB projection excluding fields of `resource` hidden from user with `permissions`,
+    so they are not even fetched from database. None if nothing is excluded
+    """
+    excluded = _compile_projection(resource, permissions)
+    return {field: 0 for field in excluded} if excluded else None
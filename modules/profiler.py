@@ -0,0 +1,174 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+import typing as tp
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from fastapi import Request, Response
+from loguru import logger
+
+from .models import SlowRequest, TracedCall, TracedCallGroup
+
+PROFILE_HEADER = "X-Profile"
+PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE", 0))
+PROFILER_SLOW_THRESHOLD_MS = float(os.environ.get("PROFILER_SLOW_THRESHOLD_MS", 1000))
+PROFILER_BUFFER_SIZE = int(os.environ.get("PROFILER_BUFFER_SIZE", 50))
+PROFILER_TOP_FUNCTIONS = 25
+
+_current_trace: ContextVar[tp.Optional[tp.List[TracedCall]]] = ContextVar("current_trace", default=None)
+slow_requests: tp.Deque[SlowRequest] = deque(maxlen=PROFILER_BUFFER_SIZE)
+
+try:
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:
+    _Pyinstrument = None
+
+
+def filter_shape(filter: tp.Any) -> tp.Any:
+    """replace concrete values in query filter by their types, keeping keys and operators"""
+    if isinstance(filter, dict):
+        return {key: filter_shape(value) for key, value in filter.items()}
+    return type(filter).__name__
+
+
+def is_profiling() -> bool:
+    return _current_trace.get() is not None
+
+
+def record_call(
+    kind: str,
+    collection: str,
+    method: str,
+    duration: float,
+    filter: tp.Optional[tp.Dict[str, tp.Any]] = None,
+    documents: int = 0,
+) -> None:
+    """save database or cache call into the current request trace (if request is being profiled)"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace.append(
+        TracedCall(
+            kind=kind,
+            collection=collection,
+            method=method,
+            filter_shape=filter_shape(filter or {}),
+            duration_ms=round(duration * 1000, 3),
+            documents=documents,
+        )
+    )
+
+
+def _group_calls(calls: tp.List[TracedCall]) -> tp.List[TracedCallGroup]:
+    """group identical query shapes, so N+1 patterns are visible at a glance"""
+    groups: tp.Dict[str, TracedCallGroup] = {}
+    for call in calls:
+        key = repr((call.kind, call.collection, call.method, call.filter_shape))
+        if key not in groups:
+            groups[key] = TracedCallGroup(
+                kind=call.kind,
+                collection=call.collection,
+                method=call.method,
+                filter_shape=call.filter_shape,
+                calls=0,
+                total_duration_ms=0,
+            )
+        groups[key].calls += 1
+        groups[key].total_duration_ms = round(groups[key].total_duration_ms + call.duration_ms, 3)
+    return sorted(groups.values(), key=lambda group: group.calls, reverse=True)
+
+
+def _should_profile(request: Request) -> bool:
+    if request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    return PROFILER_SAMPLE_RATE > 0 and random.random() < PROFILER_SAMPLE_RATE
+
+
+class _CodeProfiler:
+    """
+    pyinstrument (if installed) or cProfile wrapper.
+    cProfile is thread-wide: only one request is profiled by it at a time (profile of overlapping ones is skipped),
+    and its summary may still include coroutines of concurrent requests which aren't profiled
+    """
+
+    _thread_profiler_busy = False
+
+    def __init__(self) -> None:
+        self._profiler: tp.Any = None
+        if _Pyinstrument:
+            self._profiler = _Pyinstrument(async_mode="enabled")
+        elif not _CodeProfiler._thread_profiler_busy:
+            self._profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        if self._profiler is None:
+            return
+        if _Pyinstrument:
+            self._profiler.start()
+            return
+        _CodeProfiler._thread_profiler_busy = True
+        self._profiler.enable()
+
+    def stop(self) -> None:
+        if self._profiler is None:
+            return
+        if _Pyinstrument:
+            self._profiler.stop()
+            return
+        self._profiler.disable()
+        _CodeProfiler._thread_profiler_busy = False
+
+    def summary(self) -> tp.Optional[str]:
+        if self._profiler is None:
+            return "profile skipped: another request was being profiled (install pyinstrument to profile concurrently)"
+        if _Pyinstrument:
+            return str(self._profiler.output_text(unicode=False, color=False))
+        stream = io.StringIO()
+        stream.write("cProfile profile is thread-wide, it may include concurrent requests\n")
+        pstats.Stats(self._profiler, stream=stream).sort_stats("cumulative").print_stats(PROFILER_TOP_FUNCTIONS)
+        return stream.getvalue()
+
+
+async def profiling_middleware(request: Request, call_next: tp.Callable[[Request], tp.Awaitable[Response]]) -> Response:
+    """
+    Opt-in request profiler. Enabled by `X-Profile: 1` header or by $PROFILER_SAMPLE_RATE.
+    Requests slower than $PROFILER_SLOW_THRESHOLD_MS are saved to the slow requests ring buffer
+    """
+    if not _should_profile(request):
+        return await call_next(request)
+
+    trace: tp.List[TracedCall] = []
+    token = _current_trace.set(trace)
+    profiler = _CodeProfiler()
+    started_at = datetime.now()
+    start = time.perf_counter()
+    status_code = 500
+    profiler.start()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        profiler.stop()
+        duration_ms = (time.perf_counter() - start) * 1000
+        _current_trace.reset(token)
+        if duration_ms >= PROFILER_SLOW_THRESHOLD_MS:
+            logger.warning(f"Slow request {request.method} {request.url.path}: {duration_ms:.0f}ms, {len(trace)} calls")
+            slow_requests.append(
+                SlowRequest(
+                    method=request.method,
+                    path=request.url.path,
+                    query=request.url.query,
+                    status_code=status_code,
+                    started_at=started_at,
+                    duration_ms=round(duration_ms, 3),
+                    calls=trace,
+                    call_groups=_group_calls(trace),
+                    profile=profiler.summary(),
+                )
+            )
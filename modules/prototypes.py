@@ -0,0 +1,65 @@
+import asyncio
+import os
+import time
+import typing as tp
+
+from loguru import logger
+
+from .database import MongoDbWrapper
+from .metrics import record_cache_lookup
+from .routers.tcd.models import Protocol
+from .singleton import SingletonMeta
+
+PROTOTYPES_CACHE_TTL = float(os.environ.get("PROTOTYPES_CACHE_TTL", 600))
+
+
+class ProtocolPrototypes(metaclass=SingletonMeta):
+    """
+    In-memory catalog of protocol prototypes (empty protocol templates).
+    Whole collection is loaded at once and indexed by `associated_with_schema_id` and `protocol_schema_id`.
+    It is reloaded after $PROTOTYPES_CACHE_TTL seconds or on explicit invalidation (per worker process)
+    """
+
+    def __init__(self) -> None:
+        self._by_schema_id: tp.Dict[str, Protocol] = {}
+        self._by_protocol_schema_id: tp.Dict[str, Protocol] = {}
+        self._expires_at: float = 0.0
+        self._lock: tp.Optional[asyncio.Lock] = None
+
+    async def reload(self) -> int:
+        """load all prototypes from database, returns their number"""
+        prototypes = await MongoDbWrapper().get_all_protocol_prototypes()
+        self._by_schema_id = {prototype.associated_with_schema_id: prototype for prototype in prototypes}
+        self._by_protocol_schema_id = {prototype.protocol_schema_id: prototype for prototype in prototypes}
+        self._expires_at = time.monotonic() + PROTOTYPES_CACHE_TTL
+        logger.info(f"Loaded {len(prototypes)} protocol prototypes")
+        return len(prototypes)
+
+    def invalidate(self) -> None:
+        """force reload on next lookup"""
+        self._expires_at = 0.0
+
+    async def _ensure_loaded(self) -> None:
+        if self._expires_at > time.monotonic():
+            record_cache_lookup("protocol_prototypes", hit=True)
+            return
+        record_cache_lookup("protocol_prototypes", hit=False)
+
+        # created lazily, so it is bound to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._expires_at <= time.monotonic():
+                await self.reload()
+
+    async def get_by_schema_id(self, associated_with_schema_id: str) -> tp.Optional[Protocol]:
+        """protocol prototype for units of given schema. Returns a copy, so it is safe to fill it"""
+        await self._ensure_loaded()
+        prototype = self._by_schema_id.get(associated_with_schema_id)
+        return prototype.copy(deep=True) if prototype is not None else None
+
+    async def get_by_protocol_schema_id(self, protocol_schema_id: str) -> tp.Optional[Protocol]:
+        """protocol prototype by its own schema id. Returns a copy, so it is safe to fill it"""
+        await self._ensure_loaded()
+        prototype = self._by_protocol_schema_id.get(protocol_schema_id)
+        return prototype.copy(deep=True) if prototype is not None else None
@@ -1,7 +1,23 @@
-from .employees.router import router as employees_router
-from .passports.router import router as passports_router
-from .tcd.router import router as tcd_router
-from .users.router import router as users_router
-from .stages.router import router as stages_router
-from .service.router import router as service_router
-from .schemas.router import router as schemas_router
+import importlib
+
+from fastapi import APIRouter
+
+# routers are resolved lazily: database layer imports routers' models, and routers import the database layer
+_ROUTERS = {
+    "employees_router": "employees",
+    "passports_router": "passports",
+    "tcd_router": "tcd",
+    "users_router": "users",
+    "stages_router": "stages",
+    "service_router": "service",
+    "schemas_router": "schemas",
+    "validation_router": "validation",
+    "jobs_router": "jobs",
+}
+
+
+def __getattr__(name: str) -> APIRouter:
+    if name not in _ROUTERS:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    router: APIRouter = getattr(importlib.import_module(f".{_ROUTERS[name]}.router", __name__), "router")
+    return router
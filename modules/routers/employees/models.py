@@ -29,8 +29,9 @@ class EncodedEmployee(BaseModel):
 
 
 class EmployeesOut(GenericResponse):
-    count: int
+    count: tp.Optional[int]
     data: tp.Optional[tp.List[Employee]]
+    next_cursor: tp.Optional[str] = None
 
 
 class EmployeeOut(GenericResponse):
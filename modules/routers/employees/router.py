@@ -1,23 +1,32 @@
 import typing as tp
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
 
 from ...database import MongoDbWrapper
+from ...dependencies.filters import parse_pagination
 from ...dependencies.security import check_user_permissions, get_current_user
-from ...exceptions import DatabaseException
+from ...exceptions import ConflictException, DatabaseException
+from ...pagination import Pagination
+from ...patches import VersionConflictError
 from .models import Employee, EmployeeOut, EmployeesOut, EncodedEmployee, GenericResponse
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.get("/", response_model=tp.Union[EmployeesOut, GenericResponse])  # type:ignore
-async def get_all_employees(page: int = 1, items: int = 20) -> EmployeesOut:
+async def get_all_employees(
+    pagination: Pagination = Depends(parse_pagination), with_count: bool = True
+) -> EmployeesOut:
     """
     Endpoint to get list of all employees from :start: to :limit:. By default, from 0 to 20.
+    Pass `next_cursor` from response as `cursor` to get the next page.
     """
-    employees = await MongoDbWrapper().get_all_employees()
-    documents_count = await MongoDbWrapper().count_employees()
-    return EmployeesOut(count=documents_count, data=employees[(page - 1) * items : page * items])
+    try:
+        employees = await MongoDbWrapper().get_employees_page(pagination)
+        documents_count = await MongoDbWrapper().count_employees() if with_count else None
+    except Exception as exception_message:
+        raise DatabaseException(error=exception_message)
+    return EmployeesOut(count=documents_count, data=employees.data, next_cursor=employees.next_cursor)
 
 
 @router.post("/", dependencies=[Depends(check_user_permissions)], response_model=GenericResponse)
@@ -53,12 +62,22 @@ async def get_employee_by_card_id(rfid_card_id: str) -> tp.Union[EmployeeOut, Ge
 
 
 @router.patch("/{rfid_card_id}", response_model=GenericResponse)
-async def patch_employee(rfid_card_id: str, new_data: Employee) -> GenericResponse:
-    """Endpoint to edit employees."""
+async def patch_employee(
+    rfid_card_id: str, new_data: Employee, response: Response, if_match: tp.Optional[int] = Header(None)
+) -> GenericResponse:
+    """
+    Endpoint to edit employees.
+    Pass `ETag` of previous edit as `If-Match` header to fail with 409 if employee was changed since then
+    """
     try:
-        await MongoDbWrapper().edit_employee(rfid_card_id=rfid_card_id, new_employee_data=new_data)
+        version = await MongoDbWrapper().edit_employee(
+            rfid_card_id=rfid_card_id, new_employee_data=new_data, expected_version=if_match
+        )
+    except VersionConflictError as exception_message:
+        raise ConflictException(details=str(exception_message))
     except Exception as exception_message:
         raise DatabaseException(error=exception_message)
+    response.headers["ETag"] = str(version)
     return GenericResponse(detail="Successfully patched employee")
 
 
@@ -0,0 +1,46 @@
+import typing as tp
+from datetime import datetime
+from enum import Enum
+from uuid import uuid4
+
+from pydantic import BaseModel, Field
+
+
+class GenericResponse(BaseModel):
+    status_code: int = 200
+    detail: str = "Success"
+
+
+class JobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    finished = "finished"
+    failed = "failed"
+    canceled = "canceled"
+
+    @property
+    def is_final(self) -> bool:
+        return self in (JobStatus.finished, JobStatus.failed, JobStatus.canceled)
+
+
+class Job(BaseModel):
+    job_id: str = Field(default_factory=lambda: uuid4().hex)
+    job_type: str
+    status: JobStatus = JobStatus.pending
+    params: tp.Dict[str, tp.Any] = {}
+    processed: int = 0
+    total: tp.Optional[int] = None
+    result: tp.Optional[tp.Dict[str, tp.Any]] = None
+    error: tp.Optional[str] = None
+    worker: tp.Optional[str] = None
+    creation_time: datetime = Field(default_factory=datetime.now)
+    start_time: tp.Optional[datetime] = None
+    finish_time: tp.Optional[datetime] = None
+
+
+class JobOut(GenericResponse):
+    job: tp.Optional[Job]
+
+
+class JobsOut(GenericResponse):
+    data: tp.List[Job]
@@ -0,0 +1,32 @@
+import typing as tp
+
+from fastapi import APIRouter, Depends
+
+from ...dependencies.security import check_user_permissions, get_current_user
+from ...jobs import JobScheduler
+from .models import GenericResponse, JobOut, JobsOut, JobStatus
+
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+@router.get("/", response_model=JobsOut)
+async def get_jobs(job_type: tp.Optional[str] = None, status: tp.Optional[JobStatus] = None) -> JobsOut:
+    """Endpoint to get list of recent background jobs, newest first"""
+    return JobsOut(data=await JobScheduler().list(job_type=job_type, status=status))
+
+
+@router.get("/{job_id}", response_model=tp.Union[JobOut, GenericResponse])  # type:ignore
+async def get_job(job_id: str) -> tp.Union[JobOut, GenericResponse]:
+    """Endpoint to get background job status and progress"""
+    job = await JobScheduler().get(job_id)
+    if job is None:
+        return GenericResponse(status_code=404, detail="Not found")
+    return JobOut(job=job)
+
+
+@router.delete("/{job_id}", dependencies=[Depends(check_user_permissions)], response_model=GenericResponse)
+async def cancel_job(job_id: str) -> GenericResponse:
+    """Endpoint to cancel pending or running background job"""
+    if not await JobScheduler().cancel(job_id):
+        return GenericResponse(status_code=404, detail="No active job found")
+    return GenericResponse(detail="Job cancellation requested")
@@ -5,7 +5,7 @@ from enum import Enum
 
 from pydantic import BaseModel, Field
 
-from ..stages.models import ProductionStageData
+from ..stages.models import ProductionStageData, StageSummary
 
 
 class GenericResponse(BaseModel):
@@ -38,17 +38,43 @@ class Passport(BaseModel):
     serial_number: tp.Optional[str] = None
     status: tp.Optional[UnitStatus] = None
     txn_hash: tp.Optional[str] = None
+    stage_summary: tp.Optional[StageSummary] = None
 
 
 class PassportsOut(GenericResponse):
-    count: int
+    count: tp.Optional[int]
+    count_is_lower_bound: bool = False
     data: tp.List[Passport]
+    next_cursor: tp.Optional[str] = None
 
 
 class PassportOut(GenericResponse):
     passport: tp.Optional[Passport]
 
 
+class DeletionOut(GenericResponse):
+    job_id: tp.Optional[str] = None
+
+
+class UnitTreeNode(BaseModel):
+    internal_id: str
+    uuid: tp.Optional[str] = None
+    model: tp.Optional[str] = None
+    serial_number: tp.Optional[str] = None
+    status: tp.Optional[UnitStatus] = None
+    depth: int = 0
+    statuses_rollup: tp.Dict[str, int] = {}
+    components: tp.List["UnitTreeNode"] = []
+
+
+UnitTreeNode.update_forward_refs()
+
+
+class UnitTreeOut(GenericResponse):
+    ancestors: tp.List[str] = []
+    tree: tp.Optional[UnitTreeNode] = None
+
+
 class TypesOut(GenericResponse):
     data: tp.List[str]
 
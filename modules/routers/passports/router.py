@@ -1,39 +1,72 @@
+import asyncio
 import typing as tp
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
 from loguru import logger
 
 from modules.dependencies.handlers import check_passport
 
 from ...database import MongoDbWrapper
-from ...dependencies.filters import parse_passports_filter
-from ...dependencies.security import check_user_permissions, get_current_employee, get_current_user
-from ...exceptions import DatabaseException
+from ...dependencies.admission import admission
+from ...dependencies.filters import parse_pagination, parse_passports_filter
+from ...dependencies.security import check_user_permissions, field_projection, get_current_employee, get_current_user
+from ...exceptions import ConflictException, DatabaseException
+from ...jobs import JobContext, JobScheduler
+from ...pagination import Pagination
+from ...patches import VersionConflictError
+from ...permissions import Projection
+from ...tree import build_tree
 from ...types import Filter
 from ..employees.models import Employee
-from .models import GenericResponse, OrderBy, Passport, PassportOut, PassportsOut, TypesOut
+from .models import (
+    DeletionOut,
+    GenericResponse,
+    OrderBy,
+    Passport,
+    PassportOut,
+    PassportsOut,
+    TypesOut,
+    UnitTreeOut,
+)
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
-@router.get("/", response_model=tp.Union[PassportsOut, GenericResponse])  # type:ignore
+async def _no_count() -> None:
+    return None
+
+
+@router.get(
+    "/",
+    dependencies=[Depends(admission("listing"))],
+    response_model=tp.Union[PassportsOut, GenericResponse],  # type:ignore
+)
 async def get_all_passports(
-    page: int = 1,
-    items: int = 20,
+    pagination: Pagination = Depends(parse_pagination),
     sort_by_date: OrderBy = OrderBy.ascending,
+    with_count: bool = True,
+    count_limit: tp.Optional[int] = None,
+    archived: bool = False,
     filters: Filter = Depends(parse_passports_filter),
 ) -> PassportsOut:
     """
     Endpoint to get list of all issued units from :start: to :limit:. By default, from 0 to 20.
+    Pass `next_cursor` from response as `cursor` to get the next page (sorting is kept from the first page).
+    If `count_limit` specified, counting stops at this value and `count_is_lower_bound` is set ("at least N" units).
+    Old finalized units are moved to archive, set `archived` to list them.
     """
     logger.debug(f"Filter: {filters}, sorting by date {sort_by_date}")
+    if pagination.after is None:
+        pagination = pagination._replace(descending=sort_by_date == "asc")
     try:
-        passports = await MongoDbWrapper().get_passports(filters)
-        documents_count = len(passports)
-
-        if sort_by_date == "asc":
-            passports.reverse()
-        passports = passports[(page - 1) * items : page * items]
+        filters = await MongoDbWrapper().parse_passports_filter(filters)
+        page, documents_count = await asyncio.gather(
+            MongoDbWrapper().get_passports_page(pagination, filter=filters, archived=archived),
+            MongoDbWrapper().count_passports(filters, limit=count_limit, archived=archived)
+            if with_count
+            else _no_count(),
+        )
+        passports: tp.List[Passport] = page.data
 
         for passport in passports:
             schema = await MongoDbWrapper().get_concrete_schema(schema_id=passport.schema_id)
@@ -44,12 +77,15 @@ async def get_all_passports(
                     await MongoDbWrapper().get_concrete_schema(schema_id=schema.parent_schema_id)
                 ).unit_name
     except Exception as exception_message:
-        logger.error(
-            f"Failed to get units from page {page} (count: {items}, filter: {filters}). Exception: {exception_message}"
-        )
+        logger.error(f"Failed to get units ({pagination}, filter: {filters}). Exception: {exception_message}")
         raise DatabaseException(error=exception_message)
 
-    return PassportsOut(count=documents_count, data=passports)
+    return PassportsOut(
+        count=documents_count.value if documents_count is not None else None,
+        count_is_lower_bound=documents_count.is_lower_bound if documents_count is not None else False,
+        data=passports,
+        next_cursor=page.next_cursor,
+    )
 
 
 @router.get(
@@ -78,20 +114,46 @@ async def create_new_passport(passport: Passport) -> GenericResponse:
     return GenericResponse(detail="Created new unit")
 
 
-@router.delete("/{internal_id}", dependencies=[Depends(check_user_permissions)], response_model=GenericResponse)
-async def delete_passport(internal_id: str) -> GenericResponse:
-    """Endpoint to delete an existing unit from database"""
+async def _cascade_delete_job(context: JobContext, internal_id: str) -> tp.Dict[str, tp.Any]:
+    stages = await MongoDbWrapper().get_stages(internal_id=internal_id)
+    await context.report(0, len(stages), force=True)
+    await MongoDbWrapper().remove_passport(internal_id, cascade=True)
+    await context.report(len(stages), force=True)
+    return {"internal_id": internal_id, "deleted_stages": len(stages)}
+
+
+JobScheduler().register("passport_cascade_delete", _cascade_delete_job, concurrency=2)
+
+
+@router.delete("/{internal_id}", dependencies=[Depends(check_user_permissions)], response_model=DeletionOut)
+async def delete_passport(internal_id: str, cascade: bool = False) -> DeletionOut:
+    """
+    Endpoint to delete an existing unit from database.
+    With `cascade` unit's production stages are deleted too. It is done in background, track it by returned job_id
+    """
     try:
+        if cascade:
+            job = await JobScheduler().submit("passport_cascade_delete", internal_id=internal_id)
+            return DeletionOut(detail="Scheduled unit deletion", job_id=job.job_id)
         await MongoDbWrapper().remove_passport(internal_id)
     except Exception as exception_message:
         logger.error(f"Failed to delete unit {internal_id}. Exception: {exception_message}")
         raise DatabaseException(error=exception_message)
-    return GenericResponse(detail="Deleted unit")
+    return DeletionOut(detail="Deleted unit")
 
 
-@router.get("/{internal_id}", response_model=tp.Union[PassportOut, GenericResponse])  # type:ignore
-async def get_passport_by_internal_id(internal_id: str) -> tp.Union[PassportOut, GenericResponse]:
-    """Endpoint to get information about concrete issued unit"""
+@router.get(
+    "/{internal_id}",
+    dependencies=[Depends(admission("unit"))],
+    response_model=tp.Union[PassportOut, GenericResponse],  # type:ignore
+)
+async def get_passport_by_internal_id(
+    internal_id: str, projection: tp.Optional[Projection] = Depends(field_projection("stages"))
+) -> tp.Union[PassportOut, GenericResponse]:
+    """
+    Endpoint to get information about concrete issued unit.
+    Stages' `additional_info` and `video_hashes` are returned only to users with "write" rule
+    """
     try:
         passport = await MongoDbWrapper().get_concrete_passport(internal_id)
         if passport is None:
@@ -105,11 +167,13 @@ async def get_passport_by_internal_id(internal_id: str) -> tp.Union[PassportOut,
             parential_unit = await MongoDbWrapper().get_concrete_schema(schema_id=schema.parent_schema_id)
             passport.parential_unit = parential_unit.unit_name
 
-        passport.biography = await MongoDbWrapper().get_stages(uuid=passport.uuid)
+        passport.biography = await MongoDbWrapper().get_stages(uuid=passport.uuid, projection=projection)
         if passport.biography:
             if passport.components_internal_ids:
                 for int_id in passport.components_internal_ids:
-                    passport.biography += await MongoDbWrapper().get_stages(internal_id=int_id, is_subcomponent=True)
+                    passport.biography += await MongoDbWrapper().get_stages(
+                        internal_id=int_id, is_subcomponent=True, projection=projection
+                    )
 
     except Exception as exception_message:
         logger.error(f"Failed to get unit {internal_id}. Exception: {exception_message}")
@@ -117,6 +181,29 @@ async def get_passport_by_internal_id(internal_id: str) -> tp.Union[PassportOut,
     return PassportOut(passport=passport)
 
 
+@router.get(
+    "/{internal_id}/tree",
+    dependencies=[Depends(admission("unit"))],
+    response_model=tp.Union[UnitTreeOut, GenericResponse],  # type:ignore
+)
+async def get_passport_tree(internal_id: str) -> tp.Union[UnitTreeOut, GenericResponse]:
+    """
+    Endpoint to get unit's assembly hierarchy: all its components at any depth with their statuses
+    (and status counts over every subtree), plus assemblies the unit is part of, top-level first
+    """
+    try:
+        ancestors, edges = await asyncio.gather(
+            MongoDbWrapper().get_unit_ancestors(internal_id), MongoDbWrapper().get_unit_descendants(internal_id)
+        )
+        if not edges:
+            return GenericResponse(status_code=404, detail="Not found")
+        units = await MongoDbWrapper().get_units_brief([edge["descendant"] for edge in edges])
+    except Exception as exception_message:
+        logger.error(f"Failed to get units tree for {internal_id}. Exception: {exception_message}")
+        raise DatabaseException(error=exception_message)
+    return UnitTreeOut(ancestors=ancestors, tree=build_tree(internal_id, edges, units))
+
+
 @router.post("/{internal_id}/serial")
 async def update_serial_number(internal_id: str, serial_number: str) -> GenericResponse:
     """
@@ -136,16 +223,24 @@ async def update_serial_number(internal_id: str, serial_number: str) -> GenericR
 
 
 @router.patch("/{internal_id}", dependencies=[Depends(check_user_permissions)], response_model=GenericResponse)
-async def patch_passport(internal_id: str, new_data: Passport) -> GenericResponse:
+async def patch_passport(
+    internal_id: str, new_data: Passport, response: Response, if_match: tp.Optional[int] = Header(None)
+) -> GenericResponse:
     """
-    Edit concrete unit data.
+    Edit concrete unit data. Only changed fields are written.
     Ignored fields: {"uuid", "internal_id", "is_in_db", "featured_in_int_id"}. Send null instead.
+    Pass `ETag` of previous edit as `If-Match` header to fail with 409 if unit was changed since then.
     """
     try:
-        await MongoDbWrapper().edit_passport(internal_id=internal_id, new_passport_data=new_data)
+        version = await MongoDbWrapper().edit_passport(
+            internal_id=internal_id, new_passport_data=new_data, expected_version=if_match
+        )
+    except VersionConflictError as exception_message:
+        raise ConflictException(details=str(exception_message))
     except Exception as exception_message:
         logger.error(f"Failed to patch unit {internal_id} with data {new_data.dict()}. Exception: {exception_message}")
         raise DatabaseException(error=exception_message)
+    response.headers["ETag"] = str(version)
     return GenericResponse(detail="Successfully patched unit")
 
 
@@ -1,4 +1,5 @@
 import typing as tp
+from datetime import datetime
 from uuid import uuid4
 
 from pydantic import BaseModel, Field
@@ -29,9 +30,45 @@ class ProductionSchema(BaseModel):
 
 
 class ProductionSchemasOut(GenericResponse):
-    count: int
+    count: tp.Optional[int]
     data: tp.List[ProductionSchema]
+    next_cursor: tp.Optional[str] = None
 
 
 class ProductionSchemaOut(GenericResponse):
     schema_: tp.Annotated[tp.Optional[ProductionSchema], Field(alias="schema")]
+
+
+class StageDurationStats(BaseModel):
+    schema_stage_id: str
+    name: str
+    expected_seconds: tp.Optional[int] = None
+    count: int
+    mean: tp.Optional[float] = None
+    min: tp.Optional[float] = None
+    max: tp.Optional[float] = None
+    p50: tp.Optional[float] = None
+    p90: tp.Optional[float] = None
+    p95: tp.Optional[float] = None
+    p99: tp.Optional[float] = None
+    slower_than_expected: tp.Optional[int] = None
+
+
+class StageDurationsOut(GenericResponse):
+    data: tp.List[StageDurationStats]
+
+
+class DurationAnomaly(BaseModel):
+    stage_id: tp.Optional[str] = None
+    schema_stage_id: str
+    name: str
+    employee_name: tp.Optional[str] = None
+    workplace: tp.Optional[str] = None
+    session_end_time: datetime
+    duration_seconds: float
+    expected_seconds: float
+    ratio: float
+
+
+class DurationAnomaliesOut(GenericResponse):
+    data: tp.List[DurationAnomaly]
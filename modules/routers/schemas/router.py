@@ -1,29 +1,44 @@
+import datetime
 import typing as tp
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
 
+from modules.analytics import get_schema_anomalies, get_schema_durations
 from modules.database import MongoDbWrapper
+from modules.dependencies.filters import parse_pagination
 from modules.dependencies.security import check_user_permissions, get_current_user
-from modules.exceptions import DatabaseException
-from .models import GenericResponse, ProductionSchema, ProductionSchemaOut, ProductionSchemasOut
+from modules.exceptions import ConflictException, DatabaseException
+from modules.pagination import Pagination
+from modules.patches import VersionConflictError
+from .models import (
+    DurationAnomaliesOut,
+    GenericResponse,
+    ProductionSchema,
+    ProductionSchemaOut,
+    ProductionSchemasOut,
+    StageDurationsOut,
+)
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.get("/", response_model=tp.Union[ProductionSchemasOut, GenericResponse])  # type:ignore
-async def get_all_production_schemas(page: int = 1, items: int = 20) -> ProductionSchemasOut:
+async def get_all_production_schemas(
+    pagination: Pagination = Depends(parse_pagination), with_count: bool = True
+) -> ProductionSchemasOut:
     """
     Endpoint to get all production schemas.
     Pagination:
         page: number of page (default 1);
         items: number of items on single page (default 20);
+        cursor: `next_cursor` from previous page (page is ignored if specified);
     """
     try:
-        schemas_count = await MongoDbWrapper().count_schemas()
-        schemas = await MongoDbWrapper().get_all_schemas()
+        schemas_count = await MongoDbWrapper().count_schemas() if with_count else None
+        schemas = await MongoDbWrapper().get_schemas_page(pagination)
     except Exception as exception_message:
         raise DatabaseException(error=exception_message)
-    return ProductionSchemasOut(count=schemas_count, data=schemas[(page - 1) * items : page * items])
+    return ProductionSchemasOut(count=schemas_count, data=schemas.data, next_cursor=schemas.next_cursor)
 
 
 @router.get("/{schema_id}", response_model=tp.Union[ProductionSchemaOut, GenericResponse])  # type:ignore
@@ -40,6 +55,41 @@ async def get_concrete_production_schema(schema_id: str) -> tp.Union[ProductionS
     return ProductionSchemaOut(schema=schema)
 
 
+@router.get("/{schema_id}/durations", response_model=StageDurationsOut)
+async def get_production_schema_durations(
+    schema_id: str, days: int = 30, employee_name: tp.Optional[str] = None, workplace: tp.Optional[str] = None
+) -> StageDurationsOut:
+    """
+    Endpoint to get duration statistics (mean, min, max, p50, p90, p95, p99) of every stage of production schema
+    for stages completed in last `days` days, optionally by single employee or workplace.
+    `slower_than_expected` is number of stages which took longer than stage's `duration_seconds`
+    """
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    try:
+        schema = await MongoDbWrapper().get_concrete_schema(schema_id)
+        durations = await get_schema_durations(schema, since, employee_name=employee_name, workplace=workplace)
+    except Exception as exception_message:
+        raise DatabaseException(error=exception_message)
+    return StageDurationsOut(data=durations)
+
+
+@router.get("/{schema_id}/durations/anomalies", response_model=DurationAnomaliesOut)
+async def get_production_schema_duration_anomalies(
+    schema_id: str, days: int = 7, factor: float = 2.0, limit: int = 100
+) -> DurationAnomaliesOut:
+    """
+    Endpoint to get stages of production schema completed in last `days` days which took `factor` times longer
+    than expected: stage's `duration_seconds`, or median duration of the stage if it's not set. Slowest first
+    """
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    try:
+        schema = await MongoDbWrapper().get_concrete_schema(schema_id)
+        anomalies = await get_schema_anomalies(schema, since, factor=factor, limit=limit)
+    except Exception as exception_message:
+        raise DatabaseException(error=exception_message)
+    return DurationAnomaliesOut(data=anomalies)
+
+
 @router.post("/", response_model=GenericResponse, dependencies=[Depends(check_user_permissions)])
 async def create_new_production_schema(schema: ProductionSchema) -> GenericResponse:
     """
@@ -66,13 +116,19 @@ async def delete_production_schema(schema_id: str) -> GenericResponse:
 
 
 @router.patch("/{schema_id}", response_model=GenericResponse, dependencies=[Depends(check_user_permissions)])
-async def edit_production_schema(schema_id: str, new_schema: ProductionSchema) -> GenericResponse:
+async def edit_production_schema(
+    schema_id: str, new_schema: ProductionSchema, response: Response, if_match: tp.Optional[int] = Header(None)
+) -> GenericResponse:
     """
     Endpoint to edit production schemas You're now unable to edit such fields as: "schema_id", "parent_schema_id",
-    "required_components_schema_ids", but you may send them anyways, backend will remove it
+    "required_components_schema_ids", but you may send them anyways, backend will remove it.
+    Pass `ETag` of previous edit as `If-Match` header to fail with 409 if schema was changed since then
     """
     try:
-        await MongoDbWrapper().edit_schema(schema_id, new_schema)
+        version = await MongoDbWrapper().edit_schema(schema_id, new_schema, expected_version=if_match)
+    except VersionConflictError as exception_message:
+        raise ConflictException(details=str(exception_message))
     except Exception as exception_message:
         raise DatabaseException(error=exception_message)
+    response.headers["ETag"] = str(version)
     return GenericResponse(detail="Patched schema")
@@ -2,6 +2,8 @@ import typing as tp
 
 from pydantic import BaseModel
 
+from ...models import SlowRequest
+
 
 class TokenData(BaseModel):
     username: tp.Optional[str] = None
@@ -10,3 +12,16 @@ class TokenData(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: tp.Optional[str] = None
+    expires_in: tp.Optional[int] = None
+
+
+class RefreshTokenIn(BaseModel):
+    refresh_token: str
+
+
+class SlowRequestsOut(BaseModel):
+    status_code: int = 200
+    detail: str = "Success"
+    threshold_ms: float
+    data: tp.List[SlowRequest]
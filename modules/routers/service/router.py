@@ -1,13 +1,20 @@
 import typing as tp
 from datetime import timedelta
 
-import httpx
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from loguru import logger
-from yaml import YAMLError
 
-from ...dependencies.security import ACCESS_TOKEN_EXPIRE_MINUTES, authenticate_user, create_access_token
+from ...analytics import DURATIONS_BACKFILL_BATCH_SIZE, start_durations_backfill
+from ...archive import ARCHIVE_AFTER_DAYS, start_archival
+from ...dependencies.security import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    authenticate_user,
+    check_user_permissions,
+    create_access_token,
+    create_refresh_token,
+    refresh_access_token,
+)
 from ...exceptions import (
     AuthException,
     ConnectionTimeoutException,
@@ -15,24 +22,118 @@ from ...exceptions import (
     ParserException,
     UnhandledException,
 )
-from ...utils import load_yaml
-from .models import Token
+from ...health import check_readiness
+from ...ipfs import IpfsClient
+from ...metrics import render_metrics
+from ...migration import STAGES_MIGRATION_BATCH_SIZE, start_stages_migration
+from ...profiler import PROFILER_SLOW_THRESHOLD_MS, slow_requests
+from ...summary import start_summaries_rebuild
+from ...tokens import TokenService
+from ...tree import start_tree_rebuild
+from ..jobs.models import JobOut
+from .models import RefreshTokenIn, SlowRequestsOut, Token
 
 router = APIRouter()
 
 
 @router.get("/api/v1/status")
 async def get_server_status() -> tp.Dict[str, str]:
-    """Endpoint to get server status"""
+    """Endpoint to get server status (liveness: process is up and serving requests)"""
     return {"status": "ok"}
 
 
+@router.get("/api/v1/status/ready")
+async def get_server_readiness(response: Response) -> tp.Dict[str, tp.Any]:
+    """
+    Endpoint to get server readiness: worker is warmed up, database and cache respond.
+    Responds 503 with failed checks otherwise
+    """
+    checks = await check_readiness()
+    if not all(checks.values()):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "not ready", "checks": checks}
+    return {"status": "ready", "checks": checks}
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """Endpoint for Prometheus scraping"""
+    return render_metrics()
+
+
+@router.get(
+    "/api/v1/service/slow-requests",
+    dependencies=[Depends(check_user_permissions)],
+    response_model=SlowRequestsOut,
+)
+async def get_slow_requests() -> SlowRequestsOut:
+    """
+    Endpoint to get latest profiled requests which took longer than threshold (newest first).
+    Profiling is enabled by `X-Profile: 1` request header or $PROFILER_SAMPLE_RATE envvar.
+    Without pyinstrument, code profile (cProfile) is thread-wide: it may include concurrent requests,
+    and it's skipped for requests overlapping another profiled one (queries are traced anyway)
+    """
+    return SlowRequestsOut(threshold_ms=PROFILER_SLOW_THRESHOLD_MS, data=list(reversed(slow_requests)))
+
+
+@router.post("/api/v1/service/archive", dependencies=[Depends(check_user_permissions)], response_model=JobOut)
+async def archive_finalized_units(older_than_days: int = ARCHIVE_AFTER_DAYS) -> JobOut:
+    """
+    Endpoint to move finalized units older than `older_than_days` (with their stages and protocols)
+    to archive collections. Archived units are still available by id. Runs in background, see /api/v1/jobs
+    """
+    return JobOut(job=await start_archival(older_than_days=older_than_days))
+
+
+@router.post(
+    "/api/v1/service/stage-summaries/rebuild", dependencies=[Depends(check_user_permissions)], response_model=JobOut
+)
+async def rebuild_stage_summaries() -> JobOut:
+    """
+    Endpoint to recompute units' stage summaries from production stages.
+    Needed once for units created before summaries were introduced. Runs in background, see /api/v1/jobs
+    """
+    return JobOut(job=await start_summaries_rebuild())
+
+
+@router.post(
+    "/api/v1/service/units-tree/rebuild", dependencies=[Depends(check_user_permissions)], response_model=JobOut
+)
+async def rebuild_units_tree() -> JobOut:
+    """
+    Endpoint to rebuild units tree (used by /api/v1/passports/{internal_id}/tree) from units' components.
+    Needed once for units created before the tree was introduced. Runs in background, see /api/v1/jobs
+    """
+    return JobOut(job=await start_tree_rebuild())
+
+
+@router.post("/api/v1/service/stages/migrate", dependencies=[Depends(check_user_permissions)], response_model=JobOut)
+async def migrate_stages(batch_size: int = STAGES_MIGRATION_BATCH_SIZE) -> JobOut:
+    """
+    Endpoint to convert production stages (and archived stages) stored in legacy format to compact one
+    in batches of `batch_size`. Safe to run while stages are written. Runs in background, see /api/v1/jobs
+    """
+    return JobOut(job=await start_stages_migration(batch_size=batch_size))
+
+
+@router.post(
+    "/api/v1/service/stage-durations/backfill", dependencies=[Depends(check_user_permissions)], response_model=JobOut
+)
+async def backfill_stage_durations(batch_size: int = DURATIONS_BACKFILL_BATCH_SIZE) -> JobOut:
+    """
+    Endpoint to rebuild stage durations store (used by /api/v1/schemas/{schema_id}/durations) from completed
+    production stages (and archived stages). Needed once for stages completed before the store was introduced.
+    Runs in background, see /api/v1/jobs
+    """
+    return JobOut(job=await start_durations_backfill(batch_size=batch_size))
+
+
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()) -> tp.Dict[str, str]:
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()) -> Token:
     """
     Endpoint for user-auth
 
-    Returns bearer jwt token
+    Returns bearer jwt token and refresh token to get new access tokens from /token/refresh without password
     """
     user = await authenticate_user(form_data.username, form_data.password)
     if not user:
@@ -40,27 +141,47 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         raise AuthException
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
-    return {"access_token": access_token, "token_type": "bearer"}
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=create_refresh_token(user.username),
+        expires_in=int(access_token_expires.total_seconds()),
+    )
+
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh_token(data: RefreshTokenIn) -> Token:
+    """Endpoint to get new bearer jwt token by refresh token (returned by /token)"""
+    access_token = await refresh_access_token(data.refresh_token)
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=data.refresh_token,
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
+@router.get("/.well-known/jwks.json", include_in_schema=False)
+async def get_jwks() -> tp.Dict[str, tp.Any]:
+    """Public keys to verify tokens locally (only with asymmetric $JWT_ALGORITHM)"""
+    return TokenService().jwks()
 
 
 @router.get("/api/v1/ipfs_decode")
 async def parse_ipfs_link(link: str) -> tp.Any:
-    """Extracts saved passport from IPFS/Pinata"""
+    """Extracts saved passport from IPFS/Pinata. Only documents of $IPFS_TRUSTED_GATEWAYS are cached"""
+    # imported here: both are only needed for IPFS and deferred to keep startup fast
+    import httpx
+    from yaml import YAMLError
+
     if not link.startswith(("http://", "https://")):
         raise IncorrectAddressException
 
     try:
-        async with httpx.AsyncClient() as client:
-            request = await client.get(link)
-            return await load_yaml(request.text)
-    except httpx.ReadTimeout:
+        return await IpfsClient().get_document(link)
+    except httpx.TimeoutException:
         raise ConnectionTimeoutException
     except YAMLError:
         raise ParserException
     except Exception as exception:
         raise UnhandledException(error=exception)
-
-
-@router.get("/api/v1/validate")
-async def validate_stages() -> tp.List[bool]:
-    pass
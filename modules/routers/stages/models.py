@@ -45,14 +45,63 @@ class ProductionStage(BaseModel):
         )
 
 
+STAGE_TIME_FORMAT = "%d-%m-%Y %H:%M:%S"
+
+
+class StageSummary(BaseModel):
+    """denormalized unit's production stages summary, maintained on unit document"""
+
+    total: int = 0
+    completed: int = 0
+    reworked: int = 0
+    canceled: int = 0
+    last_session_end_time: tp.Optional[datetime] = None
+
+    @staticmethod
+    def counters(stage: tp.Dict[str, tp.Any]) -> tp.Dict[str, int]:
+        """stage contribution to summary counters"""
+        additional_info = stage.get("additional_info") or {}
+        return {
+            "total": 1,
+            "completed": int(bool(stage.get("completed"))),
+            "reworked": int(bool(additional_info.get("reworked"))),
+            "canceled": int(bool(additional_info.get("canceled"))),
+        }
+
+    @staticmethod
+    def parse_session_time(session_time: tp.Optional[str]) -> tp.Optional[datetime]:
+        if not session_time:
+            return None
+        try:
+            return datetime.strptime(session_time, STAGE_TIME_FORMAT)
+        except ValueError:
+            return None
+
+
 class ProductionStageData(ProductionStage):
     unit_name: tp.Optional[str]
     parent_unit_internal_id: tp.Optional[str]
 
 
 class ProductionStagesOut(GenericResponse):
-    count: int
+    count: tp.Optional[int]
     data: tp.List[ProductionStage]
+    next_cursor: tp.Optional[str] = None
+
+
+class StagesBatchIn(BaseModel):
+    stages: tp.List[ProductionStage] = Field(..., min_items=1, max_items=1000)
+
+
+class StageIngestionResult(BaseModel):
+    id: str
+    created: bool
+    duplicate: bool = False
+    detail: tp.Optional[str] = None
+
+
+class StagesBatchOut(GenericResponse):
+    data: tp.List[StageIngestionResult]
 
 
 class ProductionStageOut(GenericResponse):
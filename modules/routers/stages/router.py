@@ -1,29 +1,54 @@
 import typing as tp
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
 
 from ...database import MongoDbWrapper
-from ...dependencies.security import check_user_permissions, get_current_user
-from ...exceptions import DatabaseException
-from .models import GenericResponse, ProductionStage, ProductionStageOut, ProductionStagesOut
+from ...dependencies.admission import admission
+from ...dependencies.filters import parse_pagination
+from ...dependencies.security import check_user_permissions, field_projection, get_current_user
+from ...exceptions import ConflictException, DatabaseException
+from ...ingestion import StageIngestionBuffer
+from ...pagination import Pagination
+from ...patches import VersionConflictError
+from ...permissions import Projection
+from .models import (
+    GenericResponse,
+    ProductionStage,
+    ProductionStageOut,
+    ProductionStagesOut,
+    StageIngestionResult,
+    StagesBatchIn,
+    StagesBatchOut,
+)
 
 router = APIRouter(dependencies=[Depends(get_current_user)], deprecated=True)
 
 
-@router.get("/", response_model=tp.Union[ProductionStagesOut, GenericResponse])  # type:ignore
-async def get_production_stages(page: int = 1, items: int = 20, decode_employees: bool = False) -> ProductionStagesOut:
+@router.get(
+    "/",
+    dependencies=[Depends(admission("listing"))],
+    response_model=tp.Union[ProductionStagesOut, GenericResponse],  # type:ignore
+)
+async def get_production_stages(
+    pagination: Pagination = Depends(parse_pagination),
+    decode_employees: bool = False,
+    with_count: bool = True,
+    projection: tp.Optional[Projection] = Depends(field_projection("stages")),
+) -> ProductionStagesOut:
     """
     Endpoint to get list of all production stages from :start: to :limit:. By default, from 0 to 20.
+    Pass `next_cursor` from response as `cursor` to get the next page.
+    `additional_info` and `video_hashes` are returned only to users with "write" rule.
     """
-    stages = await MongoDbWrapper().get_stages(uuid="Deprecated")
-    documents_count = await MongoDbWrapper().count_stages()
     try:
+        stages = await MongoDbWrapper().get_stages_page(pagination, projection=projection)
+        documents_count = await MongoDbWrapper().count_stages() if with_count else None
         if decode_employees:
-            for stage in stages:
+            for stage in stages.data:
                 if not isinstance(stage.employee_name, str):
                     continue
-                stage.employee_name = await MongoDbWrapper().decode_employee(stage.employee_name)  # type: ignore
-        return ProductionStagesOut(count=documents_count, data=stages[(page - 1) * items : page * items])
+                stage.employee_name = await MongoDbWrapper().decode_employee(stage.employee_name)
+        return ProductionStagesOut(count=documents_count, data=stages.data, next_cursor=stages.next_cursor)
     except Exception as exception_message:
         raise DatabaseException(error=exception_message)
 
@@ -37,6 +62,28 @@ async def create_new_stage(stage: ProductionStage) -> GenericResponse:
     return GenericResponse(detail="Created new production stage")
 
 
+@router.post("/batch", dependencies=[Depends(check_user_permissions)], response_model=StagesBatchOut)
+async def create_stages_batch(batch: StagesBatchIn) -> StagesBatchOut:
+    """
+    Endpoint for workbenches to push several production stages at once.
+    Stages are acknowledged after they are durably written. Pushing a stage with already stored `id` again is safe:
+    it is reported as `duplicate` and not written twice, so failed pushes may be retried as a whole.
+    While database is unreachable stages are accepted into the write spool (if enabled) and stored on replay
+    """
+    errors = await StageIngestionBuffer().submit([stage.dict() for stage in batch.stages])
+    return StagesBatchOut(
+        data=[
+            StageIngestionResult(
+                id=stage.id,
+                created=error is None,
+                duplicate=error == "duplicate",
+                detail=error if error != "duplicate" else None,
+            )
+            for stage, error in zip(batch.stages, errors)
+        ]
+    )
+
+
 @router.delete("/{stage_id}", dependencies=[Depends(check_user_permissions)], response_model=GenericResponse)
 async def remove_stage(stage_id: str) -> GenericResponse:
     try:
@@ -47,10 +94,12 @@ async def remove_stage(stage_id: str) -> GenericResponse:
 
 
 @router.get("/{stage_id}", response_model=tp.Union[ProductionStageOut, GenericResponse])  # type:ignore
-async def get_stage_by_id(stage_id: str) -> tp.Union[ProductionStageOut, GenericResponse]:
+async def get_stage_by_id(
+    stage_id: str, projection: tp.Optional[Projection] = Depends(field_projection("stages"))
+) -> tp.Union[ProductionStageOut, GenericResponse]:
     """Endpoint to get information about concrete production stage"""
     try:
-        stage = await MongoDbWrapper().get_concrete_stage(stage_id)
+        stage = await MongoDbWrapper().get_concrete_stage(stage_id, projection=projection)
     except Exception as exception_message:
         raise DatabaseException(error=exception_message)
     if stage is None:
@@ -63,14 +112,23 @@ async def get_stage_by_id(stage_id: str) -> tp.Union[ProductionStageOut, Generic
     response_model=GenericResponse,
     dependencies=[Depends(check_user_permissions)],
 )
-async def patch_stage(stage_id: str, new_data: ProductionStage) -> GenericResponse:
+async def patch_stage(
+    stage_id: str, new_data: ProductionStage, response: Response, if_match: tp.Optional[int] = Header(None)
+) -> GenericResponse:
     """
     Endpoint to edit production stages. You're unable to edit such fields as:
     "parent_unit_uuid","session_start_time","session_end_time","id","is_in_db","creation_time".
     But you may send "string" anyways, backend will remove it before update in db.
+    Only changed fields are written. Pass `ETag` of previous edit as `If-Match` header
+    to fail with 409 if stage was changed since then.
     """
     try:
-        await MongoDbWrapper().edit_stage(stage_id=stage_id, new_stage_data=new_data)
+        version = await MongoDbWrapper().edit_stage(
+            stage_id=stage_id, new_stage_data=new_data, expected_version=if_match
+        )
+    except VersionConflictError as exception_message:
+        raise ConflictException(details=str(exception_message))
     except Exception as exception_message:
         raise DatabaseException(error=exception_message)
+    response.headers["ETag"] = str(version)
     return GenericResponse(detail="Successfully patched stage")
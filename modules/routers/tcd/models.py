@@ -61,8 +61,31 @@ class ProtocolOut(GenericResponse):
     protocol: tp.Union[ProtocolData, Protocol]
 
 
+class ProtocolSummary(ProtocolData):
+    """issued protocol as listed, rows are loaded only on demand"""
+
+    rows: tp.Optional[tp.List[ProtocolRow]] = None  # type: ignore
+
+
 class ProtocolsOut(GenericResponse):
-    data: tp.List[ProtocolData]
+    count: tp.Optional[int] = None
+    count_is_lower_bound: bool = False
+    data: tp.List[ProtocolSummary]
+    next_cursor: tp.Optional[str] = None
+
+
+class ProtocolsApprovalIn(BaseModel):
+    internal_ids: tp.List[str] = Field(..., min_items=1, max_items=1000)
+
+
+class ProtocolApprovalResult(BaseModel):
+    internal_id: str
+    approved: bool
+    detail: tp.Optional[str] = None
+
+
+class ProtocolsApprovalOut(GenericResponse):
+    data: tp.List[ProtocolApprovalResult]
 
 
 class TypesOut(GenericResponse):
@@ -1,32 +1,75 @@
+import asyncio
 import typing as tp
 
 from fastapi import APIRouter, Depends
 from loguru import logger
 
 from ...database import MongoDbWrapper
-from ...dependencies.filters import parse_tcd_filters
+from ...dependencies.admission import admission
+from ...dependencies.filters import parse_pagination, parse_tcd_filters
 from ...dependencies.handlers import handle_protocol
-from ...dependencies.security import get_current_employee, get_current_user
+from ...dependencies.security import (
+    check_tcd_permissions,
+    check_user_permissions,
+    get_current_employee,
+    get_current_user,
+)
 from ...exceptions import DatabaseException
+from ...pagination import Pagination
+from ...prototypes import ProtocolPrototypes
 from ...types import Filter
-from .models import GenericResponse, Protocol, ProtocolData, ProtocolOut, ProtocolsOut, TypesOut
+from ..passports.models import OrderBy
+from .models import (
+    GenericResponse,
+    Protocol,
+    ProtocolApprovalResult,
+    ProtocolData,
+    ProtocolOut,
+    ProtocolsApprovalIn,
+    ProtocolsApprovalOut,
+    ProtocolsOut,
+    TypesOut,
+)
 from modules.routers.employees.models import Employee
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
-@router.get("/protocols", response_model=ProtocolsOut)
-async def get_protocols(filter: Filter = Depends(parse_tcd_filters)) -> ProtocolsOut:
+async def _no_count() -> None:
+    return None
+
+
+@router.get("/protocols", dependencies=[Depends(admission("listing"))], response_model=ProtocolsOut)
+async def get_protocols(
+    pagination: Pagination = Depends(parse_pagination),
+    sort_by_date: OrderBy = OrderBy.ascending,
+    with_rows: bool = False,
+    with_count: bool = True,
+    count_limit: tp.Optional[int] = None,
+    filter: Filter = Depends(parse_tcd_filters),
+) -> ProtocolsOut:
     """
-    Endpoint to get all issued protocols from database.
-    You can't receive empty protocol templates here
+    Endpoint to get issued protocols from database, one page at a time.
+    You can't receive empty protocol templates here. Protocol rows are omitted unless `with_rows` specified.
+    `name` filters by unit name (or exact unit internal_id), pass `next_cursor` as `cursor` to get the next page
     """
+    if pagination.after is None:
+        pagination = pagination._replace(descending=sort_by_date == "asc")
     try:
-        protocols = await MongoDbWrapper().get_all_protocols(filter=filter)
+        filter = await MongoDbWrapper().parse_protocols_filter(filter)
+        page, documents_count = await asyncio.gather(
+            MongoDbWrapper().get_protocols_page(pagination, filter=filter, with_rows=with_rows),
+            MongoDbWrapper().count_protocols(filter, limit=count_limit) if with_count else _no_count(),
+        )
     except Exception as exception_message:
-        logger.warning(f"Can't get all protocols from DB. Filter: {filter}")
+        logger.warning(f"Can't get protocols from DB. Filter: {filter}")
         raise DatabaseException(error=exception_message)
-    return ProtocolsOut(data=protocols)
+    return ProtocolsOut(
+        count=documents_count.value if documents_count is not None else None,
+        count_is_lower_bound=documents_count.is_lower_bound if documents_count is not None else False,
+        data=page.data,
+        next_cursor=page.next_cursor,
+    )
 
 
 @router.get("/protocols/types")
@@ -36,6 +79,19 @@ async def get_protocols_types() -> TypesOut:
     return TypesOut(data=types)
 
 
+@router.post(
+    "/protocols/prototypes/reload", dependencies=[Depends(check_user_permissions)], response_model=GenericResponse
+)
+async def reload_protocol_prototypes() -> GenericResponse:
+    """Endpoint to reload cached protocol prototypes after editing protocols templates collection"""
+    try:
+        loaded = await ProtocolPrototypes().reload()
+    except Exception as exception_message:
+        logger.error(f"Can't reload protocol prototypes. Exception: {exception_message}")
+        raise DatabaseException(detail=exception_message)
+    return GenericResponse(detail=f"Loaded {loaded} protocol prototypes")
+
+
 @router.get("/protocols/{internal_id}")
 async def get_concrete_protocol(internal_id: str, employee: Employee = Depends(get_current_employee)) -> ProtocolOut:
     """
@@ -50,7 +106,7 @@ async def get_concrete_protocol(internal_id: str, employee: Employee = Depends(g
         if not unit:
             raise DatabaseException(detail=f"Unit with {internal_id} not found. Can't generate protocol for it")
         if not protocol:
-            protocol = await MongoDbWrapper().get_concrete_protocol_prototype(associated_with_schema_id=unit.schema_id)
+            protocol = await ProtocolPrototypes().get_by_schema_id(associated_with_schema_id=unit.schema_id)
         if not protocol:
             raise DatabaseException(detail="Can't create protocol for unit {internal_id}, missing schema")
     except Exception as exception_message:
@@ -59,6 +115,27 @@ async def get_concrete_protocol(internal_id: str, employee: Employee = Depends(g
     return ProtocolOut(serial_number=unit.serial_number, employee=employee, protocol=protocol)
 
 
+@router.post("/protocols/approve", dependencies=[Depends(check_tcd_permissions)], response_model=ProtocolsApprovalOut)
+async def approve_protocols(approval: ProtocolsApprovalIn) -> ProtocolsApprovalOut:
+    """
+    Endpoint to approve protocols of several units at once.
+    All status changes are applied together, result is reported for every unit.
+    Declared before `/protocols/{internal_id}`, otherwise "approve" is taken for unit's internal_id
+    """
+    try:
+        results = await MongoDbWrapper().approve_protocols(internal_ids=approval.internal_ids)
+    except Exception as exception_message:
+        logger.error(f"Can't approve protocols for units {approval.internal_ids}. Exception: {exception_message}")
+        raise DatabaseException(detail=exception_message)
+
+    return ProtocolsApprovalOut(
+        data=[
+            ProtocolApprovalResult(internal_id=internal_id, approved=error is None, detail=error)
+            for internal_id, error in results.items()
+        ]
+    )
+
+
 @router.post("/protocols/{internal_id}")
 async def handle_protocol_update(protocol: ProtocolData = Depends(handle_protocol)) -> GenericResponse:
     """
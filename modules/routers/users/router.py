@@ -38,7 +38,7 @@ async def register_new_user(user: UserWithPassword = Depends(create_new_user)) -
 async def get_user_data(username: str) -> tp.Union[UserOut, GenericResponse]:
     """Get information about concrete user"""
     try:
-        user = await MongoDbWrapper().get_concrete_user(username)
+        user = await MongoDbWrapper().get_concrete_user_info(username)
     except Exception as exception_message:
         raise DatabaseException(error=exception_message)
     if user is None:
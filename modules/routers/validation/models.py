@@ -0,0 +1,62 @@
+import typing as tp
+from datetime import datetime
+from enum import Enum
+from uuid import uuid4
+
+from pydantic import BaseModel, Field
+
+
+class GenericResponse(BaseModel):
+    status_code: int = 200
+    detail: str = "Success"
+
+
+class ValidationStatus(str, Enum):
+    valid = "valid"
+    invalid = "invalid"
+    unreachable = "unreachable"
+
+
+class ValidationJobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    finished = "finished"
+    failed = "failed"
+    canceled = "canceled"
+
+
+class ValidationJob(BaseModel):
+    job_id: str = Field(default_factory=lambda: uuid4().hex)
+    status: ValidationJobStatus = ValidationJobStatus.pending
+    filter: tp.Dict[str, tp.Any] = {}
+    creation_time: datetime = Field(default_factory=datetime.now)
+    finish_time: tp.Optional[datetime] = None
+    total: tp.Optional[int] = None
+    processed: int = 0
+    valid: int = 0
+    invalid: int = 0
+    unreachable: int = 0
+    error: tp.Optional[str] = None
+
+
+class ValidationResult(BaseModel):
+    job_id: str
+    internal_id: str
+    uuid: str
+    passport_ipfs_cid: str
+    status: ValidationStatus
+    mismatches: tp.List[str] = []
+    checked_at: datetime = Field(default_factory=datetime.now)
+
+
+class ValidationJobOut(GenericResponse):
+    job: tp.Optional[ValidationJob]
+
+
+class ValidationJobsOut(GenericResponse):
+    data: tp.List[ValidationJob]
+
+
+class ValidationResultsOut(GenericResponse):
+    data: tp.List[ValidationResult]
+    next_cursor: tp.Optional[str] = None
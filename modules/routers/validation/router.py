@@ -0,0 +1,72 @@
+import typing as tp
+
+from fastapi import APIRouter, Depends
+from loguru import logger
+
+from ...database import MongoDbWrapper
+from ...dependencies.filters import parse_pagination
+from ...dependencies.security import check_user_permissions, get_current_user
+from ...exceptions import DatabaseException
+from ...pagination import Pagination
+from ...types import Filter
+from ...validation import start_validation
+from ..passports.models import UnitStatus
+from .models import GenericResponse, ValidationJobOut, ValidationJobsOut, ValidationResultsOut
+
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+@router.post("/", dependencies=[Depends(check_user_permissions)], response_model=ValidationJobOut)
+async def start_ipfs_validation(
+    status: tp.Optional[UnitStatus] = None, schema_id: tp.Optional[str] = None
+) -> ValidationJobOut:
+    """
+    Endpoint to start background validation of units' IPFS passports.
+    Every unit with `passport_ipfs_cid` (optionally filtered by status and schema) is checked
+    against its biography in database. Use returned job_id to track progress and get results
+    """
+    filter: Filter = {}
+    if status:
+        filter["status"] = status
+    if schema_id:
+        filter["schema_id"] = schema_id
+    try:
+        job = await start_validation(filter=filter)
+    except Exception as exception_message:
+        logger.error(f"Failed to start IPFS validation. Exception: {exception_message}")
+        raise DatabaseException(error=exception_message)
+    return ValidationJobOut(job=job)
+
+
+@router.get("/", response_model=ValidationJobsOut)
+async def get_validation_jobs(pagination: Pagination = Depends(parse_pagination)) -> ValidationJobsOut:
+    """Endpoint to get list of IPFS validation jobs, newest first"""
+    try:
+        jobs = await MongoDbWrapper().get_validation_jobs(pagination)
+    except Exception as exception_message:
+        raise DatabaseException(error=exception_message)
+    return ValidationJobsOut(data=jobs.data)
+
+
+@router.get("/{job_id}", response_model=tp.Union[ValidationJobOut, GenericResponse])  # type:ignore
+async def get_validation_job(job_id: str) -> tp.Union[ValidationJobOut, GenericResponse]:
+    """Endpoint to get IPFS validation job progress"""
+    try:
+        job = await MongoDbWrapper().get_validation_job(job_id)
+    except Exception as exception_message:
+        raise DatabaseException(error=exception_message)
+    if job is None:
+        return GenericResponse(status_code=404, detail="Not found")
+    return ValidationJobOut(job=job)
+
+
+@router.get("/{job_id}/results", response_model=ValidationResultsOut)
+async def get_validation_results(
+    job_id: str, only_failed: bool = False, pagination: Pagination = Depends(parse_pagination)
+) -> ValidationResultsOut:
+    """Endpoint to get IPFS validation results. Set `only_failed` to get only invalid and unreachable units"""
+    try:
+        results = await MongoDbWrapper().get_validation_results_page(job_id, pagination, only_failed=only_failed)
+    except Exception as exception_message:
+        raise DatabaseException(error=exception_message)
+    return ValidationResultsOut(data=results.data, next_cursor=results.next_cursor)
@@ -0,0 +1,73 @@
+import asyncio
+import copy
+import inspect
+import json
+import os
+import typing as tp
+from functools import wraps
+
+from .counter import normalize_filter
+from .metrics import record_coalesced_call
+
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+F = tp.TypeVar("F", bound=tp.Callable[..., tp.Awaitable[tp.Any]])
+
+
+class _Flight:
+    __slots__ = ("future", "followers")
+
+    def __init__(self, future: "asyncio.Future[tp.Any]") -> None:
+        self.future = future
+        self.followers = 0
+
+
+_in_flight: tp.Dict[tp.Tuple[str, str], _Flight] = {}
+
+
+def _call_key(signature: inspect.Signature, args: tp.Tuple[tp.Any, ...], kwargs: tp.Dict[str, tp.Any]) -> str:
+    """normalized call arguments (without `self`), equal queries get equal keys"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = {name: value for name, value in bound.arguments.items() if name != "self"}
+    return json.dumps(normalize_filter(arguments), default=repr)
+
+
+def _retrieve_exception(future: "asyncio.Future[tp.Any]") -> None:
+    """mark exception as retrieved, when every waiter is gone there is no one else to do it"""
+    if not future.cancelled():
+        future.exception()
+
+
+def single_flight(func: F) -> F:
+    """
+    Decorator for MongoDbWrapper read methods.
+    Concurrent calls with equal (normalized) arguments share one in-flight query: the first caller runs it,
+    others wait for its result. If result is shared, every caller gets its own deep copy, so it may be modified.
+    Nothing is cached after the query is finished. A caller being cancelled doesn't cancel the shared query
+    """
+    if not SINGLE_FLIGHT_ENABLED:
+        return func
+
+    signature = inspect.signature(func)
+    method = func.__qualname__
+
+    @wraps(func)
+    async def wrapper(*args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        key = (method, _call_key(signature, args, kwargs))
+        flight = _in_flight.get(key)
+        if flight is not None:
+            record_coalesced_call(method, coalesced=True)
+            flight.followers += 1
+            return copy.deepcopy(await asyncio.shield(flight.future))
+
+        record_coalesced_call(method, coalesced=False)
+        flight = _Flight(asyncio.ensure_future(func(*args, **kwargs)))
+        _in_flight[key] = flight
+        flight.future.add_done_callback(lambda _: _in_flight.pop(key, None))
+        flight.future.add_done_callback(_retrieve_exception)
+        result = await asyncio.shield(flight.future)
+        # followers may still be copying the result, so the leader doesn't get the original either
+        return copy.deepcopy(result) if flight.followers else result
+
+    return tp.cast(F, wrapper)
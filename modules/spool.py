@@ -0,0 +1,264 @@
+import asyncio
+import inspect
+import json
+import os
+import sqlite3
+import time
+import typing as tp
+from functools import wraps
+
+from loguru import logger
+from pydantic import BaseModel
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+
+from .metrics import record_spooled_write, set_spool_state
+from .singleton import SingletonMeta
+
+# writes are spooled to this SQLite file while MongoDB is unreachable. Spooling is disabled if not set
+WRITE_SPOOL_PATH = os.environ.get("WRITE_SPOOL_PATH")
+WRITE_SPOOL_REPLAY_INTERVAL = float(os.environ.get("WRITE_SPOOL_REPLAY_INTERVAL", 5))
+# spool file is shared by all workers, only lease owner replays it
+WRITE_SPOOL_LEASE_SECONDS = float(os.environ.get("WRITE_SPOOL_LEASE_SECONDS", 60))
+
+F = tp.TypeVar("F", bound=tp.Callable[..., tp.Awaitable[None]])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    error TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS pending_writes_key ON writes (key) WHERE error IS NULL;
+CREATE INDEX IF NOT EXISTS pending_writes ON writes (seq) WHERE error IS NULL;
+CREATE TABLE IF NOT EXISTS replay_lease (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class _Operation(tp.NamedTuple):
+    func: tp.Callable[..., tp.Awaitable[None]]
+    signature: inspect.Signature
+
+
+# spooled operations by name, names are stored in spool file, so they must survive restarts
+_operations: tp.Dict[str, _Operation] = {}
+
+
+def _encode_arguments(arguments: tp.Mapping[str, tp.Any]) -> str:
+    """call arguments (without `self`) as JSON, models are stored as their JSON representation"""
+    encoded = {
+        name: json.loads(value.json()) if isinstance(value, BaseModel) else value
+        for name, value in arguments.items()
+        if name != "self"
+    }
+    return json.dumps(encoded, default=str)
+
+
+def _decode_arguments(signature: inspect.Signature, encoded: str) -> tp.Dict[str, tp.Any]:
+    """arguments of spooled call, models are parsed back using method annotations"""
+    arguments: tp.Dict[str, tp.Any] = json.loads(encoded)
+    for name, value in arguments.items():
+        annotation = signature.parameters[name].annotation
+        if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+            arguments[name] = annotation.parse_obj(value)
+    return arguments
+
+
+class WriteSpool(metaclass=SingletonMeta):
+    """
+    Durable local spool for writes made while MongoDB is unreachable.
+    Writes are appended to SQLite file ($WRITE_SPOOL_PATH) and replayed in order once connectivity returns.
+    Every write has an idempotency key, so retried requests are spooled once, and replay of a write
+    which has reached the database before the link dropped is not applied twice
+    """
+
+    def __init__(self, path: tp.Optional[str] = None) -> None:
+        self.path = path or WRITE_SPOOL_PATH
+        self._connection: tp.Optional[sqlite3.Connection] = None
+        self._owner = f"{os.getpid()}:{id(self)}"
+        if self.path is None:
+            return
+
+        # autocommit: every append is durable once the call returns
+        self._connection = sqlite3.connect(self.path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(SCHEMA)
+        depth = self.depth()
+        if depth:
+            logger.warning(f"Write spool {self.path} has {depth} writes to replay")
+
+    @property
+    def enabled(self) -> bool:
+        return self._connection is not None
+
+    def _execute(self, query: str, parameters: tp.Sequence[tp.Any] = ()) -> sqlite3.Cursor:
+        if self._connection is None:
+            raise RuntimeError("Write spool is disabled, set $WRITE_SPOOL_PATH")
+        return self._connection.execute(query, parameters)
+
+    def is_empty(self) -> bool:
+        return self._execute("SELECT 1 FROM writes WHERE error IS NULL LIMIT 1").fetchone() is None
+
+    def depth(self) -> int:
+        """number of writes waiting for replay"""
+        return int(self._execute("SELECT COUNT(*) FROM writes WHERE error IS NULL").fetchone()[0])
+
+    def lag(self) -> float:
+        """seconds since the oldest write waiting for replay was made, 0 if spool is empty"""
+        oldest = self._execute("SELECT MIN(created_at) FROM writes WHERE error IS NULL").fetchone()[0]
+        return max(time.time() - float(oldest), 0.0) if oldest is not None else 0.0
+
+    def report(self) -> None:
+        set_spool_state(self.depth(), self.lag())
+
+    def append(self, operation: str, key: str, arguments: str, replace: bool = False) -> bool:
+        """
+        spool write. Write with key of already spooled one is ignored, or with `replace`, replaces it
+        (and is moved to the end of spool). Returns False if write was ignored
+        """
+        conflict = "REPLACE" if replace else "IGNORE"
+        cursor = self._execute(
+            f"INSERT OR {conflict} INTO writes (key, operation, arguments, created_at) VALUES (?, ?, ?, ?)",
+            (f"{operation}:{key}", operation, arguments, time.time()),
+        )
+        spooled = int(cursor.rowcount) == 1
+        record_spooled_write(operation, "spooled" if spooled else "ignored")
+        self.report()
+        return spooled
+
+    def failed(self) -> tp.List[tp.Dict[str, tp.Any]]:
+        """writes rejected by database on replay, they are kept for manual inspection"""
+        rows = self._execute("SELECT seq, operation, arguments, created_at, error FROM writes WHERE error IS NOT NULL")
+        return [dict(zip(("seq", "operation", "arguments", "created_at", "error"), row)) for row in rows.fetchall()]
+
+    def _acquire_lease(self) -> bool:
+        now = time.time()
+        self._execute("INSERT OR IGNORE INTO replay_lease (id, owner, expires_at) VALUES (0, '', 0)")
+        cursor = self._execute(
+            "UPDATE replay_lease SET owner = ?, expires_at = ? WHERE id = 0 AND (owner = ? OR expires_at < ?)",
+            (self._owner, now + WRITE_SPOOL_LEASE_SECONDS, self._owner, now),
+        )
+        return int(cursor.rowcount) == 1
+
+    def _release_lease(self) -> None:
+        self._execute("UPDATE replay_lease SET expires_at = 0 WHERE id = 0 AND owner = ?", (self._owner,))
+
+    async def replay(self, database: tp.Any) -> int:
+        """
+        apply spooled writes to `database` (MongoDbWrapper) in order. Stops at first write failing because
+        database is still unreachable. Writes rejected for other reasons are marked failed and skipped,
+        so they don't block the rest. Returns number of applied writes
+        """
+        if not self._acquire_lease():
+            return 0
+
+        applied = 0
+        try:
+            while True:
+                row = self._execute(
+                    "SELECT seq, operation, arguments FROM writes WHERE error IS NULL ORDER BY seq LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                seq, operation, arguments = row
+
+                result = "replayed"
+                try:
+                    func, signature = _operations[operation]
+                    await func(database, **_decode_arguments(signature, arguments))
+                except DuplicateKeyError:
+                    # write has reached database before the link dropped
+                    result = "duplicate"
+                except ConnectionFailure as exception_message:
+                    logger.warning(f"Database is still unreachable, {self.depth()} writes left: {exception_message}")
+                    break
+                except Exception as exception_message:
+                    logger.error(f"Failed to replay spooled {operation} ({arguments}): {exception_message!r}")
+                    self._execute("UPDATE writes SET error = ? WHERE seq = ?", (repr(exception_message), seq))
+                    record_spooled_write(operation, "failed")
+                    continue
+
+                self._execute("DELETE FROM writes WHERE seq = ?", (seq,))
+                record_spooled_write(operation, result)
+                applied += 1
+                self._acquire_lease()
+        finally:
+            self._release_lease()
+            self.report()
+
+        if applied:
+            logger.info(f"Replayed {applied} spooled writes")
+        return applied
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def spooled(key: tp.Callable[[tp.Dict[str, tp.Any]], str], replace: bool = False) -> tp.Callable[[F], F]:
+    """
+    Decorator for MongoDbWrapper write methods, enabled with $WRITE_SPOOL_PATH.
+    If database is unreachable, write is spooled (see WriteSpool) and the call returns normally.
+    While spool isn't empty, writes are spooled without trying database, so they are applied in the order made.
+    `key` builds idempotency key from call arguments. With `replace`, later write with the same key replaces
+    spooled one instead of being ignored (last value wins, e.g. updates of the same field)
+    """
+
+    def decorator(func: F) -> F:
+        operation = func.__name__
+        signature = inspect.signature(func)
+        _operations[operation] = _Operation(func, signature)
+
+        @wraps(func)
+        async def wrapper(*args: tp.Any, **kwargs: tp.Any) -> None:
+            spool = WriteSpool()
+            if not spool.enabled:
+                return await func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if spool.is_empty():
+                try:
+                    return await func(*args, **kwargs)
+                except ConnectionFailure as exception_message:
+                    logger.warning(f"Database is unreachable, spooling {operation}: {exception_message}")
+
+            spool.append(operation, key(bound.arguments), _encode_arguments(bound.arguments), replace=replace)
+
+        return tp.cast(F, wrapper)
+
+    return decorator
+
+
+def spool_write(operation: str, key: str, arguments: tp.Mapping[str, tp.Any], replace: bool = False) -> bool:
+    """
+    spool single call of `spooled` operation made outside of it (e.g. every stage of a batch as `add_stage`),
+    so it is replayed and deduplicated together with calls of the operation itself
+    """
+    if operation not in _operations:
+        raise KeyError(f"{operation} is not a spooled operation")
+    return WriteSpool().append(operation, key, _encode_arguments(arguments), replace=replace)
+
+
+async def replay_spool(interval: float = WRITE_SPOOL_REPLAY_INTERVAL) -> None:
+    """replay spooled writes every `interval` seconds. Every worker tries, one of them replays at a time"""
+    # database module decorates its writes with `spooled`, so it can't be imported on top
+    from .database import MongoDbWrapper
+
+    spool = WriteSpool()
+    while True:
+        try:
+            if not spool.is_empty():
+                await spool.replay(MongoDbWrapper())
+            spool.report()
+        except Exception as exception_message:
+            logger.error(f"Failed to replay write spool: {exception_message}")
+        await asyncio.sleep(interval)
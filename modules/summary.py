@@ -0,0 +1,27 @@
+import typing as tp
+
+from .database import MongoDbWrapper
+from .jobs import JobContext, JobScheduler
+from .routers.jobs.models import Job
+
+SUMMARY_REBUILD_BATCH_SIZE = 1000
+
+
+async def _rebuild_job(context: JobContext) -> tp.Dict[str, tp.Any]:
+    total = await MongoDbWrapper().count_passports()
+    await context.report(0, total.value, force=True)
+
+    rebuilt = 0
+    async for uuids in MongoDbWrapper().iterate_units_uuids(batch_size=SUMMARY_REBUILD_BATCH_SIZE):
+        await MongoDbWrapper().rebuild_stage_summaries(uuids)
+        rebuilt += len(uuids)
+        await context.report(rebuilt)
+    return {"rebuilt_units": rebuilt}
+
+
+JobScheduler().register("rebuild_stage_summaries", _rebuild_job, concurrency=1)
+
+
+async def start_summaries_rebuild() -> Job:
+    """schedule recomputation of stage summaries for all units"""
+    return await JobScheduler().submit("rebuild_stage_summaries")
@@ -0,0 +1,122 @@
+import enum
+import hashlib
+import os
+import time
+import typing as tp
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from jose import JWTError, jwk, jwt
+from loguru import logger
+
+from .metrics import record_cache_lookup
+from .singleton import SingletonMeta
+
+JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
+# PEM keys for asymmetric algorithms, other services verify tokens with the public one (see /.well-known/jwks.json)
+JWT_PRIVATE_KEY_PATH = os.environ.get("JWT_PRIVATE_KEY_PATH")
+JWT_PUBLIC_KEY_PATH = os.environ.get("JWT_PUBLIC_KEY_PATH")
+JWT_ISSUER = os.environ.get("JWT_ISSUER", "feecc-analytics")
+
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 4096))
+
+SYMMETRIC_ALGORITHMS = ("HS256", "HS384", "HS512")
+ASYMMETRIC_ALGORITHMS = ("RS256", "RS384", "RS512", "ES256", "ES384", "ES512")
+
+
+class TokenType(str, enum.Enum):
+    access = "access"
+    refresh = "refresh"
+
+
+class InvalidTokenError(Exception):
+    """token is malformed, expired, has wrong signature or type"""
+
+
+def is_asymmetric(algorithm: str = JWT_ALGORITHM) -> bool:
+    return algorithm in ASYMMETRIC_ALGORITHMS
+
+
+def _read_key(path: tp.Optional[str], name: str) -> str:
+    if not path:
+        raise IOError(f"${name} must be set for {JWT_ALGORITHM} tokens")
+    with open(path) as key_file:
+        return key_file.read()
+
+
+class TokenService(metaclass=SingletonMeta):
+    """
+    Issues and verifies JWT access and refresh tokens.
+    Claims of verified tokens are kept in LRU of $TOKEN_CACHE_SIZE entries until the token expires,
+    so repeated requests with the same token skip signature verification
+    """
+
+    def __init__(self) -> None:
+        if JWT_ALGORITHM not in SYMMETRIC_ALGORITHMS + ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported JWT algorithm {JWT_ALGORITHM}")
+
+        if is_asymmetric():
+            self._signing_key = _read_key(JWT_PRIVATE_KEY_PATH, "JWT_PRIVATE_KEY_PATH")
+            self._verifying_key = _read_key(JWT_PUBLIC_KEY_PATH, "JWT_PUBLIC_KEY_PATH")
+            self.key_id: tp.Optional[str] = hashlib.sha256(self._verifying_key.encode()).hexdigest()[:16]
+        else:
+            secret_key = os.environ.get("SECRET_KEY")
+            if not secret_key:
+                raise IOError(f"$SECRET_KEY must be set for {JWT_ALGORITHM} tokens")
+            self._signing_key = self._verifying_key = secret_key
+            self.key_id = None
+
+        self._claims: tp.OrderedDict[str, tp.Dict[str, tp.Any]] = OrderedDict()
+        logger.info(f"Issuing {JWT_ALGORITHM} tokens")
+
+    def encode(self, claims: tp.Dict[str, tp.Any], token_type: TokenType, expires_delta: timedelta) -> str:
+        """sign token of given type with `claims`, standard claims (exp, iat, iss, jti) are added"""
+        issued_at = int(time.time())
+        to_encode = {
+            **claims,
+            "type": token_type.value,
+            "iss": JWT_ISSUER,
+            "iat": issued_at,
+            "exp": issued_at + int(expires_delta.total_seconds()),
+            "jti": uuid.uuid4().hex,
+        }
+        headers = {"kid": self.key_id} if self.key_id else None
+        return str(jwt.encode(to_encode, self._signing_key, algorithm=JWT_ALGORITHM, headers=headers))
+
+    def decode(self, token: str, token_type: TokenType = TokenType.access) -> tp.Dict[str, tp.Any]:
+        """verified token claims, raises InvalidTokenError. Tokens issued without `type` claim are access tokens"""
+        claims: tp.Dict[str, tp.Any]
+        cached = self._claims.get(token)
+        if cached is not None and cached["exp"] > time.time():
+            record_cache_lookup("token_claims", hit=True)
+            self._claims.move_to_end(token)
+            claims = cached
+        else:
+            record_cache_lookup("token_claims", hit=False)
+            try:
+                claims = jwt.decode(token, self._verifying_key, algorithms=[JWT_ALGORITHM])
+            except JWTError as exception_message:
+                self._claims.pop(token, None)
+                raise InvalidTokenError(str(exception_message))
+            if "exp" in claims:
+                self._remember(token, claims)
+
+        if claims.get("type", TokenType.access.value) != token_type.value:
+            raise InvalidTokenError(f"Expected {token_type.value} token")
+        return claims
+
+    def _remember(self, token: str, claims: tp.Dict[str, tp.Any]) -> None:
+        self._claims[token] = claims
+        while len(self._claims) > TOKEN_CACHE_SIZE:
+            self._claims.popitem(last=False)
+
+    def jwks(self) -> tp.Dict[str, tp.List[tp.Dict[str, tp.Any]]]:
+        """public key set for local verification by other services. Empty for symmetric algorithms"""
+        if not is_asymmetric():
+            return {"keys": []}
+        key = jwk.construct(self._verifying_key, JWT_ALGORITHM).to_dict()
+        key.update({"kid": self.key_id, "use": "sig", "alg": JWT_ALGORITHM})
+        return {"keys": [key]}
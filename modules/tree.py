@@ -0,0 +1,86 @@
+import typing as tp
+from collections import Counter, defaultdict
+
+from .database import MongoDbWrapper
+from .jobs import JobContext, JobScheduler
+from .routers.jobs.models import Job
+from .routers.passports.models import UnitTreeNode
+
+TREE_REBUILD_BATCH_SIZE = 5000
+MAX_TREE_DEPTH = 64
+
+
+def build_tree(
+    internal_id: str, edges: tp.List[tp.Dict[str, tp.Any]], units: tp.Dict[str, tp.Dict[str, tp.Any]]
+) -> UnitTreeNode:
+    """
+    assemble hierarchy from units tree edges of the root (`descendant`, `depth`, `parent`).
+    Every node gets rollup of unit statuses in its subtree (itself included)
+    """
+    children: tp.DefaultDict[str, tp.List[str]] = defaultdict(list)
+    depths = {internal_id: 0}
+    for edge in sorted(edges, key=lambda edge: (edge["depth"], edge["descendant"])):
+        if edge["descendant"] == internal_id:
+            continue
+        children[edge["parent"]].append(edge["descendant"])
+        depths[edge["descendant"]] = edge["depth"]
+
+    def make_node(node_id: str) -> UnitTreeNode:
+        unit = units.get(node_id, {})
+        node = UnitTreeNode(
+            internal_id=node_id,
+            uuid=unit.get("uuid"),
+            model=unit.get("model"),
+            serial_number=unit.get("serial_number"),
+            status=unit.get("status"),
+            depth=depths[node_id],
+            components=[make_node(child) for child in children[node_id]],
+        )
+        rollup: tp.Counter[str] = Counter({str(unit.get("status") or "unknown"): 1})
+        for component in node.components:
+            rollup.update(component.statuses_rollup)
+        node.statuses_rollup = dict(rollup)
+        return node
+
+    return make_node(internal_id)
+
+
+def unit_edges(internal_id: str, parents: tp.Dict[str, tp.Optional[str]]) -> tp.Iterator[tp.Dict[str, tp.Any]]:
+    """closure table edges of the unit to itself and to all its assemblies, given direct parents of units"""
+    parent = parents.get(internal_id)
+    yield {"ancestor": internal_id, "descendant": internal_id, "depth": 0, "parent": parent}
+    ancestor, depth, seen = parent, 1, {internal_id}
+    while ancestor is not None and ancestor not in seen and depth <= MAX_TREE_DEPTH:
+        yield {"ancestor": ancestor, "descendant": internal_id, "depth": depth, "parent": parent}
+        seen.add(ancestor)
+        ancestor, depth = parents.get(ancestor), depth + 1
+
+
+async def _rebuild_tree_job(context: JobContext) -> tp.Dict[str, tp.Any]:
+    parents: tp.Dict[str, tp.Optional[str]] = {}
+    async for unit in MongoDbWrapper().iterate_units_composition():
+        parents.setdefault(unit["internal_id"], None)
+        if unit.get("featured_in_int_id"):
+            parents[unit["internal_id"]] = unit["featured_in_int_id"]
+        for component in unit.get("components_internal_ids") or []:
+            parents[component] = unit["internal_id"]
+    await context.report(0, len(parents), force=True)
+
+    batch: tp.List[tp.Dict[str, tp.Any]] = []
+    edges, drop = 0, True
+    for processed, internal_id in enumerate(parents, start=1):
+        batch.extend(unit_edges(internal_id, parents))
+        if len(batch) >= TREE_REBUILD_BATCH_SIZE:
+            await MongoDbWrapper().replace_units_tree(batch, drop=drop)
+            edges, drop, batch = edges + len(batch), False, []
+            await context.report(processed)
+    await MongoDbWrapper().replace_units_tree(batch, drop=drop)
+    return {"units": len(parents), "edges": edges + len(batch)}
+
+
+JobScheduler().register("rebuild_units_tree", _rebuild_tree_job, concurrency=1)
+
+
+async def start_tree_rebuild() -> Job:
+    """schedule rebuild of units tree from units' components"""
+    return await JobScheduler().submit("rebuild_units_tree")
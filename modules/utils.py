@@ -1,7 +1,24 @@
+import asyncio
 import typing as tp
+from functools import lru_cache
 
-import yaml
 
+@lru_cache(maxsize=None)
+def _yaml_loader() -> tp.Any:
+    """yaml is only needed for IPFS documents, so it is imported on first use"""
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader  # type: ignore
+    return SafeLoader
 
-async def load_yaml(data: str) -> tp.Any:
-    return yaml.load(data, Loader=yaml.SafeLoader)
+
+def parse_yaml(data: tp.Union[str, bytes]) -> tp.Any:
+    import yaml
+
+    return yaml.load(data, Loader=_yaml_loader())
+
+
+async def load_yaml(data: tp.Union[str, bytes]) -> tp.Any:
+    """parse YAML in the default executor using C loader (if available), so big documents don't block event loop"""
+    return await asyncio.get_event_loop().run_in_executor(None, parse_yaml, data)
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import typing as tp
+from datetime import datetime
+
+from loguru import logger
+
+from modules.database import MongoDbWrapper
+from modules.ipfs import IPFS_GATEWAY, IpfsClient
+from modules.jobs import JobContext, JobScheduler
+from modules.routers.validation.models import ValidationJob, ValidationJobStatus, ValidationResult, ValidationStatus
+
+from .types import Filter
+
+VALIDATION_CONCURRENCY = int(os.environ.get("VALIDATION_CONCURRENCY", 16))
+VALIDATION_BATCH_SIZE = 100
+
+DocumentFetcher = tp.Callable[[str], tp.Awaitable[tp.Any]]
+
+
+def _collect_strings(document: tp.Any) -> tp.Iterator[str]:
+    """every scalar value of parsed YAML document as string"""
+    if isinstance(document, dict):
+        for key, value in document.items():
+            yield str(key)
+            yield from _collect_strings(value)
+    elif isinstance(document, (list, tuple)):
+        for value in document:
+            yield from _collect_strings(value)
+    elif document is not None:
+        yield str(document)
+
+
+def compare_with_document(uuid: str, video_hashes: tp.List[str], document: tp.Any) -> tp.List[str]:
+    """compare unit biography from database with its IPFS passport. Returns list of found mismatches"""
+    contents = "\n".join(_collect_strings(document))
+    mismatches: tp.List[str] = []
+    if uuid not in contents:
+        mismatches.append(f"unit uuid {uuid} not found in IPFS document")
+    for video_hash in video_hashes:
+        if video_hash not in contents:
+            mismatches.append(f"video hash {video_hash} not found in IPFS document")
+    return mismatches
+
+
+class PassportValidator:
+    """
+    Concurrent pipeline to check units' IPFS passports against database.
+    Units are streamed from unitData into a bounded queue and checked by `concurrency` workers
+    """
+
+    def __init__(
+        self, fetch_document: tp.Optional[DocumentFetcher] = None, concurrency: int = VALIDATION_CONCURRENCY
+    ) -> None:
+        self._fetch_document: DocumentFetcher = fetch_document or IpfsClient().get_document
+        self._concurrency = concurrency
+
+    async def validate_unit(
+        self, job_id: str, internal_id: str, uuid: str, cid: str, video_hashes: tp.List[str]
+    ) -> ValidationResult:
+        result = ValidationResult(
+            job_id=job_id, internal_id=internal_id, uuid=uuid, passport_ipfs_cid=cid, status=ValidationStatus.valid
+        )
+        try:
+            document = await self._fetch_document(IPFS_GATEWAY + cid)
+        except Exception as exception_message:
+            result.status = ValidationStatus.unreachable
+            result.mismatches = [f"Failed to get IPFS document: {exception_message}"]
+            return result
+
+        result.mismatches = compare_with_document(uuid, video_hashes, document)
+        if result.mismatches:
+            result.status = ValidationStatus.invalid
+        return result
+
+    async def _produce(self, queue: "asyncio.Queue[tp.Optional[tp.Dict[str, tp.Any]]]", filter: Filter) -> None:
+        async for unit in MongoDbWrapper().iterate_units_with_ipfs_cid(filter):
+            await queue.put(unit)
+        for _ in range(self._concurrency):
+            await queue.put(None)
+
+    async def _check_unit(self, job: ValidationJob, unit: tp.Dict[str, tp.Any]) -> ValidationResult:
+        try:
+            video_hashes = await MongoDbWrapper().get_stages_video_hashes(uuid=unit["uuid"])
+        except Exception as exception_message:
+            return ValidationResult(
+                job_id=job.job_id,
+                internal_id=unit["internal_id"],
+                uuid=unit["uuid"],
+                passport_ipfs_cid=unit["passport_ipfs_cid"],
+                status=ValidationStatus.unreachable,
+                mismatches=[f"Failed to get unit biography: {exception_message}"],
+            )
+        return await self.validate_unit(
+            job.job_id, unit["internal_id"], unit["uuid"], unit["passport_ipfs_cid"], video_hashes
+        )
+
+    async def _consume(
+        self,
+        job: ValidationJob,
+        queue: "asyncio.Queue[tp.Optional[tp.Dict[str, tp.Any]]]",
+        context: tp.Optional[JobContext] = None,
+    ) -> None:
+        results: tp.List[ValidationResult] = []
+        while True:
+            unit = await queue.get()
+            if unit is None:
+                break
+            result = await self._check_unit(job, unit)
+            results.append(result)
+            job.processed += 1
+            setattr(job, result.status.value, getattr(job, result.status.value) + 1)
+
+            if len(results) >= VALIDATION_BATCH_SIZE:
+                await self._save_progress(job, results, context)
+                results = []
+        await self._save_progress(job, results, context)
+
+    @staticmethod
+    async def _save_progress(
+        job: ValidationJob, results: tp.List[ValidationResult], context: tp.Optional[JobContext] = None
+    ) -> None:
+        await MongoDbWrapper().add_validation_results(results)
+        await MongoDbWrapper().update_validation_job(job)
+        if context is not None:
+            await context.report(job.processed, job.total)
+
+    async def run(self, job: ValidationJob, filter: Filter = {}, context: tp.Optional[JobContext] = None) -> None:
+        """validate all matching units, saving results and progress to database"""
+        job.status = ValidationJobStatus.running
+        job.total = await MongoDbWrapper().count_units_with_ipfs_cid(filter)
+        await MongoDbWrapper().update_validation_job(job)
+        logger.info(f"Started IPFS validation job {job.job_id} for {job.total} units")
+
+        queue: "asyncio.Queue[tp.Optional[tp.Dict[str, tp.Any]]]" = asyncio.Queue(maxsize=self._concurrency * 2)
+        tasks = [asyncio.ensure_future(self._produce(queue, filter))]
+        tasks += [asyncio.ensure_future(self._consume(job, queue, context)) for _ in range(self._concurrency)]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.result()
+            job.status = ValidationJobStatus.finished
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            job.status = ValidationJobStatus.canceled
+            raise
+        except Exception as exception_message:
+            logger.error(f"IPFS validation job {job.job_id} failed: {exception_message}")
+            job.status = ValidationJobStatus.failed
+            job.error = str(exception_message)
+        finally:
+            job.finish_time = datetime.now()
+            await MongoDbWrapper().update_validation_job(job)
+            logger.info(f"IPFS validation job {job.job_id} {job.status}: {job.processed}/{job.total} units processed")
+
+
+async def _validation_job(context: JobContext, filter: Filter = {}) -> tp.Dict[str, tp.Any]:
+    job = await MongoDbWrapper().get_validation_job(context.job.job_id) or ValidationJob(
+        job_id=context.job.job_id, filter=filter
+    )
+    await PassportValidator().run(job, filter=filter, context=context)
+    await context.report(job.processed, job.total, force=True)
+    if job.status == ValidationJobStatus.failed:
+        raise RuntimeError(job.error)
+    return {"valid": job.valid, "invalid": job.invalid, "unreachable": job.unreachable}
+
+
+JobScheduler().register("ipfs_validation", _validation_job, concurrency=1)
+
+
+async def start_validation(filter: Filter = {}) -> ValidationJob:
+    """register validation job and schedule it. Its id is shared with scheduler job, see /api/v1/jobs"""
+    job = ValidationJob(filter=filter)
+    await MongoDbWrapper().add_validation_job(job)
+    await JobScheduler().submit("ipfs_validation", job_id=job.job_id, filter=filter)
+    return job
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import random
 
@@ -23,3 +24,8 @@ def login(fake: bool = False) -> str:
     else:
         token = client.post("/token", data=TEST_USER)
     return token.json().get("access_token", None)
+
+
+def run(coroutine):
+    """run coroutine on the shared event loop (asyncio.run would close it for the following tests)"""
+    return asyncio.get_event_loop().run_until_complete(coroutine)
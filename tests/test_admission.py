@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from modules.dependencies.admission import ENDPOINT_CLASSES, AdmissionController, EndpointLimits
+from modules.exceptions import TooManyRequestsException
+
+from . import run
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setitem(
+        ENDPOINT_CLASSES, "test", EndpointLimits(rate=1.0, burst=1, concurrency=1, queue_size=1, queue_timeout=0.05)
+    )
+    return ENDPOINT_CLASSES["test"]
+
+
+async def _hold(seconds):
+    async with AdmissionController().slot("test"):
+        await asyncio.sleep(seconds)
+
+
+def test_queued_request_is_admitted(limits):
+    run(asyncio.gather(_hold(0.01), _hold(0.01)))
+
+
+def test_queue_timeout(limits):
+    results = run(asyncio.gather(_hold(0.2), _hold(0.01), return_exceptions=True))
+    assert results[0] is None
+    assert isinstance(results[1], TooManyRequestsException)
+    assert results[1].status_code == 429
+    assert results[1].headers["Retry-After"] == "1"
+
+
+def test_queue_overflow(limits):
+    results = run(asyncio.gather(_hold(0.02), _hold(0.01), _hold(0.01), return_exceptions=True))
+    assert sum(isinstance(result, TooManyRequestsException) for result in results) == 1
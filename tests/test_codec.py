@@ -0,0 +1,60 @@
+import datetime
+
+from mongomock_motor import AsyncMongoMockClient
+
+from modules.codec import FORMAT_FIELD, StageCodec, encode_filter, get_field
+
+from . import run
+
+STAGE = {
+    "name": "Assembly",
+    "employee_name": None,
+    "parent_unit_uuid": "unit",
+    "session_start_time": "01-02-2022 10:00:00",
+    "session_end_time": "1-2-2022 11:00:00",
+    "ended_prematurely": False,
+    "video_hashes": None,
+    "additional_info": {"reworked": True},
+    "id": "stage",
+    "is_in_db": True,
+    "creation_time": datetime.datetime(2022, 2, 1, 9, 0),
+    "schema_stage_id": "schema-stage",
+    "completed": True,
+    "number": 0,
+}
+
+
+def make_codec():
+    return StageCodec(AsyncMongoMockClient()["test"]["productionStageNames"])
+
+
+def test_stage_round_trip():
+    codec = make_codec()
+    document = run(codec.encode(STAGE))
+    assert document[FORMAT_FIELD] == 2
+    # name is interned, nulls are not stored
+    assert "n" not in document and "e" not in document and "vh" not in document
+    assert document["st"] == datetime.datetime(2022, 2, 1, 10, 0)
+    # non-canonical session time is kept as is, so it is decoded unchanged
+    assert document["et"] == "1-2-2022 11:00:00"
+
+    # another worker reads interned name from database
+    assert run(StageCodec(codec._names_collection).decode(document)) == STAGE
+
+
+def test_renamed_stage_keeps_its_name():
+    codec = make_codec()
+    run(codec.encode(STAGE))
+    document = run(codec.encode({**STAGE, "name": "Final assembly"}))
+    assert document["n"] == "Final assembly"
+    assert run(codec.decode(document))["name"] == "Final assembly"
+
+
+def test_legacy_documents():
+    codec = make_codec()
+    assert run(codec.decode(dict(STAGE))) == STAGE
+    assert get_field(STAGE, "parent_unit_uuid") == "unit"
+    assert get_field(run(codec.encode(STAGE)), "session_start_time") == "01-02-2022 10:00:00"
+    assert encode_filter({"parent_unit_uuid": "unit"}) == {
+        "$or": [{"u": "unit"}, {"parent_unit_uuid": "unit", FORMAT_FIELD: {"$exists": False}}]
+    }
@@ -0,0 +1,67 @@
+import datetime
+
+from modules.durations import bucket_operations, duration_sample, duration_stats, find_anomalies, percentile
+from modules.routers.schemas.models import ProductionSchemaStage
+
+SCHEMA_STAGE = ProductionSchemaStage(name="Assembly", workplace="bench-1", duration_seconds=600, stage_id="assembly")
+STAGE = {
+    "id": "stage",
+    "schema_stage_id": "assembly",
+    "employee_name": "Ivan",
+    "session_start_time": "01-02-2022 10:00:00",
+    "session_end_time": "01-02-2022 10:15:00",
+    "completed": True,
+}
+
+
+def sample(duration, stage_id="stage"):
+    return {"i": stage_id, "t": datetime.datetime(2022, 2, 1), "d": duration, "e": None, "w": None}
+
+
+def test_duration_sample():
+    assert duration_sample(STAGE, SCHEMA_STAGE) == {
+        "ss": "assembly",
+        "i": "stage",
+        "t": datetime.datetime(2022, 2, 1, 10, 15),
+        "d": 900.0,
+        "e": "Ivan",
+        "w": "bench-1",
+    }
+    assert duration_sample({**STAGE, "completed": False}, SCHEMA_STAGE) is None
+    assert duration_sample({**STAGE, "session_end_time": None}, SCHEMA_STAGE) is None
+    assert duration_sample({**STAGE, "session_end_time": "01-02-2022 09:00:00"}, SCHEMA_STAGE) is None
+    assert duration_sample(STAGE, None)["w"] is None
+    assert duration_sample({**STAGE, "id": None}, SCHEMA_STAGE) is None
+
+
+def test_bucket_operations_skip_recorded_stages():
+    first, second = (duration_sample({**STAGE, "id": stage_id}, SCHEMA_STAGE) for stage_id in ("a", "b"))
+    operations = bucket_operations([first, second])
+    # one upsert per sample, buckets having its stage id already aren't matched
+    assert [operation._filter for operation in operations] == [
+        {"ss": "assembly", "day": datetime.datetime(2022, 2, 1), "n": {"$lt": 500}, "samples.i": {"$ne": stage_id}}
+        for stage_id in ("a", "b")
+    ]
+    assert operations[0]._doc == {
+        "$push": {"samples": {key: value for key, value in first.items() if key != "ss"}},
+        "$inc": {"n": 1},
+    }
+
+
+def test_duration_stats():
+    assert percentile([], 50) is None
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    stats = duration_stats([300.0, 900.0, 600.0, 1200.0], expected=600)
+    assert (stats["count"], stats["mean"], stats["min"], stats["max"]) == (4, 750.0, 300.0, 1200.0)
+    assert stats["p50"] == 750.0
+    assert stats["slower_than_expected"] == 2
+    assert duration_stats([])["p99"] is None
+
+
+def test_find_anomalies():
+    samples = [sample(500.0, "a"), sample(1300.0, "b"), sample(2000.0, "c")]
+    anomalies = find_anomalies(samples, expected=600, factor=2)
+    assert [(anomaly["i"], baseline) for anomaly, baseline in anomalies] == [("c", 600), ("b", 600)]
+    # without expected duration, stages are compared to median
+    assert [anomaly["i"] for anomaly, _ in find_anomalies(samples, expected=None, factor=1.5)] == ["c"]
+    assert find_anomalies([], expected=None, factor=2) == []
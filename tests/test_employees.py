@@ -60,3 +60,20 @@ def test_get_nonexistent_employee():
     r = client.get("/api/v1/employees/nonexistent", headers={"Authorization": f"Bearer {token}"})
     assert r.json().get("employee", None) is None, r.json()
     assert r.json().get("status_code", None) == 404, r.json()
+
+
+def test_get_employees_with_cursor():
+    token = login()
+    first = client.get("/api/v1/employees/?items=1", headers={"Authorization": f"Bearer {token}"}).json()
+    assert first.get("next_cursor", None) is not None, first
+    second = client.get(
+        f"/api/v1/employees/?items=1&cursor={first['next_cursor']}", headers={"Authorization": f"Bearer {token}"}
+    ).json()
+    assert second["status_code"] == 200, second
+    assert second["data"] != first["data"], second
+
+
+def test_get_employees_with_malformed_cursor():
+    token = login()
+    r = client.get("/api/v1/employees/?cursor=malformed", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 400, r.json()
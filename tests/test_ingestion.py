@@ -0,0 +1,30 @@
+import asyncio
+
+import modules.ingestion as ingestion
+from modules.ingestion import StageIngestionBuffer
+
+from . import run
+
+
+class FakeDatabase:
+    batches = []
+
+    async def add_stages(self, stages):
+        self.batches.append([stage["id"] for stage in stages])
+        stored = {stage_id for batch in self.batches[:-1] for stage_id in batch}
+        return ["duplicate" if stage["id"] in stored else None for stage in stages]
+
+
+def test_concurrent_submissions_are_batched(monkeypatch):
+    FakeDatabase.batches = []
+    monkeypatch.setattr(ingestion, "MongoDbWrapper", FakeDatabase)
+    monkeypatch.setattr(ingestion, "STAGES_BATCH_SIZE", 4)
+    buffer = StageIngestionBuffer()
+
+    results = run(asyncio.gather(*(buffer.submit([{"id": f"{i}-a"}, {"id": f"{i}-b"}]) for i in range(3))))
+    assert results == [[None, None]] * 3
+    # first batch is flushed by size, the rest by time
+    assert [len(batch) for batch in FakeDatabase.batches] == [4, 2]
+
+    assert run(buffer.submit([{"id": "0-a"}])) == ["duplicate"]
+    run(buffer.close())
@@ -0,0 +1,52 @@
+import fakeredis
+import httpx
+import pytest
+
+from modules.cacher import RedisCacher
+from modules.ipfs import IpfsClient, extract_cid_path
+from modules.singleton import SingletonMeta
+
+from . import run
+
+CID = "QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG"
+
+
+def gateway(request: httpx.Request) -> httpx.Response:
+    """trusted gateway serves real document, any other host serves whatever it wants"""
+    if request.url.host == "gateway.pinata.cloud":
+        return httpx.Response(200, text="unit: real\nstages: [a]\n")
+    return httpx.Response(200, text="unit: forged\n")
+
+
+@pytest.fixture
+def ipfs():
+    SingletonMeta._instances.pop(RedisCacher, None)
+    SingletonMeta._instances.pop(IpfsClient, None)
+    RedisCacher(client=fakeredis.FakeRedis())
+    yield IpfsClient(client=httpx.AsyncClient(transport=httpx.MockTransport(gateway)))
+    SingletonMeta._instances.pop(RedisCacher, None)
+    SingletonMeta._instances.pop(IpfsClient, None)
+
+
+def test_only_trusted_gateways_are_cached():
+    assert extract_cid_path(f"https://gateway.pinata.cloud/ipfs/{CID}/passport.yaml") == f"{CID}/passport.yaml"
+    assert extract_cid_path(f"https://evil.example/ipfs/{CID}") is None
+    assert extract_cid_path(f"http://gateway.pinata.cloud/ipfs/{CID}") is None
+
+
+def test_forged_document_does_not_poison_cache(ipfs):
+    async def fetch():
+        forged = await ipfs.get_document(f"https://evil.example/ipfs/{CID}")
+        real = await ipfs.get_document(f"https://gateway.pinata.cloud/ipfs/{CID}")
+        return forged, real
+
+    forged, real = run(fetch())
+    assert forged == {"unit": "forged"}
+    assert real == {"unit": "real", "stages": ["a"]}
+
+
+def test_cached_document_is_copied(ipfs):
+    link = f"https://gateway.pinata.cloud/ipfs/{CID}"
+    document = run(ipfs.get_document(link))
+    document["stages"].append("mutated")
+    assert run(ipfs.get_document(link)) == {"unit": "real", "stages": ["a"]}
@@ -0,0 +1,27 @@
+from . import client, login
+
+
+def test_get_jobs_unauthorized() -> None:
+    r = client.get("/api/v1/jobs/")
+    assert r.status_code != 200, "unattended access"
+
+
+def test_get_jobs() -> None:
+    token = login()
+    r = client.get("/api/v1/jobs/", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+
+
+def test_validation_is_a_job() -> None:
+    token = login()
+    r = client.post("/api/v1/validate/?status=finalized", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+    job_id = r.json()["job"]["job_id"]
+    r = client.get(f"/api/v1/jobs/{job_id}", headers={"Authorization": f"Bearer {token}"})
+    assert r.json()["job"]["job_type"] == "ipfs_validation", r.json()
+
+
+def test_cancel_unknown_job() -> None:
+    token = login()
+    r = client.delete("/api/v1/jobs/unknown", headers={"Authorization": f"Bearer {token}"})
+    assert r.json()["status_code"] == 404, r.json()
@@ -1,4 +1,4 @@
-from . import client, login
+from . import TEST_USER, client, login
 
 
 def test_availability():
@@ -9,3 +9,36 @@ def test_login():
     """Get jwt token"""
     token = login()
     assert token is not None, f"Failed to login"
+
+
+def test_metrics():
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert "analytics_request_latency_seconds" in r.text
+
+
+def test_slow_requests():
+    token = login()
+    client.get("/api/v1/passports/", headers={"Authorization": f"Bearer {token}", "X-Profile": "1"})
+    r = client.get("/api/v1/service/slow-requests", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+    assert "threshold_ms" in r.json(), r.json()
+
+
+def test_readiness():
+    r = client.get("/api/v1/status/ready")
+    assert r.status_code in (200, 503), r.json()
+    assert set(r.json()["checks"]) == {"warmup", "mongodb", "redis"}, r.json()
+
+
+def test_refresh_token():
+    tokens = client.post("/token", data=TEST_USER).json()
+    assert tokens.get("refresh_token"), tokens
+    r = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert r.status_code == 200, r.json()
+    access_token = r.json()["access_token"]
+    assert client.get("/api/v1/users/me", headers={"Authorization": f"Bearer {access_token}"}).status_code == 200
+    # refresh token can't be used for authorization and access token can't be used for refresh
+    r = client.get("/api/v1/users/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert r.status_code == 401, r.json()
+    assert client.post("/token/refresh", json={"refresh_token": access_token}).status_code == 401
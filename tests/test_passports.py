@@ -15,6 +15,13 @@ def test_get_passports_authorized() -> None:
     assert r.status_code == 200, r.json()
 
 
+def test_get_passports_with_count_limit() -> None:
+    token = login()
+    r = client.get("/api/v1/passports/?count_limit=1&items=1", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+    assert r.json()["count"] <= 1, r.json()
+
+
 def test_create_passport() -> None:
     passport = {
         "uuid": "123456",
@@ -133,3 +140,16 @@ def test_get_nonexistent_passport() -> None:
     r = client.get("/api/v1/passports/nonexistent", headers={"Authorization": f"Bearer {token}"})
     assert r.json().get("passport", None) is None, r.json()
     assert r.json().get("status_code", None) == 404, r.json()
+
+
+def test_get_archived_passports() -> None:
+    token = login()
+    r = client.get("/api/v1/passports/?archived=true", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+    assert all(passport["status"] == "finalized" for passport in r.json()["data"]), r.json()
+
+
+def test_get_nonexistent_passport_tree() -> None:
+    token = login()
+    r = client.get("/api/v1/passports/nonexistent/tree", headers={"Authorization": f"Bearer {token}"})
+    assert r.json()["status_code"] == 404, r.json()
@@ -0,0 +1,48 @@
+from modules.patches import diff_documents
+
+
+def test_diff_unchanged_document() -> None:
+    document = {"name": "stage", "video_hashes": ["a", "b"], "additional_info": {"key": "value"}}
+    assert diff_documents(document, dict(document)) == {}
+
+
+def test_diff_sets_only_changed_fields() -> None:
+    stored = {"name": "stage", "employee_name": "old", "video_hashes": ["a"]}
+    new = {"name": "stage", "employee_name": "new", "video_hashes": ["a"]}
+    assert diff_documents(stored, new) == {"$set": {"employee_name": "new"}}
+
+
+def test_diff_excluded_and_unmanaged_fields() -> None:
+    stored = {"id": "1", "name": "stage", "_version": 3}
+    new = {"id": "2", "name": "stage"}
+    assert diff_documents(stored, new, exclude={"id"}) == {}
+
+
+def test_diff_nested_dict() -> None:
+    stored = {"additional_info": {"a": 1, "b": 2}}
+    new = {"additional_info": {"a": 1, "c": 3}}
+    assert diff_documents(stored, new) == {"$unset": {"additional_info.b": ""}, "$set": {"additional_info.c": 3}}
+
+
+def test_diff_unsafe_keys_replace_dict() -> None:
+    stored = {"additional_info": {"a.b": 1}}
+    new = {"additional_info": {"a.b": 2}}
+    assert diff_documents(stored, new) == {"$set": {"additional_info": {"a.b": 2}}}
+
+
+def test_diff_appended_list() -> None:
+    stored = {"video_hashes": ["a", "b"]}
+    new = {"video_hashes": ["a", "b", "c"]}
+    assert diff_documents(stored, new) == {"$push": {"video_hashes": {"$each": ["c"]}}}
+
+
+def test_diff_list_items() -> None:
+    stored = {"rows": [{"name": "a", "value": "1"}, {"name": "b", "value": "2"}]}
+    new = {"rows": [{"name": "a", "value": "1"}, {"name": "b", "value": "3"}]}
+    assert diff_documents(stored, new) == {"$set": {"rows.1.value": "3"}}
+
+
+def test_diff_shrunk_list() -> None:
+    stored = {"video_hashes": ["a", "b"]}
+    new = {"video_hashes": ["b"]}
+    assert diff_documents(stored, new) == {"$set": {"video_hashes": ["b"]}}
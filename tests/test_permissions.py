@@ -0,0 +1,15 @@
+from modules.permissions import Permission, compile_projection, compile_rule_set
+
+
+def test_rule_set_compilation():
+    assert compile_rule_set(("read",)) == Permission.read
+    permissions = compile_rule_set(("read", "write", "approve", "unknown"))
+    assert Permission.write in permissions and Permission.approve in permissions
+    assert Permission.write not in compile_rule_set(("read", "approve"))
+
+
+def test_projection():
+    assert compile_projection("stages", compile_rule_set(("read",))) == {"additional_info": 0, "video_hashes": 0}
+    assert compile_projection("stages", compile_rule_set(("read", "write"))) is None
+    assert compile_projection("users", compile_rule_set(("read", "write"))) == {"hashed_password": 0}
+    assert compile_projection("passports", Permission.none) is None
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from modules.singleflight import single_flight
+
+from . import run
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.queries = 0
+
+    @single_flight
+    async def get_document(self, filter, limit=None):
+        self.queries += 1
+        await asyncio.sleep(0.01)
+        if filter.get("fail"):
+            raise ValueError("query failed")
+        return {"filter": filter, "items": [1, 2, 3]}
+
+
+def test_identical_calls_are_coalesced():
+    database = FakeDatabase()
+    filters = [
+        {"status": "production", "type": {"$in": ["a", "b"]}},
+        {"type": {"$in": ["b", "a"]}, "status": "production"},
+    ]
+    results = run(asyncio.gather(*(database.get_document(filters[i % 2]) for i in range(10))))
+    assert database.queries == 1
+    results[0]["items"].append(4)
+    assert all(result["items"] == [1, 2, 3] for result in results[1:])
+
+
+def test_different_calls_are_not_coalesced():
+    database = FakeDatabase()
+    run(asyncio.gather(database.get_document({"status": "production"}), database.get_document({"status": "built"})))
+    run(database.get_document({"status": "production"}, limit=10))
+    assert database.queries == 3
+
+
+def test_errors_are_shared():
+    database = FakeDatabase()
+    results = run(asyncio.gather(*(database.get_document({"fail": True}) for _ in range(3)), return_exceptions=True))
+    assert database.queries == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(ValueError):
+        run(database.get_document({"fail": True}))
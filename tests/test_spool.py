@@ -0,0 +1,107 @@
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError
+
+from modules.singleton import SingletonMeta
+from modules.spool import WriteSpool, spool_write, spooled
+
+from . import run
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.available = False
+        self.units = {}
+        self.writes = []
+
+    @spooled(key=lambda arguments: arguments["uuid"])
+    async def add_unit(self, uuid: str, serial_number: str) -> None:
+        if not self.available:
+            raise AutoReconnect("connection closed")
+        if uuid in self.units:
+            raise DuplicateKeyError("duplicate key")
+        self.units[uuid] = serial_number
+        self.writes.append(("add", uuid))
+
+    @spooled(key=lambda arguments: arguments["uuid"], replace=True)
+    async def update_serial_number(self, uuid: str, serial_number: str) -> None:
+        if not self.available:
+            raise AutoReconnect("connection closed")
+        if uuid not in self.units:
+            raise ValueError(f"Unit {uuid} not found")
+        self.units[uuid] = serial_number
+        self.writes.append(("update", uuid))
+
+
+@pytest.fixture
+def spool(tmp_path):
+    SingletonMeta._instances.pop(WriteSpool, None)
+    spool = WriteSpool(str(tmp_path / "spool.sqlite"))
+    yield spool
+    spool.close()
+    SingletonMeta._instances.pop(WriteSpool, None)
+
+
+def test_writes_are_spooled_and_replayed_in_order(spool):
+    database = FakeDatabase()
+    run(database.add_unit("a", "1"))
+    run(database.add_unit("a", "1"))  # retried request
+    run(database.update_serial_number("a", "2"))
+    run(database.update_serial_number("a", "3"))
+    run(database.update_serial_number("b", "1"))
+    assert spool.depth() == 3
+    assert spool.lag() >= 0
+
+    # still down: nothing is lost
+    assert run(spool.replay(database)) == 0
+    assert spool.depth() == 3
+
+    database.available = True
+    # writes made while spool isn't empty are spooled too, so they don't overtake spooled ones
+    run(database.add_unit("c", "1"))
+    assert database.units == {}
+
+    assert run(spool.replay(database)) == 3
+    assert database.units == {"a": "3", "c": "1"}
+    assert database.writes == [("add", "a"), ("update", "a"), ("add", "c")]
+    assert spool.is_empty()
+    assert [write["operation"] for write in spool.failed()] == ["update_serial_number"]
+
+    run(database.add_unit("d", "1"))
+    assert database.units["d"] == "1"
+
+
+def test_replay_skips_already_applied_writes(spool):
+    database = FakeDatabase()
+    run(database.add_unit("a", "1"))
+    # write has reached database before the link dropped
+    database.units["a"] = "1"
+    database.available = True
+    assert run(spool.replay(database)) == 1
+    assert spool.is_empty()
+    assert database.writes == []
+
+
+def test_spool_survives_restart(spool, tmp_path):
+    database = FakeDatabase()
+    run(database.add_unit("a", "1"))
+    spool.close()
+    SingletonMeta._instances.pop(WriteSpool, None)
+
+    restarted = WriteSpool(str(tmp_path / "spool.sqlite"))
+    database.available = True
+    assert run(restarted.replay(database)) == 1
+    assert database.units == {"a": "1"}
+    restarted.close()
+
+
+def test_batch_writes_are_spooled_as_single_operations(spool):
+    database = FakeDatabase()
+    # e.g. every stage of a batch is spooled as `add_stage`, so it's deduplicated with single pushes
+    for uuid in ("a", "b"):
+        spool_write("add_unit", uuid, {"uuid": uuid, "serial_number": "1"})
+    run(database.add_unit("a", "1"))
+    assert spool.depth() == 2
+
+    database.available = True
+    assert run(spool.replay(database)) == 2
+    assert database.writes == [("add", "a"), ("add", "b")]
@@ -2,6 +2,8 @@ from datetime import datetime
 
 import pytest
 
+from modules.routers.stages.models import StageSummary
+
 from . import client, login
 
 
@@ -102,3 +104,39 @@ def test_check_nonexistent_stage():
     r = client.get("/api/v1/stages/nonexistent", headers={"Authorization": f"Bearer {token}"})
     assert r.json().get("stage", None) is None, f"expected None got {r.json()}"
     assert r.json().get("status_code", None) == 404, r.json()
+
+
+def test_stage_summary_counters():
+    stage = {"completed": True, "additional_info": {"reworked": True}}
+    assert StageSummary.counters(stage) == {"total": 1, "completed": 1, "reworked": 1, "canceled": 0}
+    assert StageSummary.counters({"completed": None, "additional_info": None})["completed"] == 0
+    assert StageSummary.parse_session_time("01-02-2022 10:00:00") == datetime(2022, 2, 1, 10)
+    assert StageSummary.parse_session_time("garbage") is None
+
+
+def test_create_stages_batch():
+    stages = [
+        {
+            "name": "batch testing",
+            "employee_name": None,
+            "parent_unit_uuid": "batch-unit",
+            "session_start_time": str(datetime.now()),
+            "session_end_time": str(datetime.now()),
+            "ended_prematurely": False,
+            "video_hashes": None,
+            "additional_info": {},
+            "id": f"batch-stage-{i}",
+            "is_in_db": False,
+            "creation_time": str(datetime.now()),
+        }
+        for i in range(3)
+    ]
+    token = login()
+    headers = {"Authorization": f"Bearer {token}"}
+    r = client.post("/api/v1/stages/batch", headers=headers, json={"stages": stages})
+    assert r.status_code == 200, r.json()
+    # retried push is acknowledged without writing stages twice
+    r = client.post("/api/v1/stages/batch", headers=headers, json={"stages": stages[:1]})
+    assert r.json()["data"] == [{"id": "batch-stage-0", "created": False, "duplicate": True, "detail": None}], r.json()
+    for stage in stages:
+        client.delete(f"/api/v1/stages/{stage['id']}", headers=headers)
@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.importtime import measure
+
+STARTUP_TIME_LIMIT_MS = float(os.environ.get("STARTUP_TIME_LIMIT_MS", 3000))
+DEFERRED_DEPENDENCIES = ("passlib", "httpx", "yaml")
+
+
+def test_deferred_dependencies_not_imported():
+    """rarely used heavy dependencies must not be imported with the app"""
+    code = f"import sys, json, app; print(json.dumps([m for m in {DEFERRED_DEPENDENCIES} if m in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert json.loads(output.splitlines()[-1]) == [], output
+
+
+@pytest.mark.slow
+def test_startup_time():
+    """app import time in a fresh interpreter, set $STARTUP_TIME_LIMIT_MS to adjust the limit"""
+    records = measure("app")
+    total_ms = sum(record.cumulative_us for record in records if record.depth == 0) / 1000
+    assert total_ms < STARTUP_TIME_LIMIT_MS, f"app is imported in {total_ms:.0f}ms"
@@ -0,0 +1,38 @@
+from . import client, login
+
+
+def test_get_protocols_unauthorized() -> None:
+    r = client.get("/api/v1/tcd/protocols")
+    assert r.status_code != 200, "unattended access"
+
+
+def test_get_protocols_page() -> None:
+    token = login()
+    r = client.get("/api/v1/tcd/protocols?items=5", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+    assert len(r.json()["data"]) <= 5, r.json()
+    assert all(protocol["rows"] is None for protocol in r.json()["data"]), "rows must be omitted by default"
+
+
+def test_get_protocols_by_unit_name() -> None:
+    token = login()
+    r = client.get("/api/v1/tcd/protocols?name=unknown-unit", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+    assert r.json()["data"] == [], r.json()
+
+
+def test_approve_unknown_protocols() -> None:
+    token = login()
+    r = client.post(
+        "/api/v1/tcd/protocols/approve",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"internal_ids": ["0000000000000", "0000000000001"]},
+    )
+    assert r.status_code == 200, r.json()
+    assert [result["approved"] for result in r.json()["data"]] == [False, False], r.json()
+
+
+def test_reload_protocol_prototypes() -> None:
+    token = login()
+    r = client.post("/api/v1/tcd/protocols/prototypes/reload", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
@@ -0,0 +1,68 @@
+import httpx
+
+from modules.routers.validation.models import ValidationStatus
+from modules.utils import load_yaml
+from modules.validation import PassportValidator
+
+from . import client, login, run
+
+PASSPORT_CID = "QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG"
+PASSPORT = """
+Уникальный номер паспорта изделия: 0123456789abcdef0123456789abcdef
+Этапы производства:
+  - Этап: testing
+    Видеозаписи процесса сборки:
+      - https://gateway.pinata.cloud/ipfs/hash1
+"""
+
+
+def ipfs_stand_in(request: httpx.Request) -> httpx.Response:
+    """Local IPFS gateway stand-in"""
+    if request.url.path.endswith(PASSPORT_CID):
+        return httpx.Response(200, text=PASSPORT)
+    return httpx.Response(404)
+
+
+def validate(cid: str, video_hashes):
+    async def validate_unit():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(ipfs_stand_in)) as http:
+
+            async def fetch(link: str):
+                response = await http.get(link)
+                response.raise_for_status()
+                return await load_yaml(response.content)
+
+            validator = PassportValidator(fetch_document=fetch)
+            return await validator.validate_unit("job", "123456", "0123456789abcdef0123456789abcdef", cid, video_hashes)
+
+    return run(validate_unit())
+
+
+def test_validate_matching_passport():
+    result = validate(PASSPORT_CID, ["hash1"])
+    assert result.status == ValidationStatus.valid, result
+
+
+def test_validate_missing_video_hash():
+    result = validate(PASSPORT_CID, ["hash1", "hash2"])
+    assert result.status == ValidationStatus.invalid, result
+    assert len(result.mismatches) == 1, result
+
+
+def test_validate_unreachable_passport():
+    result = validate("QmUnknownUnknownUnknownUnknownUnknownUnknownUnk", [])
+    assert result.status == ValidationStatus.unreachable, result
+
+
+def test_start_validation_unauthorized():
+    r = client.post("/api/v1/validate/")
+    assert r.status_code != 200, "unattended access"
+
+
+def test_start_validation():
+    token = login()
+    r = client.post("/api/v1/validate/?status=finalized", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.json()
+    job_id = r.json()["job"]["job_id"]
+    r = client.get(f"/api/v1/validate/{job_id}", headers={"Authorization": f"Bearer {token}"})
+    assert r.json()["job"] is not None, r.json()